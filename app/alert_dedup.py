@@ -0,0 +1,59 @@
+import logging
+from app import redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== DEDUPLICACIÓN DE ALERTAS ====================
+# Cada deal se "reclama" con SET NX EX: solo la primera ejecución que lo ve alerta.
+# Todo el lote va en un pipeline (una ida a Redis por cada 500 claves) y como cada SET NX es atómico,
+# dos escaneos que se solapan no pueden alertar el mismo deal.
+DEDUP_CONFIG = {
+    "keepa": {"prefix": "alerted:keepa", "ttl": 86400},              # 24 horas
+    "promodescuentos": {"prefix": "alerted:promodesc", "ttl": 43200},  # 12 horas
+    # Bajadas de precio: la clave incluye el precio, así una nueva bajada vuelve a alertar
+    "officedepot": {"prefix": "alerted:officedepot", "ttl": 21600},
+    "walmart": {"prefix": "alerted:walmart", "ttl": 21600},
+    "mercadolibre": {"prefix": "alerted:mercadolibre", "ttl": 21600},
+}
+
+redis_client = redis_pool.get_redis()
+
+
+def price_drop_key(deal):
+    """Identidad de una alerta de bajada: producto + precio nuevo"""
+    return f"{deal.get('sku') or deal['url']}:{deal['price']}"
+
+
+def _keys(deals, source, key_fn):
+    prefix = DEDUP_CONFIG[source]["prefix"]
+    return [f"{prefix}:{key_fn(deal)}" for deal in deals]
+
+
+def claim_unseen(deals, source, key_fn, ttl=None):
+    """
+    Reclama en un solo pipeline las claves de todos los deals y retorna
+    únicamente los que no se habían alertado (en el orden original).
+    Un deal repetido dentro del mismo lote solo se retorna una vez.
+    """
+    deals = list(deals)
+    if not deals:
+        return []
+    ttl = ttl or DEDUP_CONFIG[source]["ttl"]
+
+    claimed = redis_pool.pipelined(
+        _keys(deals, source, key_fn),
+        lambda pipe, key: pipe.set(key, "1", nx=True, ex=ttl),
+    )
+
+    fresh = [deal for deal, ok in zip(deals, claimed) if ok]
+    if len(fresh) < len(deals):
+        logger.debug(f"✋ {source}: {len(deals) - len(fresh)} deals ya alertados recientemente")
+    return fresh
+
+
+def release_claims(deals, source, key_fn):
+    """Libera claves reclamadas cuya alerta no se pudo encolar (para reintentar en la próxima ejecución)"""
+    deals = list(deals)
+    if deals:
+        redis_client.delete(*_keys(deals, source, key_fn))
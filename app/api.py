@@ -1,6 +1,24 @@
-from fastapi import FastAPI, Depends
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import FastAPI, Depends, Response, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.models import SessionLocal, Product
+from app.telegram_outbox import get_outbox_stats
+from app import catalog, keepa_budget, metrics, price_history, product_counts, redis_pool
+
+# La respuesta de /stats se sirve desde Redis durante unos segundos (el dashboard la sondea sin parar)
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 10))
+
+# /products/{id}/history: rango por defecto y límites de puntos devueltos
+HISTORY_CONFIG = {
+    "default_days": int(os.getenv('HISTORY_DEFAULT_DAYS', 90)),
+    "default_points": 300,
+    "min_points": 10,
+    "max_points": 5000,
+}
 
 app = FastAPI()
 
@@ -15,19 +33,140 @@ from app.monitoring import Monitor
 
 monitor = Monitor()
 
+def build_stats(db, estimate=False):
+    counter = product_counts.estimated_count if estimate else product_counts.exact_count
+    return {
+        "status": "running",
+        "products_count": counter(db),
+        "products_count_estimated": estimate,
+        "products_by_source": product_counts.source_counts(db),
+        "redis": "ok" if redis_pool.ping() else "unreachable",
+        "services": monitor.get_services_status(),
+        "telegram_outbox": get_outbox_stats(),
+        "keepa_budget": keepa_budget.get_budget_stats(),
+    }
+
 @app.get("/stats")
-def read_stats(db: Session = Depends(get_db)):
+def read_stats(estimate: bool = False, db: Session = Depends(get_db)):
+    """
+    Estado general. `estimate=true` usa la estadística de Postgres en lugar del conteo exacto
+    (cacheado). La respuesta completa se cachea STATS_CACHE_TTL segundos.
+    """
+    cache_key = f"stats:response:{int(estimate)}"
+    redis_client = redis_pool.get_redis()
     try:
-        product_count = db.query(Product).count()
-        services_status = monitor.get_services_status()
-        
-        return {
-            "status": "running",
-            "products_count": product_count,
-            "services": services_status
-        }
+        cached = redis_client.get(cache_key)
+        if cached:
+            return Response(content=cached, media_type="application/json")
+
+        body = json.dumps(build_stats(db, estimate))
+        redis_client.set(cache_key, body, ex=STATS_CACHE_TTL)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         return {
             "status": "error",
             "error": str(e)
         }
+
+@app.get("/metrics")
+def read_metrics():
+    """Métricas Prometheus (agregadas de todos los procesos si PROMETHEUS_MULTIPROC_DIR está definido)"""
+    payload, content_type = metrics.render()
+    return Response(content=payload, media_type=content_type)
+
+def _fields(fields):
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+def _paginated(page_fn, db, stream, **filters):
+    """
+    Página JSON {items, next_cursor} o, con stream=true, todas las filas como NDJSON
+    recorriendo las páginas en el servidor.
+    """
+    try:
+        if stream:
+            # Validar filtros/cursor antes de empezar a transmitir (después ya no hay status 400)
+            page_fn(db, **dict(filters, limit=1))
+            return StreamingResponse(catalog.stream_all(page_fn, **filters), media_type="application/x-ndjson")
+        items, next_cursor = page_fn(db, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/products")
+def list_products(
+    source: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    checked_after: Optional[datetime] = None,
+    checked_before: Optional[datetime] = None,
+    order: str = "id",
+    after: Optional[str] = None,
+    limit: int = catalog.CATALOG_CONFIG["default_limit"],
+    fields: Optional[str] = None,
+    stream: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Productos rastreados con paginación keyset (`after` = `next_cursor` de la página anterior)"""
+    return _paginated(
+        catalog.products_page, db, stream,
+        source=source, min_price=min_price, max_price=max_price,
+        checked_after=checked_after, checked_before=checked_before,
+        order=order, after=after, limit=limit, fields=_fields(fields),
+    )
+
+def _naive_utc(value):
+    """Las columnas guardan UTC sin zona: un valor con zona (`...Z`, `-06:00`) se pasa a UTC naive"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+@app.get("/products/{product_id}/history")
+def read_history(
+    product_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    points: int = HISTORY_CONFIG["default_points"],
+    mode: str = "minmax",
+    db: Session = Depends(get_db),
+):
+    """
+    Historial de precios reducido a `points` puntos (min/max/último por intervalo o LTTB).
+    Por defecto los últimos HISTORY_DEFAULT_DAYS días.
+    """
+    if db.get(Product, product_id) is None:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    start, end = _naive_utc(start), _naive_utc(end)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=HISTORY_CONFIG["default_days"])
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start debe ser anterior a end")
+    points = max(HISTORY_CONFIG["min_points"], min(points, HISTORY_CONFIG["max_points"]))
+    try:
+        series = price_history.price_history(db, product_id, start, end, points=points, mode=mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "product_id": product_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "mode": mode,
+        **series,
+    }
+
+@app.get("/drops")
+def list_drops(
+    source: Optional[str] = None,
+    since: Optional[datetime] = None,
+    min_discount: Optional[float] = None,
+    after: Optional[str] = None,
+    limit: int = catalog.CATALOG_CONFIG["default_limit"],
+    fields: Optional[str] = None,
+    stream: bool = False,
+    db: Session = Depends(get_db),
+):
+    """Bajadas de precio recientes (más nuevas primero) con paginación keyset"""
+    return _paginated(
+        catalog.drops_page, db, stream,
+        source=source, since=since, min_discount=min_discount,
+        after=after, limit=limit, fields=_fields(fields),
+    )
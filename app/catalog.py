@@ -0,0 +1,181 @@
+import json
+import base64
+import logging
+from sqlalchemy import select, tuple_
+from app.models import SessionLocal, Product, PriceDrop
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONSULTAS DE CATÁLOGO (API) ====================
+# Paginación keyset: cada página continúa con WHERE (orden) > (último valor visto)
+# sobre un índice, así la página 10.000 cuesta lo mismo que la primera (sin OFFSET).
+# El cursor es opaco para el cliente (JSON en base64).
+CATALOG_CONFIG = {
+    "default_limit": 100,
+    "max_limit": 1000,
+    "stream_page_size": 1000,   # Filas por consulta al transmitir resultados completos
+}
+
+PRODUCT_COLUMNS = {
+    "id": Product.id,
+    "name": Product.name,
+    "url": Product.url,
+    "sku": Product.sku,
+    "source": Product.source,
+    "current_price": Product.current_price,
+    "original_price": Product.original_price,
+    "last_checked": Product.last_checked,
+}
+
+# Orden -> columnas de la clave keyset (la última siempre es id para desempatar)
+PRODUCT_ORDERINGS = {
+    "id": ("id",),
+    "last_checked": ("last_checked", "id"),
+}
+
+DROP_COLUMNS = {
+    "id": PriceDrop.id,
+    "product_id": PriceDrop.product_id,
+    "source": PriceDrop.source,
+    "name": Product.name,
+    "url": Product.url,
+    "old_price": PriceDrop.old_price,
+    "new_price": PriceDrop.new_price,
+    "discount_pct": PriceDrop.discount_pct,
+    "detected_at": PriceDrop.detected_at,
+}
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, columns):
+    """Decodifica el cursor y convierte cada valor al tipo de su columna. ValueError si es inválido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Cursor inválido")
+    return [_cursor_value(column, value) for column, value in zip(columns, values)]
+
+
+def _cursor_value(column, value):
+    """Valor del cursor con el tipo de la columna (fechas en ISO). Un dict, lista o texto donde va un número es ValueError."""
+    python_type = column.type.python_type
+    if hasattr(python_type, "fromisoformat"):
+        if not isinstance(value, str):
+            raise ValueError("Cursor inválido")
+        try:
+            return python_type.fromisoformat(value)
+        except ValueError:
+            raise ValueError("Cursor inválido")
+    # bool es subclase de int, pero true/false nunca es un id
+    if isinstance(value, bool):
+        raise ValueError("Cursor inválido")
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, python_type):
+        raise ValueError("Cursor inválido")
+    return value
+
+
+def _projection(fields, available):
+    """Columnas pedidas (todas si no se indica). ValueError ante un campo desconocido."""
+    fields = list(fields or available)
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return fields
+
+
+def _clamp(limit):
+    return max(1, min(limit or CATALOG_CONFIG["default_limit"], CATALOG_CONFIG["max_limit"]))
+
+
+def _page(session, stmt, fields, columns, key_names, key_columns, after, limit, descending=False):
+    # Las columnas de la clave se seleccionan aunque no se pidan, para construir el cursor
+    select_names = fields + [k for k in key_names if k not in fields]
+    stmt = stmt.with_only_columns(*[columns[n].label(n) for n in select_names])
+
+    if after:
+        values = decode_cursor(after, key_columns)
+        key, bound = tuple_(*key_columns), tuple_(*values)
+        stmt = stmt.where(key < bound if descending else key > bound)
+
+    order = [c.desc() if descending else c.asc() for c in key_columns]
+    rows = session.execute(stmt.order_by(*order).limit(limit)).all()
+
+    items = [{f: row._mapping[f] for f in fields} for row in rows]
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor([last[k] for k in key_names])
+    return items, next_cursor
+
+
+def products_page(session, source=None, min_price=None, max_price=None, checked_after=None,
+                  checked_before=None, order="id", after=None, limit=None, fields=None):
+    """Una página de productos filtrada. Retorna (items, next_cursor)."""
+    if order not in PRODUCT_ORDERINGS:
+        raise ValueError(f"Orden inválido: {order}")
+    fields = _projection(fields, PRODUCT_COLUMNS)
+    key_names = PRODUCT_ORDERINGS[order]
+
+    stmt = select(Product.id)
+    if source:
+        stmt = stmt.where(Product.source == source)
+    if min_price is not None:
+        stmt = stmt.where(Product.current_price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Product.current_price <= max_price)
+    if checked_after is not None:
+        stmt = stmt.where(Product.last_checked >= checked_after)
+    if checked_before is not None:
+        stmt = stmt.where(Product.last_checked < checked_before)
+    if order == "last_checked":
+        stmt = stmt.where(Product.last_checked.isnot(None))  # NULL rompe la comparación de tuplas
+
+    return _page(session, stmt, fields, PRODUCT_COLUMNS, key_names,
+                 [PRODUCT_COLUMNS[k] for k in key_names], after, _clamp(limit))
+
+
+def drops_page(session, source=None, since=None, min_discount=None, after=None, limit=None, fields=None):
+    """Bajadas de precio más recientes primero. Retorna (items, next_cursor)."""
+    fields = _projection(fields, DROP_COLUMNS)
+    key_names = ("detected_at", "id")
+
+    stmt = select(PriceDrop.id)
+    if any(DROP_COLUMNS[f].class_ is Product for f in fields):
+        stmt = stmt.join(Product, Product.id == PriceDrop.product_id)
+    if source:
+        stmt = stmt.where(PriceDrop.source == source)
+    if since is not None:
+        stmt = stmt.where(PriceDrop.detected_at >= since)
+    if min_discount is not None:
+        stmt = stmt.where(PriceDrop.discount_pct >= min_discount)
+
+    return _page(session, stmt, fields, DROP_COLUMNS, key_names,
+                 [DROP_COLUMNS[k] for k in key_names], after, _clamp(limit), descending=True)
+
+
+def stream_all(page_fn, **filters):
+    """
+    Recorre todas las páginas (memoria constante) y genera una línea NDJSON por fila.
+    Usa su propia sesión: el generador vive más que la petición que lo creó.
+    """
+    filters["limit"] = CATALOG_CONFIG["stream_page_size"]
+    session = SessionLocal()
+    try:
+        after = filters.pop("after", None)
+        while True:
+            items, after = page_fn(session, after=after, **filters)
+            for item in items:
+                yield json.dumps(item, default=str, ensure_ascii=False) + "\n"
+            if not after:
+                break
+    finally:
+        session.close()
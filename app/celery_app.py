@@ -19,7 +19,7 @@ app = Celery('price_tracker', broker=broker_url, include=['app.tasks'])
 app.conf.beat_schedule = {
     'scan-keepa-every-10-mins': {
         'task': 'app.tasks.scan_amazon_deals',
-        'schedule': 600,  # 10 minutos
+        'schedule': int(os.getenv('KEEPA_SCAN_INTERVAL', 600)),  # 10 minutos (las páginas por ejecución las decide keepa_budget)
     },
     'scan-promodescuentos-every-10-mins': {
         'task': 'app.tasks.scan_promodescuentos_deals',
@@ -42,6 +42,10 @@ app.conf.beat_schedule = {
         'schedule': 86400,  # 24 horas (diario)
         'args': (["laptop gamer", "rtx 4060", "silla ergonómica", "monitor 144hz","smart tv", "iPhone","logitech", "macbook", "Samsung Galaxy"], 'relevancia', True)
     },
+    'maintain-observation-partitions-daily': {
+        'task': 'app.tasks.maintain_observation_partitions',
+        'schedule': 86400,  # 24 horas (crea las particiones de los próximos meses)
+    },
 }
 
 app.conf.timezone = 'UTC' # type: ignore
@@ -0,0 +1,101 @@
+import logging
+from lxml import etree, html as lxml_html
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== MOTOR DE EXTRACCIÓN ====================
+# Las specs son declarativas y se compilan a XPath de lxml una sola vez (al importar
+# el módulo del scraper). Formato:
+#
+#   {
+#       "items": ["//xpath/de/tiles", "//xpath/alternativo"],   # el primero con resultados gana
+#       "fields": {
+#           "title": {"xpath": [".//h2"]},                       # texto completo, .strip() (get_text().strip())
+#           "price": {"xpath": [".//div"], "text": " "},         # trozos de texto sin espacios, unidos con " "
+#                                                                # (get_text(" ", strip=True))
+#           "link":  {"xpath": [".//a"], "attr": "href"},        # atributo
+#       }
+#   }
+#
+# Cada campo puede tener varias alternativas de XPath; se usa la primera que encuentre algo.
+# Un campo sin coincidencias vale None.
+
+
+def has_class(name):
+    """Predicado XPath equivalente a class_='name' de BeautifulSoup (una de las clases)"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _as_list(value):
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def compile_spec(spec):
+    """Compila una spec declarativa a objetos etree.XPath reutilizables"""
+    compiled = {
+        "items": [etree.XPath(x) for x in _as_list(spec.get("items", []))],
+        "fields": {},
+    }
+    for name, field in spec.get("fields", {}).items():
+        compiled["fields"][name] = {
+            "xpath": [etree.XPath(x) for x in _as_list(field["xpath"])],
+            "attr": field.get("attr"),
+            "text": field.get("text"),
+        }
+    return compiled
+
+
+_parsers = {}
+
+
+def parse_html(content, encoding='utf-8'):
+    """
+    Árbol lxml del documento. Con bytes se usa `encoding` (el de la respuesta HTTP);
+    sin él lxml asumiría latin-1 cuando la página no declara <meta charset>.
+    """
+    if isinstance(content, str):
+        return lxml_html.fromstring(content)
+    parser = _parsers.get(encoding)
+    if parser is None:
+        parser = _parsers[encoding] = lxml_html.HTMLParser(encoding=encoding)
+    return lxml_html.fromstring(content, parser=parser)
+
+
+def _field_value(node, field):
+    for xpath in field["xpath"]:
+        matches = xpath(node)
+        if not matches:
+            continue
+        element = matches[0]
+        if field["attr"]:
+            value = element.get(field["attr"])
+            if value is None:
+                continue
+            return value
+        if field["text"] is None:
+            return "".join(element.itertext()).strip()
+        parts = (t.strip() for t in element.itertext())
+        return field["text"].join(p for p in parts if p)
+    return None
+
+
+def extract_fields(node, compiled):
+    """Extrae todos los campos de la spec sobre un nodo (documento o tile)"""
+    return {name: _field_value(node, field) for name, field in compiled["fields"].items()}
+
+
+def find_items(tree, compiled):
+    for xpath in compiled["items"]:
+        items = xpath(tree)
+        if items:
+            return items
+    return []
+
+
+def extract_items(tree, compiled):
+    """
+    Localiza los tiles con el primer XPath de items que tenga resultados
+    y extrae todos los campos de cada uno sobre el mismo árbol.
+    """
+    return [extract_fields(item, compiled) for item in find_items(tree, compiled)]
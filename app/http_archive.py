@@ -0,0 +1,263 @@
+import os
+import re
+import json
+import time
+import gzip
+import asyncio
+import hashlib
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import httpx
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== ARCHIVO HTTP (GRABAR / REPRODUCIR) ====================
+# Con HTTP_ARCHIVE_MODE=record los transportes de http_client guardan cada par
+# petición/respuesta; con HTTP_ARCHIVE_MODE=replay las respuestas salen del archivo
+# sin tocar la red (benchmarks y pruebas de regresión reproducibles).
+#
+# Estructura en HTTP_ARCHIVE_DIR:
+#   bodies/ab/<sha256>.gz    cuerpos tal como llegaron (aún con su Content-Encoding),
+#                            comprimidos y direccionados por contenido: un cuerpo idéntico
+#                            se guarda una sola vez aunque lo devuelvan muchas URLs.
+#                            Los tokens de respuestas OAuth se graban como "***" (redact_body).
+#   index/cd/<clave>.jsonl   una línea por respuesta grabada para esa petición (método +
+#                            URL + cuerpo). Se agrega con O_APPEND, seguro entre procesos.
+#
+# En replay la n-ésima petición igual recibe la n-ésima respuesta grabada (y la última
+# cuando se agotan), así se reproducen cambios de precio entre ejecuciones.
+ARCHIVE_CONFIG = {
+    "mode": os.getenv('HTTP_ARCHIVE_MODE', 'off').lower(),   # off | record | replay
+    "dir": os.getenv('HTTP_ARCHIVE_DIR', 'http_archive'),
+    "replay_latency": os.getenv('HTTP_ARCHIVE_REPLAY_LATENCY', '0') == '1',  # Dormir lo que tardó la respuesta original
+}
+
+# Credenciales que no deben quedar en el archivo (ni afectar la clave de la petición)
+SECRET_PARAMS = {"key", "access_token", "token", "api_key"}
+_BOT_TOKEN = re.compile(r"/bot[^/]+")
+# Campos de respuestas JSON que no se graban (p.ej. el /oauth/token de Mercado Libre)
+SECRET_FIELDS = {"access_token", "refresh_token", "id_token", "client_secret"}
+
+# Cabeceras de transporte que no aplican al reproducir
+_HOP_HEADERS = {"transfer-encoding", "connection", "keep-alive"}
+
+_replay_lock = threading.Lock()
+_replay_counts = {}
+
+
+def enabled():
+    return ARCHIVE_CONFIG["mode"] in ("record", "replay")
+
+
+def redact_url(url):
+    """URL sin credenciales: parámetros secretos y el token del bot de Telegram"""
+    parts = urlsplit(str(url))
+    query = urlencode([(k, "***" if k in SECRET_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)])
+    return urlunsplit((parts.scheme, parts.netloc, _BOT_TOKEN.sub("/bot***", parts.path), query, ""))
+
+
+def _redact_fields(value):
+    if isinstance(value, dict):
+        return {k: "***" if k in SECRET_FIELDS else _redact_fields(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact_fields(v) for v in value]
+    return value
+
+
+def redact_body(headers, body):
+    """
+    Cuerpo sin credenciales: en una respuesta JSON con campos de SECRET_FIELDS se reemplazan por "***".
+    Retorna (headers, body); si hubo que redactar, el cuerpo va descomprimido y sin Content-Encoding.
+    """
+    parsed = httpx.Headers(headers)
+    if "json" not in parsed.get("content-type", ""):
+        return headers, body
+    try:
+        # Se decodifica como lo haría httpx (gzip/br/deflate según Content-Encoding)
+        data = json.loads(httpx.Response(200, headers=parsed, stream=httpx.ByteStream(body)).read())
+    except (httpx.DecodingError, ValueError):
+        return headers, body
+    redacted = _redact_fields(data)
+    if redacted == data:
+        return headers, body
+    headers = [(k, v) for k, v in headers if k.lower() not in ("content-encoding", "content-length")]
+    return headers, json.dumps(redacted, ensure_ascii=False).encode("utf-8")
+
+
+def request_key(method, url, body=b""):
+    digest = hashlib.sha256(f"{method.upper()} {redact_url(url)}\n".encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def _index_path(key):
+    return os.path.join(ARCHIVE_CONFIG["dir"], "index", key[:2], f"{key}.jsonl")
+
+
+def _body_path(digest):
+    return os.path.join(ARCHIVE_CONFIG["dir"], "bodies", digest[:2], f"{digest}.gz")
+
+
+def store(request, status_code, headers, body, elapsed):
+    """Guarda una respuesta (cuerpo crudo, salvo que lleve credenciales) para la petición"""
+    headers, body = redact_body(headers, body)
+    digest = hashlib.sha256(body).hexdigest()
+    path = _body_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)  # Atómico: otro proceso nunca lee un cuerpo a medias
+
+    entry = {
+        "method": request.method,
+        "url": redact_url(request.url),
+        "status": status_code,
+        "headers": [[k, v] for k, v in headers if k.lower() not in _HOP_HEADERS],
+        "body": digest,
+        "elapsed": round(elapsed, 4),
+        "recorded_at": int(time.time()),
+    }
+    index = _index_path(request_key(request.method, request.url, request.content))
+    os.makedirs(os.path.dirname(index), exist_ok=True)
+    with open(index, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def lookup(request):
+    """Siguiente respuesta grabada para la petición: (entry, cuerpo) o None si no existe"""
+    key = request_key(request.method, request.url, request.content)
+    try:
+        with open(_index_path(key), encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    if not entries:
+        return None
+
+    with _replay_lock:
+        n = _replay_counts.get(key, 0)
+        _replay_counts[key] = n + 1
+    entry = entries[min(n, len(entries) - 1)]
+    with gzip.open(_body_path(entry["body"]), "rb") as f:
+        return entry, f.read()
+
+
+def reset_replay():
+    """Vuelve a servir las respuestas desde la primera (p.ej. entre iteraciones de un benchmark)"""
+    with _replay_lock:
+        _replay_counts.clear()
+
+
+def _replayed_response(request, entry, body):
+    # Se conserva Content-Encoding: httpx descomprime igual que con la respuesta real
+    return httpx.Response(
+        entry["status"],
+        headers=entry["headers"],
+        stream=httpx.ByteStream(body),
+        request=request,
+    )
+
+
+def _missing(request):
+    return httpx.ConnectError(f"Petición no grabada en el archivo HTTP: {request.method} {redact_url(request.url)}", request=request)
+
+
+class RecordTransport(httpx.BaseTransport):
+    """Envía la petición con el transporte real y graba la respuesta completa"""
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        request.read()
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        try:
+            body = b"".join(response.stream)
+        finally:
+            response.close()
+        elapsed = time.perf_counter() - start
+        try:
+            store(request, response.status_code, response.headers.multi_items(), body, elapsed)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo grabar {redact_url(request.url)}: {e}")
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=httpx.ByteStream(body),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRecordTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        start = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        try:
+            body = b"".join([chunk async for chunk in response.stream])
+        finally:
+            await response.aclose()
+        elapsed = time.perf_counter() - start
+        try:
+            store(request, response.status_code, response.headers.multi_items(), body, elapsed)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo grabar {redact_url(request.url)}: {e}")
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=httpx.ByteStream(body),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.BaseTransport):
+    """Sirve respuestas del archivo sin red. Una petición no grabada es un ConnectError."""
+
+    def handle_request(self, request):
+        request.read()
+        found = lookup(request)
+        if found is None:
+            raise _missing(request)
+        entry, body = found
+        if ARCHIVE_CONFIG["replay_latency"]:
+            time.sleep(entry["elapsed"])
+        return _replayed_response(request, entry, body)
+
+
+class AsyncReplayTransport(httpx.AsyncBaseTransport):
+    async def handle_async_request(self, request):
+        await request.aread()
+        found = lookup(request)
+        if found is None:
+            raise _missing(request)
+        entry, body = found
+        if ARCHIVE_CONFIG["replay_latency"]:
+            await asyncio.sleep(entry["elapsed"])
+        return _replayed_response(request, entry, body)
+
+
+def wrap_transport(transport, is_async=False):
+    """Transporte para http_client según HTTP_ARCHIVE_MODE (el real si está apagado)"""
+    mode = ARCHIVE_CONFIG["mode"]
+    if mode == "record":
+        return AsyncRecordTransport(transport) if is_async else RecordTransport(transport)
+    if mode == "replay":
+        return AsyncReplayTransport() if is_async else ReplayTransport()
+    return transport
@@ -0,0 +1,368 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+
+import httpx
+from app import http_archive, metrics, rate_limit, redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURACIÓN DEL CLIENTE HTTP ====================
+# Un pool de conexiones por host y por proceso worker. Los valores de "default"
+# aplican a cualquier host que no tenga configuración propia en "hosts".
+HTTP_CONFIG = {
+    "default": {
+        "timeout": float(os.getenv('HTTP_TIMEOUT', 20)),
+        "http2": True,
+        "max_connections": int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', 8)),
+        "max_keepalive_connections": int(os.getenv('HTTP_MAX_KEEPALIVE_PER_HOST', 8)),
+        "keepalive_expiry": float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 60)),
+    },
+    "hosts": {
+        "www.officedepot.com.mx": {"timeout": 20},
+        "www.walmart.com.mx": {"timeout": 30},
+        "www.promodescuentos.com": {"timeout": 10},
+        "api.keepa.com": {"timeout": 15},
+        "api.telegram.org": {"timeout": 5},
+        "api.mercadolibre.com": {"timeout": 10},
+        "listado.mercadolibre.com.mx": {"timeout": 15},
+        "articulo.mercadolibre.com.mx": {"timeout": 15},
+    },
+}
+
+# Validadores HTTP (ETag/Last-Modified) y huella del contenido por URL.
+# El TTL obliga a reprocesar una página "sin cambios" de vez en cuando (p.ej. si falló la DB).
+PAGE_CACHE_CONFIG = {
+    "ttl": int(os.getenv('PAGE_FINGERPRINT_TTL', 3600)),
+}
+
+# Redirige hosts a otro servidor conservando la cabecera Host original (pruebas de carga
+# contra benchmarks/fake_retailer.py). "*" aplica a todos los hosts:
+#   HTTP_HOST_OVERRIDES="*=http://127.0.0.1:8800"
+#   HTTP_HOST_OVERRIDES="articulo.mercadolibre.com.mx=http://127.0.0.1:8800,api.keepa.com=http://127.0.0.1:8801"
+def _parse_overrides(value):
+    overrides = {}
+    for entry in filter(None, (e.strip() for e in value.split(","))):
+        host, _, target = entry.partition("=")
+        overrides[host.strip()] = httpx.URL(target.strip())
+    return overrides
+
+
+HOST_OVERRIDES = _parse_overrides(os.getenv('HTTP_HOST_OVERRIDES', ''))
+
+redis_client = redis_pool.get_redis()
+
+_clients = {}
+_stats = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def _host_config(host):
+    config = dict(HTTP_CONFIG["default"])
+    config.update(HTTP_CONFIG["hosts"].get(host, {}))
+    return config
+
+
+def _reset_after_fork():
+    """
+    Celery usa prefork: los sockets heredados del proceso padre no se pueden
+    compartir, así que cada proceso hijo arranca con sus propios pools.
+    """
+    global _pid
+    if os.getpid() != _pid:
+        _clients.clear()
+        _stats.clear()
+        _pid = os.getpid()
+
+
+class _HostOverrideTransport(httpx.BaseTransport):
+    def __init__(self, transport, target):
+        self._transport = transport
+        self._target = target
+
+    def handle_request(self, request):
+        # La cabecera Host ya se fijó con la URL original al construir la petición
+        request.url = request.url.copy_with(scheme=self._target.scheme, host=self._target.host, port=self._target.port)
+        return self._transport.handle_request(request)
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncHostOverrideTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport, target):
+        self._transport = transport
+        self._target = target
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme=self._target.scheme, host=self._target.host, port=self._target.port)
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _client_kwargs(host, is_async=False):
+    config = _host_config(host)
+    # El transporte se crea explícitamente para poder envolverlo (HTTP_ARCHIVE_MODE, app/http_archive.py)
+    transport_cls = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+    transport = transport_cls(
+        http2=config["http2"],
+        limits=httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive_connections"],
+            keepalive_expiry=config["keepalive_expiry"],
+        ),
+    )
+    target = HOST_OVERRIDES.get(host) or HOST_OVERRIDES.get("*")
+    if target is not None:
+        override_cls = _AsyncHostOverrideTransport if is_async else _HostOverrideTransport
+        transport = override_cls(transport, target)
+    return dict(
+        timeout=config["timeout"],
+        follow_redirects=True,
+        transport=http_archive.wrap_transport(transport, is_async),
+    )
+
+
+def get_client(url):
+    """Devuelve el httpx.Client compartido para el host de la URL (lo crea si no existe)"""
+    host = urlparse(url).netloc
+    with _lock:
+        _reset_after_fork()
+        client = _clients.get(host)
+        if client is None:
+            client = _clients[host] = httpx.Client(**_client_kwargs(host))
+            logger.debug(f"🔌 Nuevo pool HTTP para {host}")
+        return client
+
+
+def _host_stats(host):
+    stats = _stats.get(host)
+    if stats is None:
+        stats = _stats[host] = {
+            "requests": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+            "tls_handshakes": 0,
+            "tls_time": 0.0,
+            "bytes": 0,
+        }
+    return stats
+
+
+def _make_tracer(host, is_async=False):
+    """
+    Crea el callback de la extensión `trace` de httpcore para una petición.
+    Si la petición abre un socket nuevo se cuenta como conexión nueva; si no,
+    se reutilizó una conexión del pool.
+    """
+    state = {"connected": False, "tls_start": None, "start": time.perf_counter()}
+
+    def on_event(event_name):
+        if event_name == "connection.connect_tcp.complete":
+            state["connected"] = True
+        elif event_name == "connection.start_tls.started":
+            state["tls_start"] = time.perf_counter()
+        elif event_name == "connection.start_tls.complete" and state["tls_start"] is not None:
+            elapsed = time.perf_counter() - state["tls_start"]
+            with _lock:
+                stats = _host_stats(host)
+                stats["tls_handshakes"] += 1
+                stats["tls_time"] += elapsed
+
+    if is_async:
+        async def trace(event_name, info):
+            on_event(event_name)
+    else:
+        def trace(event_name, info):
+            on_event(event_name)
+
+    def finish(response=None):
+        with _lock:
+            stats = _host_stats(host)
+            stats["requests"] += 1
+            if response is not None:
+                stats["bytes"] += response.num_bytes_downloaded
+            if state["connected"]:
+                stats["new_connections"] += 1
+            else:
+                stats["reused_connections"] += 1
+        if response is not None:
+            metrics.FETCH_SECONDS.labels(metrics.source_for_host(host)).observe(time.perf_counter() - state["start"])
+
+    return trace, finish
+
+
+def request(method, url, **kwargs):
+    """Envía una petición usando el pool compartido del host (tras el límite por dominio)"""
+    client = get_client(url)
+    rate_limit.acquire(url)
+    trace, finish = _make_tracer(urlparse(url).netloc)
+    extensions = dict(kwargs.pop("extensions", None) or {})
+    extensions["trace"] = trace
+    response = None
+    try:
+        response = client.request(method, url, extensions=extensions, **kwargs)
+        return response
+    finally:
+        finish(response)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+class AsyncHostPool:
+    """
+    Pools async (httpx.AsyncClient) por host con la misma configuración y contadores
+    que los clientes síncronos. Un AsyncClient queda ligado a su event loop, así que
+    el pool vive lo que dura el loop:
+
+        async with http_client.AsyncHostPool() as pool:
+            response = await pool.get(url)
+    """
+
+    def __init__(self):
+        self._clients = {}
+
+    def client(self, url):
+        host = urlparse(url).netloc
+        client = self._clients.get(host)
+        if client is None:
+            client = self._clients[host] = httpx.AsyncClient(**_client_kwargs(host, is_async=True))
+        return client
+
+    async def request(self, method, url, **kwargs):
+        client = self.client(url)
+        await rate_limit.acquire_async(url)
+        trace, finish = _make_tracer(urlparse(url).netloc, is_async=True)
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = trace
+        response = None
+        try:
+            response = await client.request(method, url, extensions=extensions, **kwargs)
+            return response
+        finally:
+            finish(response)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+def _page_key(url):
+    return f"httpcache:{hashlib.sha1(url.encode('utf-8')).hexdigest()}"
+
+
+def conditional_get(url, headers=None, **kwargs):
+    """
+    GET condicional: envía If-None-Match / If-Modified-Since con los validadores guardados.
+    Si el servidor responde 304 el llamador puede saltarse el parseo completo.
+    """
+    headers = dict(headers or {})
+    try:
+        cached = redis_client.hgetall(_page_key(url))
+    except Exception as e:
+        logger.debug(f"Cache de páginas no disponible: {e}")
+        cached = {}
+
+    if cached.get(b"etag"):
+        headers["If-None-Match"] = cached[b"etag"].decode('utf-8')
+    if cached.get(b"last_modified"):
+        headers["If-Modified-Since"] = cached[b"last_modified"].decode('utf-8')
+
+    response = get(url, headers=headers, **kwargs)
+    if response.status_code == 304:
+        logger.info(f"♻️ 304 Not Modified: {url}")
+    return response
+
+
+def fingerprint(payload):
+    """Huella del contenido relevante de una página (str o bytes)"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()
+
+
+def payload_unchanged(url, digest):
+    """True si la huella coincide con la del último procesamiento exitoso de la URL"""
+    try:
+        stored = redis_client.hget(_page_key(url), "digest")
+    except Exception as e:
+        logger.debug(f"Cache de páginas no disponible: {e}")
+        return False
+    unchanged = stored is not None and stored.decode('utf-8') == digest
+    if unchanged:
+        logger.info(f"♻️ Contenido sin cambios, se omite el parseo: {url}")
+    return unchanged
+
+
+def remember_page(url, response, digest):
+    """Guarda validadores y huella tras procesar la página correctamente"""
+    mapping = {"digest": digest}
+    if response.headers.get("etag"):
+        mapping["etag"] = response.headers["etag"]
+    if response.headers.get("last-modified"):
+        mapping["last_modified"] = response.headers["last-modified"]
+    try:
+        key = _page_key(url)
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, PAGE_CACHE_CONFIG["ttl"])
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"No se pudo guardar la huella de {url}: {e}")
+
+
+def get_stats():
+    """Contadores por host de este proceso: reutilización de conexiones, tiempo en TLS y bytes"""
+    with _lock:
+        _reset_after_fork()
+        return {host: dict(stats, tls_time=round(stats["tls_time"], 4)) for host, stats in _stats.items()}
+
+
+def total_bytes():
+    """Bytes descargados (en el cable, antes de descomprimir) por este proceso, todos los hosts"""
+    with _lock:
+        _reset_after_fork()
+        return sum(stats["bytes"] for stats in _stats.values())
+
+
+def log_stats():
+    for host, stats in get_stats().items():
+        reuse_pct = (stats["reused_connections"] / stats["requests"] * 100) if stats["requests"] else 0
+        logger.info(
+            f"🔌 {host}: {stats['requests']} peticiones, {reuse_pct:.0f}% conexiones reutilizadas, "
+            f"{stats['tls_handshakes']} handshakes TLS ({stats['tls_time']:.2f}s)"
+        )
+
+
+def close_all():
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
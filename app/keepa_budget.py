@@ -0,0 +1,116 @@
+import os
+import time
+import logging
+from app import redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== PRESUPUESTO DE TOKENS DE KEEPA ====================
+# Keepa cobra en tokens (5 por página de /deal) y los repone cada minuto a `refillRate`;
+# lo acumulado por encima de una hora de reposición se pierde. Cada respuesta trae
+# tokensLeft / refillRate / refillIn: se guardan en Redis y antes de cada escaneo se
+# proyecta el saldo para pedir tantas páginas como alcance, sin provocar 429.
+KEEPA_BUDGET_CONFIG = {
+    "deal_cost": int(os.getenv('KEEPA_DEAL_COST', 5)),           # Tokens por página de /deal
+    "deals_per_page": 150,
+    "max_pages": int(os.getenv('KEEPA_MAX_DEAL_PAGES', 10)),
+    "reserve": int(os.getenv('KEEPA_TOKEN_RESERVE', 0)),         # Tokens que no se gastan en /deal (p.ej. /product manual)
+    "scan_interval": int(os.getenv('KEEPA_SCAN_INTERVAL', 600)),  # Periodo de scan_amazon_deals (celery_app)
+}
+
+BUDGET_KEY = "keepa:budget"
+
+redis_client = redis_pool.get_redis()
+
+
+def record_tokens(data):
+    """Guarda el saldo informado por una respuesta de Keepa (también las de error/429)"""
+    if "tokensLeft" not in data:
+        return
+    mapping = {
+        "tokens_left": data["tokensLeft"],
+        "observed_at": time.time(),
+    }
+    if data.get("refillRate") is not None:
+        mapping["refill_rate"] = data["refillRate"]
+    if data.get("refillIn") is not None:
+        mapping["refill_in"] = data["refillIn"] / 1000
+    try:
+        redis_client.hset(BUDGET_KEY, mapping=mapping)
+    except Exception as e:
+        logger.debug(f"No se pudo guardar el saldo de Keepa: {e}")
+
+
+def record_run(pages, tokens):
+    try:
+        redis_client.hset(BUDGET_KEY, mapping={"last_run_pages": pages, "last_run_tokens": tokens})
+    except Exception as e:
+        logger.debug(f"No se pudo guardar la ejecución de Keepa: {e}")
+
+
+def _load():
+    state = redis_client.hgetall(BUDGET_KEY)
+    return {k.decode("utf-8"): float(v) for k, v in state.items()}
+
+
+def projected_tokens(state, at=None):
+    """Saldo esperado en el instante `at`: reposiciones por minuto desde la última lectura, con tope de una hora"""
+    if "tokens_left" not in state:
+        return None
+    rate = state.get("refill_rate", 0)
+    elapsed = (at or time.time()) - state["observed_at"]
+    refill_in = state.get("refill_in", 60)
+    refills = 0 if elapsed < refill_in else 1 + int((elapsed - refill_in) // 60)
+    tokens = state["tokens_left"] + refills * rate
+    return min(tokens, rate * 60) if rate else tokens
+
+
+def _pages_for(tokens):
+    cfg = KEEPA_BUDGET_CONFIG
+    if tokens is None:
+        return 1  # Sin historial: una página para conocer el saldo
+    return max(0, min(cfg["max_pages"], int((tokens - cfg["reserve"]) // cfg["deal_cost"])))
+
+
+def plan_pages():
+    """
+    Páginas de /deal para esta ejecución: todo el saldo proyectado (menos la reserva).
+    Lo que se gaste ahora se repone antes del siguiente escaneo; lo que no, se pierde al
+    llegar al tope. Si Redis falla se pide una sola página, como antes.
+    """
+    try:
+        state = _load()
+    except Exception as e:
+        logger.debug(f"Saldo de Keepa no disponible: {e}")
+        return 1
+    tokens = projected_tokens(state)
+    pages = _pages_for(tokens)
+    logger.info(f"💰 Keepa: ~{tokens if tokens is not None else '?'} tokens proyectados -> {pages} páginas")
+    return pages
+
+
+def get_budget_stats():
+    """Saldo observado y proyectado para /stats"""
+    try:
+        state = _load()
+    except Exception as e:
+        return {"error": str(e)}
+    if not state:
+        return {"observed": False}
+    now = time.time()
+    current = projected_tokens(state, now)
+    at_next_run = projected_tokens(state, now + KEEPA_BUDGET_CONFIG["scan_interval"])
+    rate = state.get("refill_rate")
+    return {
+        "observed": True,
+        "tokens_left": int(state["tokens_left"]),
+        "observed_at": int(state["observed_at"]),
+        "refill_rate_per_min": rate,
+        "max_tokens": int(rate * 60) if rate else None,
+        "projected_tokens": int(current),
+        "projected_pages": _pages_for(current),
+        "projected_tokens_next_run": int(at_next_run),
+        "last_run_pages": int(state.get("last_run_pages", 0)),
+        "last_run_tokens": int(state.get("last_run_tokens", 0)),
+    }
@@ -1,8 +1,12 @@
-import requests
+import httpx
 import os
 import json
+import time
 import logging
 from dotenv import load_dotenv
+from app import http_client, keepa_budget, monitoring, product_counts
+from app.models import SessionLocal
+from app.reconcile import reconcile_products
 
 #Cargar variables de entorno
 load_dotenv()
@@ -74,38 +78,95 @@ def get_keepa_deals():
     
     final_payload = clean_payload(dirty_json)
 
-    logger.info(f"📡 Enviando payload limpio a Keepa API...")
+    # Cuántas páginas alcanza el saldo proyectado (app/keepa_budget.py)
+    pages = keepa_budget.plan_pages()
+    if pages == 0:
+        logger.info("⏸️ Keepa: saldo de tokens insuficiente, se omite este escaneo")
+        return None
 
-    # 2. ENVÍO (Usamos json=... para que requests lo maneje igual que en el debug)
-    response = requests.post(url_post, json=final_payload, timeout=15)
-    logger.debug(f"HTTP Status: {response.status_code}")
-    
-    if response.status_code == 200:
-        data = response.json()
-        
-        if "error" in data:
-            logger.error(f"❌ Error API Keepa: {data['error']}")
-            # Aunque la API responda 200 con error, podríamos considerarlo fallo lógico o return []
-            # Si retorna error explícito, quizás mejor devolver [] pero loguear error.
-            # O raise Exception(data['error'])
-            raise Exception(f"API Keepa Error: {data['error']}")
-
-        tokens_left = data.get("tokensLeft", 0)
-        logger.info(f"💰 Tokens restantes en Keepa: {tokens_left}")
-        
-        if "deals" in data and "dr" in data["deals"]:
-            deals_count = len(data["deals"]["dr"])
-            logger.info(f"📊 Se encontraron {deals_count} deals en Keepa")
-            parsed = parse_deals(data["deals"]["dr"])
-            logger.info(f"✅ Se parsearon {len(parsed)} deals que pasaron filtros")
-            return parsed
-        else:
-            logger.info("✅ Éxito (200 OK) - No hay ofertas >60% ahora mismo.")
-            return []
-    else:
-        logger.error(f"❌ Error HTTP {response.status_code}")
-        logger.debug(f"Response: {response.text[:500]}")
-        raise requests.exceptions.HTTPError(f"HTTP {response.status_code}")
+    all_parsed = []
+    pages_done = tokens_used = 0
+    for page in range(pages):
+        final_payload["page"] = page
+        logger.info(f"📡 Enviando payload limpio a Keepa API (página {page + 1}/{pages})...")
+
+        # 2. ENVÍO (json=... igual que en el debug, sobre el pool compartido)
+        response = http_client.post(url_post, json=final_payload)
+        logger.debug(f"HTTP Status: {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        keepa_budget.record_tokens(data)
+
+        if response.status_code == 429:
+            logger.warning(f"⚠️ Keepa sin tokens (quedan {data.get('tokensLeft', '?')}), se detiene en la página {page + 1}")
+            break
+        if response.status_code != 200 or "error" in data:
+            if pages_done:
+                logger.error(f"❌ Error en la página {page + 1} de Keepa, se conservan las anteriores")
+                break
+            if response.status_code == 200:
+                logger.error(f"❌ Error API Keepa: {data['error']}")
+                raise Exception(f"API Keepa Error: {data['error']}")
+            logger.error(f"❌ Error HTTP {response.status_code}")
+            logger.debug(f"Response: {response.text[:500]}")
+            raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+
+        pages_done += 1
+        tokens_used += data.get("tokensConsumed", keepa_budget.KEEPA_BUDGET_CONFIG["deal_cost"])
+        logger.info(f"💰 Tokens restantes en Keepa: {data.get('tokensLeft', 0)}")
+
+        deals_raw = data.get("deals", {}).get("dr", [])
+        if deals_raw:
+            logger.info(f"📊 Se encontraron {len(deals_raw)} deals en Keepa")
+            store_price_history(deals_raw)
+            start = time.perf_counter()
+            all_parsed.extend(parse_deals(deals_raw))
+            monitoring.record_parse('keepa', len(deals_raw), time.perf_counter() - start)
+        if len(deals_raw) < keepa_budget.KEEPA_BUDGET_CONFIG["deals_per_page"]:
+            break  # Última página
+
+    keepa_budget.record_run(pages_done, tokens_used)
+    if not all_parsed:
+        logger.info("✅ Éxito (200 OK) - No hay ofertas >60% ahora mismo.")
+        return []
+    logger.info(f"✅ Se parsearon {len(all_parsed)} deals que pasaron filtros ({pages_done} páginas, {tokens_used} tokens)")
+    return sorted(all_parsed, key=lambda x: x['discount_pct'], reverse=True)
+
+def store_price_history(deals_list):
+    """
+    Guarda el precio actual de cada deal de Keepa (producto + observación en price_observations).
+    Un fallo aquí nunca debe impedir las alertas.
+    """
+    items = []
+    for deal in deals_list:
+        try:
+            asin = deal.get('asin')
+            current_prices = deal.get('current', [])
+            idx = 7 if (len(current_prices) > 7 and current_prices[7] > 0) else 0
+            if not asin or current_prices[idx] <= 0:
+                continue
+            items.append({
+                "name": deal.get('title', 'Sin título'),
+                "url": f"https://www.amazon.com.mx/dp/{asin}",
+                "sku": asin,
+                "price": current_prices[idx] / 100.0
+            })
+        except (IndexError, TypeError):
+            continue
+
+    session = SessionLocal()
+    try:
+        _, new_count = reconcile_products(session, items, "keepa", match_sku=True, store_sku=True)
+        session.commit()
+        product_counts.record_new_products("keepa", new_count)
+        logger.info(f"📈 Historial de precios actualizado para {len(items)} productos de Keepa")
+    except Exception as e:
+        logger.error(f"❌ Error guardando historial de Keepa: {e}")
+        session.rollback()
+    finally:
+        session.close()
 
 def parse_deals(deals_list, min_discount=70):
     clean_deals = []
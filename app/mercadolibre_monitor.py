@@ -0,0 +1,234 @@
+import os
+import time
+import asyncio
+import logging
+from statistics import median
+from app import http_client, monitoring
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURACIÓN DEL MONITOREO ASYNC ====================
+MONITOR_CONFIG = {
+    "initial_concurrency": int(os.getenv('ML_MONITOR_INITIAL_CONCURRENCY', 16)),
+    "min_concurrency": int(os.getenv('ML_MONITOR_MIN_CONCURRENCY', 2)),
+    "max_concurrency": int(os.getenv('ML_MONITOR_MAX_CONCURRENCY', 256)),
+    "target_latency": float(os.getenv('ML_MONITOR_TARGET_LATENCY', 2.0)),      # p50 en segundos
+    "throttle_threshold": float(os.getenv('ML_MONITOR_THROTTLE_THRESHOLD', 0.02)),  # % de 429/403 tolerado
+    "window": 50,             # Respuestas por ajuste de concurrencia
+    "increase_step": 4,       # Aumento aditivo si todo va bien
+    "decrease_factor": 0.5,   # Recorte multiplicativo ante 429/403
+    "default_backoff": 30,    # Pausa (s) ante 429 sin Retry-After
+    "write_batch_size": int(os.getenv('ML_MONITOR_WRITE_BATCH', 200)),      # Resultados por lote hacia la DB
+    "flush_interval": float(os.getenv('ML_MONITOR_FLUSH_INTERVAL', 2.0)),   # Máx. segundos que espera un lote incompleto
+}
+
+THROTTLE_STATUSES = (429, 403)
+
+
+class AdaptiveConcurrency:
+    """
+    Límite de peticiones en vuelo estilo AIMD:
+      - 429/403 por encima del umbral -> recorte multiplicativo + pausa (Retry-After)
+      - latencia p50 por encima del objetivo -> recorte suave (10%)
+      - en otro caso -> aumento aditivo
+    Se reajusta cada `window` respuestas.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or MONITOR_CONFIG
+        self.limit = self.config["initial_concurrency"]
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.peak_limit = self.limit
+        self._cond = asyncio.Condition()
+        self._latencies = []
+        self._throttled = 0
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        delay = self.pause_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, latency, status):
+        async with self._cond:
+            self.in_flight -= 1
+            self._latencies.append(latency)
+            if status in THROTTLE_STATUSES:
+                self._throttled += 1
+            if len(self._latencies) >= self.config["window"]:
+                self._adjust()
+            self._cond.notify_all()
+
+    def backoff(self, seconds):
+        self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+
+    def _adjust(self):
+        cfg = self.config
+        throttle_rate = self._throttled / len(self._latencies)
+        p50 = median(self._latencies)
+        old = self.limit
+
+        if throttle_rate > cfg["throttle_threshold"]:
+            self.limit = max(cfg["min_concurrency"], int(self.limit * cfg["decrease_factor"]))
+        elif p50 > cfg["target_latency"]:
+            self.limit = max(cfg["min_concurrency"], self.limit - max(1, self.limit // 10))
+        else:
+            self.limit = min(cfg["max_concurrency"], self.limit + cfg["increase_step"])
+
+        self.peak_limit = max(self.peak_limit, self.limit)
+        if self.limit != old:
+            logger.info(f"🎚️ Concurrencia ML {old} -> {self.limit} (p50={p50:.2f}s, bloqueos={throttle_rate:.1%})")
+        self._latencies = []
+        self._throttled = 0
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return MONITOR_CONFIG["default_backoff"]
+
+
+def _timed_parse(parse_price, response):
+    start = time.perf_counter()
+    price = parse_price(response)
+    monitoring.record_parse('mercadolibre', 1, time.perf_counter() - start)
+    return price
+
+
+async def _check_product(pool, limiter, product, parse_price, headers, queue, stats):
+    """Descarga y parsea un producto. El slot del limitador ya fue adquirido por el productor."""
+    start = time.perf_counter()
+    status = None
+    try:
+        response = await pool.get(product["url"], headers=headers)
+        status = response.status_code
+
+        if status in THROTTLE_STATUSES:
+            stats["throttled"] += 1
+            if status == 429:
+                limiter.backoff(_retry_after(response))
+            return
+        if status == 404:
+            return # Borrado
+        response.raise_for_status()
+
+        # El parseo (lxml) es CPU: en un hilo el loop sigue atendiendo las descargas en vuelo
+        new_price = await asyncio.to_thread(_timed_parse, parse_price, response)
+        if new_price > 0:
+            await queue.put({
+                "id": product["id"],
+                "sku": product["sku"],
+                "new_price": new_price,
+            })
+    except Exception as e:
+        stats["errors"] += 1
+        logger.debug(f"Error monitoreando {product['sku']}: {e}")
+    finally:
+        stats["checked"] += 1
+        await limiter.release(time.perf_counter() - start, status)
+
+
+_FLUSH = object()
+
+
+async def _flush(write_batch, batch, stats):
+    start = time.perf_counter()
+    await asyncio.to_thread(write_batch, batch)
+    elapsed = time.perf_counter() - start
+    stats["written"] += len(batch)
+    stats["flushes"] += 1
+    stats["flush_time"] += elapsed
+    stats["flush_max"] = max(stats["flush_max"], elapsed)
+    logger.debug(f"💾 Lote de {len(batch)} precios escrito en {elapsed * 1000:.0f}ms")
+
+
+async def _writer(queue, write_batch, config, stats):
+    """
+    Consume resultados conforme llegan y los escribe por lotes en un hilo aparte.
+    Un lote se escribe al llenarse o cuando lleva `flush_interval` segundos abierto.
+    """
+    batch = []
+    deadline = None
+    done = False
+    while not done:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            item = _FLUSH
+
+        if item is None:
+            done = True
+        elif item is not _FLUSH:
+            if not batch:
+                deadline = time.monotonic() + config["flush_interval"]
+            batch.append(item)
+
+        if batch and (done or item is _FLUSH or len(batch) >= config["write_batch_size"]):
+            await _flush(write_batch, batch, stats)
+            batch = []
+            deadline = None
+
+
+async def monitor_products(products, parse_price, write_batch, headers=None, config=None):
+    """
+    Revisa todos los productos con concurrencia adaptativa y va enviando los resultados
+    al escritor (`write_batch(lista_de_resultados)`) a medida que se completan.
+    `products` son dicts con: id, sku, url.
+    `parse_price(response)` retorna el precio (0.0 si no se encontró); corre en un hilo.
+    Si `write_batch` lanza una excepción se cancelan las descargas pendientes y se propaga.
+    """
+    config = config or MONITOR_CONFIG
+    limiter = AdaptiveConcurrency(config)
+    queue = asyncio.Queue()
+    stats = {"checked": 0, "written": 0, "throttled": 0, "errors": 0,
+             "flushes": 0, "flush_time": 0.0, "flush_max": 0.0}
+    start = time.perf_counter()
+
+    tasks = set()
+
+    def on_writer_done(task):
+        # Sin escritor los resultados se perderían: no se sigue descargando
+        if not task.cancelled() and task.exception() is not None:
+            for pending in list(tasks):
+                pending.cancel()
+
+    writer_task = asyncio.create_task(_writer(queue, write_batch, config, stats))
+    writer_task.add_done_callback(on_writer_done)
+    try:
+        async with http_client.AsyncHostPool() as pool:
+            for product in products:
+                if not product.get("url"):
+                    continue
+                await limiter.acquire()
+                if writer_task.done():
+                    break
+                task = asyncio.create_task(_check_product(pool, limiter, product, parse_price, headers, queue, stats))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        if not writer_task.done():
+            await queue.put(None)
+        await writer_task  # Propaga el error de write_batch, si lo hubo
+    finally:
+        writer_task.cancel()
+
+    stats["elapsed"] = round(time.perf_counter() - start, 2)
+    stats["flush_avg"] = round(stats["flush_time"] / stats["flushes"], 4) if stats["flushes"] else 0.0
+    stats["flush_time"] = round(stats["flush_time"], 4)
+    stats["flush_max"] = round(stats["flush_max"], 4)
+    stats["final_concurrency"] = limiter.limit
+    stats["peak_concurrency"] = limiter.peak_limit
+    return stats
+
+
+def run_monitoring(products, parse_price, write_batch, headers=None, config=None):
+    """Punto de entrada síncrono (tareas Celery)"""
+    return asyncio.run(monitor_products(products, parse_price, write_batch, headers, config))
@@ -1,18 +1,22 @@
-import requests
 import os
+import re
 import logging
-import redis
 import time
 from datetime import datetime
 from app.models import SessionLocal, Product
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from app.reconcile import reconcile_products
+from app.price_history import record_observations, record_drops
+from app import http_client, metrics, monitoring, product_counts, redis_pool
+from app.extraction import compile_spec, has_class, parse_html, extract_items, extract_fields
+from app.mercadolibre_monitor import run_monitoring
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 # Configuración de Redis
-redis_client = redis.Redis(host='redis', port=6379, db=1)
+redis_client = redis_pool.get_redis()
 
 # Constantes API
 BASE_URL = "https://api.mercadolibre.com"
@@ -45,7 +49,7 @@ def get_auth_token():
             "client_id": client_id,
             "client_secret": client_secret
         }
-        response = requests.post(AUTH_URL, data=data, timeout=10)
+        response = http_client.post(AUTH_URL, data=data)
         response.raise_for_status()
         
         auth_data = response.json()
@@ -71,10 +75,71 @@ def get_headers(token=None):
         "Content-Type": "application/json"
     }
 
-from bs4 import BeautifulSoup
-import json
-
-# ... (rest of imports)
+# Specs de extracción precompiladas (ver app.extraction)
+ML_SEARCH_SPEC = compile_spec({
+    # Las clases de ML cambian, pero suelen tener 'ui-search-layout__item'
+    "items": [
+        f"//li[{has_class('ui-search-layout__item')}]",
+        f"//div[{has_class('ui-search-result__wrapper')}]",
+    ],
+    "fields": {
+        "link": {
+            "xpath": [
+                f".//a[{has_class('ui-search-link')}]",
+                f".//a[{has_class('ui-search-result__content')}]",
+                ".//a[@href]",
+            ],
+            "attr": "href",
+        },
+        "title": {"xpath": f".//h2[{has_class('ui-search-item__title')}]"},
+        "price": {
+            "xpath": [
+                f".//div[{has_class('ui-search-price__second-line')}]//span[{has_class('andes-money-amount__fraction')}]",
+                f".//span[{has_class('andes-money-amount__fraction')}]",
+            ],
+        },
+    },
+})
+
+ML_ITEM_SPEC = compile_spec({
+    "fields": {
+        "price_meta": {"xpath": "//meta[@property='product:price:amount']", "attr": "content"},
+        "price_ui": {
+            "xpath": f"//div[{has_class('ui-pdp-price__second-line')}]//span[{has_class('andes-money-amount__fraction')}]",
+        },
+    },
+})
+
+def parse_ml_price(text):
+    """'4,999' -> 4999.0 (coma como separador de miles). 0.0 si no se puede leer."""
+    if not text:
+        return 0.0
+    try:
+        return float(text.replace(',', ''))
+    except ValueError:
+        return 0.0
+
+# Cabeceras de navegador para las páginas de artículo (el scraping evita los 401/403 de la API)
+ITEM_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Referer": "https://www.mercadolibre.com.mx/"
+}
+
+def parse_item_price(response):
+    """Precio de la página de un artículo: meta product:price:amount y, si no, el bloque de precio UI"""
+    fields = extract_fields(parse_html(response.content, response.encoding or 'utf-8'), ML_ITEM_SPEC)
+    new_price = 0.0
+
+    # 1. Intentar Meta Tag
+    if fields["price_meta"]:
+        try: new_price = float(fields["price_meta"])
+        except ValueError: pass
+
+    # 2. Intentar UI
+    if new_price == 0:
+        new_price = parse_ml_price(fields["price_ui"])
+    return new_price
 
 def search_products(keywords, sort_by='relevancia', free_shipping=False):
     """
@@ -110,84 +175,36 @@ def search_products(keywords, sort_by='relevancia', free_shipping=False):
                url += "_OrderId_PRICE_ASC"
 
             try:
-                response = requests.get(url, headers=headers, timeout=15)
+                response = http_client.get(url, headers=headers)
                 response.raise_for_status()
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Estrategia: Buscar items en el DOM
-                # Las clases de ML cambian, pero suelen tener 'ui-search-layout__item'
-                items = soup.find_all('li', class_='ui-search-layout__item')
-                
-                if not items:
-                     # Intentar otra clase comun
-                     items = soup.find_all('div', class_='ui-search-result__wrapper')
+                # Un solo árbol lxml y la spec precompilada para todos los items
+                start = time.perf_counter()
+                tree = parse_html(response.content, response.encoding or 'utf-8')
+                items = extract_items(tree, ML_SEARCH_SPEC)
+                monitoring.record_parse('mercadolibre', len(items), time.perf_counter() - start)
 
                 logger.info(f"   -> Encontrados {len(items)} items HTML para '{keyword}'")
+                page_items = []
 
                 for i, item in enumerate(items):
                     try:
-                        # Debug structure for first item
-                        if i == 0:
-                             logger.info(f"DEBUG HTML Item 0 class: {item.get('class')}")
-                             # logger.info(f"DEBUG HTML Item 0 content: {str(item)[:200]}")
-
-                        # Extraer link
-                        link_tag = item.find('a', class_='ui-search-link')
-                        if not link_tag: 
-                            # Intentar buscar polyfill_nc (otra clase de ML)
-                            link_tag = item.find('a', class_='ui-search-result__content')
-                            
-                        if not link_tag:
-                             # Ultimo intento, cualquier A con href
-                             link_tag = item.find('a', href=True)
-                        
-                        if not link_tag:
+                        permalink = item["link"]
+                        if not permalink:
                              if i < 3: logger.warning(f"⚠️ Skip item {i}: No se encontro link tag <a> en el item.")
                              continue
-                             
-                        permalink = link_tag.get('href', '')
-                        # logger.info(f"DEBUG Link: {permalink[:30]}...")
                         
-                        # Extraer titulo
-                        title_tag = item.find('h2', class_='ui-search-item__title')
-                        title = title_tag.get_text().strip() if title_tag else "Sin titulo"
+                        title = item["title"] or "Sin titulo"
                         
-                        # Extraer precio
-                        price_container = item.find('div', class_='ui-search-price__second-line')
-                        price_val = 0.0
-                        if price_container:
-                            price_span = price_container.find('span', class_='andes-money-amount__fraction')
-                            if price_span:
-                                price_val = float(price_span.get_text().replace('.', '').replace(',', '.')) # Cuidado con separadores
-                                # ML usa punto para miles en MX? o coma? 
-                                # En MX es coma para miles, punto para decimales?
-                                # Usualmente en HTML viene "20,000" (veinte mil).
-                                # Vamos a limpiar todo lo que no sea digito
-                                txt = price_span.get_text()
-                                # Limpieza basica: quitar puntos y comas y convertir
-                                # Mejor estrategia: ver si hay decimales
-                                # Asumimos entero por ahora si es complejo parsear
-                                pass
-
-                        # Re-parseo precio mas robusto
-                        # Buscamos el meta price si existe o el texto plano
-                        # ML suele poner <span class="andes-money-amount__fraction" aria-hidden="true">4,999</span>
-                        if price_val == 0:
-                             price_tag = item.find('span', class_='andes-money-amount__fraction')
-                             if price_tag:
-                                 txt_price = price_tag.get_text().replace(',', '')
-                                 try:
-                                     price_val = float(txt_price)
-                                 except:
-                                     pass
+                        # ML pone <span class="andes-money-amount__fraction" aria-hidden="true">4,999</span>
+                        # (coma para miles en MX)
+                        price_val = parse_ml_price(item["price"])
 
                         # ID: Extraer de la URL o input hidden
                         # https://articulo.mercadolibre.com.mx/MLM-123456-...
                         # ID suele ser MLM-123456
                         ml_id = None
                         if 'MLM' in permalink:
-                            import re
                             match = re.search(r'(MLM-?\d+)', permalink)
                             if match:
                                 ml_id = match.group(1).replace('-', '') # MLM12345
@@ -197,33 +214,14 @@ def search_products(keywords, sort_by='relevancia', free_shipping=False):
                             # logger.debug(f"⚠️ Saltando item sin ID MLM: {permalink[:50]}...")
                             continue 
                             
-                        # Guardar en DB
-                        db_product = session.query(Product).filter(
-                             or_(Product.sku == ml_id, Product.url == permalink)
-                        ).first()
-
-                        if db_product:
-                             # logger.debug(f"Item existente: {ml_id} - ${price_val}")
-                             if abs(db_product.current_price - price_val) > 0.1 and price_val > 0:
-                                 db_product.current_price = price_val
-                             if not db_product.sku:
-                                 db_product.sku = ml_id
-                             db_product.last_checked = datetime.utcnow()
-                        else:
-                             if price_val > 0:
-                                # logger.debug(f"Item nuevo: {ml_id} - ${price_val}")
-                                new_product = Product(
-                                    name=title,
-                                    sku=ml_id,
-                                    url=permalink,
-                                    current_price=price_val,
-                                    original_price=None, # Dificil sacar orig price facil sin entrar al item
-                                    last_checked=datetime.utcnow()
-                                )
-                                session.add(new_product)
-                             else:
-                                # logger.debug(f"⚠️ Saltando item {ml_id} con precio 0")
-                                pass
+                        # Se guarda en bloque al terminar la página (ver app.reconcile)
+                        if price_val > 0:
+                            page_items.append({
+                                "name": title,
+                                "url": permalink,
+                                "sku": ml_id,
+                                "price": price_val
+                            })
                         
                         processed_products.append({
                             "id": ml_id,
@@ -236,7 +234,10 @@ def search_products(keywords, sort_by='relevancia', free_shipping=False):
                         logger.error(f"Error parseando item HTML: {e}")
                         continue
 
+                # Guardar en DB: una consulta IN por URL/SKU + un upsert para toda la página
+                _, new_count = reconcile_products(session, page_items, "mercadolibre", match_sku=True, store_sku=True)
                 session.commit()
+                product_counts.record_new_products("mercadolibre", new_count)
 
             except Exception as e:
                 logger.error(f"❌ Error scraping '{keyword}': {e}")
@@ -252,144 +253,97 @@ def search_products(keywords, sort_by='relevancia', free_shipping=False):
 def update_tracked_products():
     """
     Batch update de productos MLM rastreados en la BD.
-    AHORA USANDO SCRAPING POR PRODUCTO para evitar bloqueos API (401/403).
+    Scraping por producto (evita bloqueos API 401/403) con el motor asyncio de
+    mercadolibre_monitor: concurrencia adaptativa y escritura por lotes conforme llegan resultados.
     """
     updates = []
     session = SessionLocal()
     
     try:
-        # Obtener todos los productos MLM
-        ml_products = session.query(Product).filter(Product.sku.like("MLM%")).all()
+        # Obtener todos los productos de ML, los revisados hace más tiempo primero (una sola vez: el escritor trabaja sobre este mapa id -> fila)
+        tracked = {
+            row.id: row._asdict()
+            for row in session.execute(
+                select(Product.id, Product.sku, Product.url, Product.name, Product.current_price)
+                .where(Product.source == "mercadolibre")
+                .order_by(Product.last_checked)
+            )
+        }
         
-        if not ml_products:
+        if not tracked:
             logger.info("ℹ️ No hay productos de Mercado Libre para monitorear.")
             return []
 
-        logger.info(f"🔄 Monitoreando {len(ml_products)} productos de Mercado Libre (Scraping Paralelo)...")
-        
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-
-        def scrape_single_product(product_id, url, old_price, product_name, current_original_price):
-            result = None
-            try:
-                if not url: return None
-                
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                    "Referer": "https://www.mercadolibre.com.mx/"
-                }
-
-                # logger.debug(f"Checking {product_id}...")
-                response = requests.get(url, headers=headers, timeout=15)
-                
-                if response.status_code == 404:
-                     return None # Borrado
-
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                new_price = 0.0
-                
-                # 1. Intentar Meta Tag
-                price_meta = soup.find("meta", property="product:price:amount")
-                if price_meta:
-                    try:
-                        content = price_meta.get("content")
-                        if content: new_price = float(content)
-                    except: pass
-                
-                # 2. Intentar UI
-                if new_price == 0:
-                    price_container = soup.find("div", class_="ui-pdp-price__second-line")
-                    if price_container:
-                        fraction = price_container.find("span", class_="andes-money-amount__fraction")
-                        if fraction:
-                             txt = fraction.get_text().replace(',', '')
-                             try: new_price = float(txt)
-                             except: pass
-                
-                if new_price > 0:
-                    return {
-                        "id": product_id,
-                        "new_price": new_price,
-                        "old_price": old_price,
-                        "name": product_name,
-                        "url": url,
-                        "original_price": current_original_price
-                    }
-            except Exception as e:
-                # logger.error(f"Error scraping {product_id}: {e}")
-                pass
-            return None
-
-        # Usar ThreadPool para paralelizar
-        max_workers = 8
-        updates = []
-        
-        # Preparamos datos para no pasar objetos de session al thread
-        products_data = []
-        for p in ml_products:
-            products_data.append({
-                "id": p.id,
-                "sku": p.sku,
-                "url": p.url,
-                "current_price": p.current_price,
-                "name": p.name,
-                "original_price": p.original_price
-            })
-
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_sku = {
-                executor.submit(
-                    scrape_single_product, 
-                    p["sku"], p["url"], p["current_price"], p["name"], p["original_price"]
-                ): p["sku"] 
-                for p in products_data
-            }
-            
-            processed_count = 0
-            for future in as_completed(future_to_sku):
-                processed_count += 1
-                sku = future_to_sku[future]
-                try:
-                    res = future.result()
-                    if res:
-                        # Actualizar en BD (necesitamos re-query o usar session local si fuera thread-safe, 
-                        # pero mejor hacer update masivo o uno por uno en main thread)
-                        # Hacemos update clean en main thread
-                        
-                        # Buscar producto en session actual para update
-                        db_prod = session.query(Product).filter(Product.sku == sku).first()
-                        if db_prod:
-                            new_price = res["new_price"]
-                            old_price = db_prod.current_price
-                            
-                            # Actualizar precio si varía
-                            if abs(new_price - old_price) > 0.1:
-                                db_prod.current_price = new_price
-                                if new_price < old_price and old_price > 0:
-                                    drop_pct = ((old_price - new_price) / old_price) * 100
-                                    updates.append({
-                                        "source": "mercadolibre",
-                                        "title": db_prod.name,
-                                        "price": new_price,
-                                        "old_price": old_price,
-                                        "discount_pct": round(drop_pct, 1),
-                                        "url": db_prod.url,
-                                        "sku": sku
-                                    })
-                            
-                            db_prod.last_checked = datetime.utcnow()
-                except Exception as exc:
-                    logger.error(f"Generado error en thread {sku}: {exc}")
-                
-                # Commit cada tanto para no bloquear
-                if processed_count % 50 == 0:
-                    session.commit()
-                    logger.info(f"   ...Procesados {processed_count}/{len(ml_products)}")
-
-            session.commit() # Final commit
+        logger.info(f"🔄 Monitoreando {len(tracked)} productos de Mercado Libre (asyncio)...")
+
+        products_data = [{"id": p["id"], "sku": p["sku"], "url": p["url"]} for p in tracked.values()]
+        progress = {"processed": 0}
+
+        def write_batch(results):
+            # Corre en un hilo aparte (asyncio.to_thread); el loop no toca la session.
+            # UPDATE por clave primaria en dos sentencias executemany: con y sin cambio de precio.
+            start = time.perf_counter()
+            drops_before = len(updates)
+            now = datetime.utcnow()
+            price_changes, checked_only, observations, drops = [], [], [], []
+            for res in results:
+                row = tracked.get(res["id"])
+                if not row:
+                    continue
+                new_price = res["new_price"]
+                old_price = row["current_price"] or 0.0
+                observations.append({
+                    "product_id": row["id"],
+                    "observed_at": now,
+                    "price": new_price,
+                    "source": "mercadolibre"
+                })
+
+                # Actualizar precio si varía
+                if abs(new_price - old_price) > 0.1:
+                    price_changes.append({"id": row["id"], "current_price": new_price, "last_checked": now})
+                    row["current_price"] = new_price
+                    if new_price < old_price and old_price > 0:
+                        drop_pct = ((old_price - new_price) / old_price) * 100
+                        updates.append({
+                            "source": "mercadolibre",
+                            "title": row["name"],
+                            "price": new_price,
+                            "old_price": old_price,
+                            "discount_pct": round(drop_pct, 1),
+                            "url": row["url"],
+                            "sku": row["sku"]
+                        })
+                        drops.append({
+                            "product_id": row["id"],
+                            "source": "mercadolibre",
+                            "old_price": old_price,
+                            "new_price": new_price,
+                            "discount_pct": round(drop_pct, 1),
+                            "detected_at": now,
+                        })
+                else:
+                    checked_only.append({"id": row["id"], "last_checked": now})
+
+            if price_changes:
+                session.execute(update(Product), price_changes)
+            if checked_only:
+                session.execute(update(Product), checked_only)
+            record_observations(session, observations)
+            record_drops(session, drops)
+            session.commit()
+            metrics.RECONCILE_SECONDS.labels("mercadolibre").observe(time.perf_counter() - start)
+            metrics.DROPS.labels("mercadolibre").inc(len(updates) - drops_before)
+            progress["processed"] += len(results)
+            logger.info(f"   ...Escritos {progress['processed']} precios ({len(price_changes)} cambios en el lote)")
+
+        summary = run_monitoring(products_data, parse_item_price, write_batch, headers=ITEM_HEADERS)
+        logger.info(
+            f"✅ Monitoreo ML: {summary['checked']} revisados, {summary['written']} con precio, "
+            f"{summary['throttled']} bloqueados, {summary['errors']} errores en {summary['elapsed']}s "
+            f"(concurrencia final {summary['final_concurrency']}, pico {summary['peak_concurrency']}); "
+            f"{summary['flushes']} lotes a DB, {summary['flush_avg'] * 1000:.0f}ms prom / {summary['flush_max'] * 1000:.0f}ms máx"
+        )
 
     except Exception as e:
         logger.error(f"❌ Error general en update_tracked_products: {e}")
@@ -0,0 +1,81 @@
+import os
+from urllib.parse import urlparse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+
+# ==================== MÉTRICAS PROMETHEUS ====================
+# Compartidas por tareas Celery, sender de Telegram y API. Con varios procesos
+# (prefork) cada uno escribe sus valores en PROMETHEUS_MULTIPROC_DIR y /metrics
+# los agrega al leer; la variable debe existir antes de importar prometheus_client.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Host -> fuente, para etiquetar las peticiones de http_client
+HOST_SOURCES = {
+    "www.officedepot.com.mx": "officedepot",
+    "www.walmart.com.mx": "walmart",
+    "www.promodescuentos.com": "promodescuentos",
+    "api.keepa.com": "keepa",
+    "api.telegram.org": "telegram",
+    "api.mercadolibre.com": "mercadolibre",
+    "listado.mercadolibre.com.mx": "mercadolibre",
+    "articulo.mercadolibre.com.mx": "mercadolibre",
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+PARSE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+FETCH_SECONDS = Histogram(
+    "scraper_http_fetch_seconds", "Duración de peticiones HTTP (incluye descarga del cuerpo)",
+    ["source"], buckets=LATENCY_BUCKETS,
+)
+PARSE_SECONDS = Histogram(
+    "scraper_parse_seconds", "Tiempo de parseo por página", ["source"], buckets=PARSE_BUCKETS,
+)
+RECONCILE_SECONDS = Histogram(
+    "scraper_db_reconcile_seconds", "Tiempo de escritura/reconciliación en la DB por lote",
+    ["source"], buckets=LATENCY_BUCKETS,
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "scraper_rate_limit_wait_seconds", "Espera por el límite de peticiones por dominio",
+    ["source"], buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+TELEGRAM_SEND_SECONDS = Histogram(
+    "telegram_send_seconds", "Duración del sendMessage exitoso", ["source"], buckets=LATENCY_BUCKETS,
+)
+
+PAGES = Counter("scraper_pages_total", "Páginas parseadas", ["source"])
+PRODUCTS = Counter("scraper_products_total", "Productos extraídos", ["source"])
+DROPS = Counter("scraper_price_drops_total", "Bajadas de precio detectadas", ["source"])
+ALERTS_SENT = Counter("telegram_alerts_sent_total", "Mensajes entregados a Telegram", ["source"])
+
+
+def source_for_host(host):
+    """Fuente conocida del host, o "other": el host crudo dispararía la cardinalidad de las series"""
+    return HOST_SOURCES.get(host, "other")
+
+
+def source_for_url(url):
+    return source_for_host(urlparse(url).netloc)
+
+
+def observe_parse(source, items, seconds):
+    PAGES.labels(source).inc()
+    PRODUCTS.labels(source).inc(items)
+    PARSE_SECONDS.labels(source).observe(seconds)
+
+
+def render():
+    """Cuerpo y content-type para /metrics (agregando todos los procesos si aplica)"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Limpia los archivos de un proceso hijo que terminó (solo modo multiproceso)"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+import logging
+
+# Configurar logging
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
@@ -15,11 +19,125 @@ class Product(Base):
     current_price = Column(Float)
     original_price = Column(Float, nullable=True)
     last_checked = Column(DateTime, default=datetime.utcnow)
+    source = Column(String, nullable=True)  # officedepot, walmart, mercadolibre, keepa (ver update_schema.py)
+
+    __table_args__ = (
+        # "Todos los productos rastreados de la fuente X, los más antiguos primero": range scan del índice
+        Index('ix_products_source_last_checked', 'source', 'last_checked'),
+    )
+
+class PriceObservation(Base):
+    """
+    Historial append-only de precios de todas las fuentes.
+    En Postgres la tabla está particionada por mes (ver ensure_observation_partitions).
+    """
+    __tablename__ = 'price_observations'
+    product_id = Column(Integer, primary_key=True)
+    observed_at = Column(DateTime, primary_key=True)
+    price = Column(Float, nullable=False)
+    source = Column(String, nullable=False)
+
+    __table_args__ = (
+        # "Últimas N observaciones" y "min/avg en una ventana" de un producto: index-only scan
+        Index('ix_price_observations_product_recent', 'product_id', observed_at.desc(),
+              postgresql_include=['price']),
+        # Barridos por rango de tiempo (mantenimiento, agregados globales); BRIN es diminuto en tablas append-only
+        Index('ix_price_observations_observed_at_brin', 'observed_at', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (observed_at)'},
+    )
+
+class PriceDrop(Base):
+    """Bajadas de precio detectadas (las que generan alerta), para la API de deals recientes"""
+    __tablename__ = 'price_drops'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    source = Column(String, nullable=False)
+    old_price = Column(Float, nullable=False)
+    new_price = Column(Float, nullable=False)
+    discount_pct = Column(Float, nullable=False)
+    detected_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Paginación keyset por (detected_at, id) descendente, global o por fuente
+        Index('ix_price_drops_detected', 'detected_at', 'id'),
+        Index('ix_price_drops_source_detected', 'source', 'detected_at', 'id'),
+    )
 
 # Conexión
 DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://user:password@db:5432/pricedb')
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine)
 
+def dialect_insert(session):
+    """
+    `insert` del dialecto activo, con soporte de ON CONFLICT
+    (Postgres en producción, SQLite en benchmarks locales).
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT no soportado para el dialecto '{dialect}'")
+    return insert
+
+def _month_start(year, month):
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+def _create_month_partition(conn, start, end):
+    """
+    Crea la partición de [start, end). Si ya hay partición DEFAULT, las filas de ese rango
+    que cayeron en ella (inserts de un mes aún sin partición) impedirían el
+    CREATE TABLE ... PARTITION OF, así que se mueven a la tabla nueva antes de adjuntarla.
+    Todo en la transacción de `conn`: si algo falla no queda nada a medias.
+    """
+    name = f"price_observations_{start:%Y_%m}"
+    bounds = f"FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    if conn.execute(text("SELECT to_regclass('price_observations_default')")).scalar() is None:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF price_observations FOR VALUES {bounds}"))
+        return 0
+    # Bloquea nuevos inserts en DEFAULT (las lecturas siguen) hasta adjuntar la partición
+    conn.execute(text("LOCK TABLE price_observations_default IN SHARE ROW EXCLUSIVE MODE"))
+    conn.execute(text(f"CREATE TABLE {name} (LIKE price_observations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM price_observations_default "
+        f"WHERE observed_at >= '{start:%Y-%m-%d}' AND observed_at < '{end:%Y-%m-%d}' RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    )).rowcount
+    # ATTACH crea los índices de la tabla particionada en la partición nueva
+    conn.execute(text(f"ALTER TABLE price_observations ATTACH PARTITION {name} FOR VALUES {bounds}"))
+    return moved
+
+def ensure_observation_partitions(bind=engine, months_back=1, months_ahead=2):
+    """
+    Crea (si no existen) las particiones mensuales de price_observations alrededor del mes actual,
+    más una partición DEFAULT para que un insert fuera de rango nunca falle.
+    La corre init_db y, para ir por delante del calendario, la tarea diaria
+    maintain_observation_partitions (app/tasks.py). Retorna las particiones creadas.
+    """
+    if bind.dialect.name != 'postgresql':
+        return []
+    now = datetime.utcnow()
+    created = []
+    for offset in range(-months_back, months_ahead + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(start.year, start.month + 1)
+        name = f"price_observations_{start:%Y_%m}"
+        # Una transacción por mes: un fallo (p.ej. DEFAULT bloqueada) no deshace los demás
+        with bind.begin() as conn:
+            if conn.execute(text(f"SELECT to_regclass('{name}')")).scalar() is not None:
+                continue
+            moved = _create_month_partition(conn, start, end)
+        created.append(name)
+        if moved:
+            logger.info(f"📦 {name}: {moved} observaciones movidas desde la partición DEFAULT")
+    with bind.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS price_observations_default PARTITION OF price_observations DEFAULT"))
+    return created
+
 def init_db():
-    Base.metadata.create_all(engine)
\ No newline at end of file
+    Base.metadata.create_all(engine)
+    ensure_observation_partitions(engine)
\ No newline at end of file
@@ -1,16 +1,65 @@
 import os
+import json
+import time
 import logging
-import requests
-import redis
+import functools
+import threading
 from datetime import datetime
+from app import http_client, metrics, redis_pool
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-# Configuración de Redis
-# Usamos el db 1, el mismo que en tasks.py para las alertas de productos, 
-# pero idealmente podríamos usar otro db si quisiéramos separar lógica.
-redis_client = redis.Redis(host='redis', port=6379, db=1)
+# Pool Redis compartido (app/redis_pool.py, configurable con REDIS_URL)
+redis_client = redis_pool.get_redis()
+
+# Ventana móvil de ejecuciones por fuente para p50/p95 de latencia y throughput
+RUN_WINDOW = int(os.getenv('MONITOR_RUN_WINDOW', 100))
+
+# ==================== MÉTRICAS DE LA EJECUCIÓN EN CURSO ====================
+# Celery prefork corre una tarea a la vez por proceso, así que basta un acumulador
+# por proceso. Los servicios reportan lo que parsean con record_parse(); los bytes
+# salen de los contadores de http_client.
+_run_lock = threading.Lock()
+_active_run = None
+
+
+def record_parse(source, items, seconds):
+    """
+    Registra el parseo de una página: histogramas/contadores Prometheus y, si hay
+    una ejecución activa, sus items y tiempo de parseo.
+    """
+    metrics.observe_parse(source, items, seconds)
+    with _run_lock:
+        if _active_run is not None:
+            _active_run["items"] += items
+            _active_run["parse_time"] += seconds
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize_runs(samples):
+    """p50/p95 de duración y parseo, items/s y promedios de la ventana de ejecuciones"""
+    if not samples:
+        return {"samples": 0}
+    durations = [r["duration"] for r in samples]
+    total_time = sum(durations)
+    return {
+        "samples": len(samples),
+        "duration_p50": round(_percentile(durations, 50), 3),
+        "duration_p95": round(_percentile(durations, 95), 3),
+        "parse_p50": round(_percentile([r["parse_time"] for r in samples], 50), 4),
+        "items_per_sec": round(sum(r["items"] for r in samples) / total_time, 2) if total_time else 0.0,
+        "items_avg": round(sum(r["items"] for r in samples) / len(samples), 1),
+        "bytes_avg": int(sum(r["bytes"] for r in samples) / len(samples)),
+        "error_rate": round(sum(1 for r in samples if not r.get("ok", True)) / len(samples), 3),
+    }
+
 
 class Monitor:
     def __init__(self):
@@ -30,6 +79,14 @@ class Monitor:
             'officedepot': {
                 'failures': 3,
                 'empty': 50        # Es normal que no encuentre bajadas de precio seguido
+            },
+            'walmart': {
+                'failures': 3,
+                'empty': 48        # ~24h si es cada 30 min (bajadas de precio esporádicas)
+            },
+            'mercadolibre': {
+                'failures': 3,
+                'empty': 48        # ~24h si es cada 30 min
             }
         }
     
@@ -51,10 +108,9 @@ class Monitor:
         )
 
         try:
-            response = requests.post(
+            response = http_client.post(
                 f"https://api.telegram.org/bot{self.telegram_token}/sendMessage",
-                json={"chat_id": self.chat_id, "text": full_msg, "parse_mode": "Markdown"},
-                timeout=5
+                json={"chat_id": self.chat_id, "text": full_msg, "parse_mode": "Markdown"}
             )
             if response.status_code == 200:
                 logger.info(f"✅ Alerta de sistema enviada: {title}")
@@ -67,18 +123,24 @@ class Monitor:
         """Resetea los contadores de fallo tras un éxito"""
         f_key = self._get_key(service_name, 'failures')
         e_key = self._get_key(service_name, 'empty')
-        
+
+        # GET + DEL en una sola ida (MULTI)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.get(f_key)
+        pipe.delete(f_key, e_key)
+        failures, _ = pipe.execute()
+
         # Si había fallos previos, logueamos que se recuperó
-        failures = int(redis_client.get(f_key) or 0)
+        failures = int(failures or 0)
         if failures > 0:
             logger.info(f"✅ {service_name} se ha recuperado tras {failures} fallos.")
-            # Opcional: Enviar alerta de recuperación si estaba en estado crítico
-            
-        redis_client.delete(f_key)
-        redis_client.delete(e_key)
 
     def record_failure(self, service_name, error_msg):
         """Registra un fallo (excepción)"""
+        # Las tareas capturan sus excepciones: así la ejecución activa queda marcada como fallida
+        with _run_lock:
+            if _active_run is not None:
+                _active_run["ok"] = False
         key = self._get_key(service_name, 'failures')
         count = redis_client.incr(key)
         
@@ -98,39 +160,22 @@ class Monitor:
                 f"El servicio lleva {count} fallos consecutivos.\nRevisar logs urgente."
             )
 
-    def record_empty(self, service_name):
-        """Registra que el servicio corrió bien pero no halló productos (posible error lógico/layout)"""
-        key = self._get_key(service_name, 'empty')
-        # No reseteamos failures aquí, porque run exitoso = 0 failures.
-        # Pero reseteamos failures explícitamente en record_success/record_empty?
-        # Sí, un empty result implica que NO hubo crash.
-        self.record_success(service_name) # Resetea failures, pero "empty" es un track separado
-        
-        # Re-incrementamos empty porque record_success lo borró (o no debería borrarlo?)
-        # Ajuste: record_success debería borrar failures. 
-        # Pero si es empty, ¿es success? Técnicamente sí (no crash).
-        # Vamos a separar:
-        #   record_success_found_deals -> borra failures Y empty
-        #   record_success_no_deals -> borra failures, incrementa empty
-        
-        # Corrección lógica Monitor:
-        # record_success -> Se encontraron deals. Todo OK. Borra todo.
-        pass
-
     def record_found_deals(self, service_name):
         """Se ejecutó correctamente Y encontró deals"""
         f_key = self._get_key(service_name, 'failures')
         e_key = self._get_key(service_name, 'empty')
-        redis_client.delete(f_key)
-        redis_client.delete(e_key)
+        redis_client.delete(f_key, e_key)
 
     def record_no_deals(self, service_name):
         """Se ejecutó correctamente PERO NO encontró deals"""
         f_key = self._get_key(service_name, 'failures')
-        redis_client.delete(f_key) # No hubo crash
-        
         e_key = self._get_key(service_name, 'empty')
-        count = redis_client.incr(e_key)
+
+        # No hubo crash: borra fallos e incrementa vacíos en una sola ida
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(f_key)
+        pipe.incr(e_key)
+        _, count = pipe.execute()
         
         limit = self.THRESHOLDS.get(service_name, {}).get('empty', 20)
         
@@ -140,20 +185,84 @@ class Monitor:
                 f"El servicio lleva {count} ejecuciones sin encontrar NADA.\nPosible cambio de layout, bloqueo o IP baneada."
             )
 
+    def record_run(self, service_name, duration, items=0, bytes_downloaded=0, parse_time=0.0, ok=True):
+        """Agrega una ejecución a la ventana móvil de la fuente (LPUSH + LTRIM en un pipeline)"""
+        sample = json.dumps({
+            "ts": int(time.time()),
+            "duration": round(duration, 3),
+            "items": items,
+            "bytes": bytes_downloaded,
+            "parse_time": round(parse_time, 4),
+            "ok": ok,
+        })
+        key = self._get_key(service_name, 'runs')
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.lpush(key, sample)
+            pipe.ltrim(key, 0, RUN_WINDOW - 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo registrar la ejecución de {service_name}: {e}")
+
+    def tracked(self, service_name):
+        """
+        Decorador para tareas de escaneo: mide duración, bytes descargados, items
+        y tiempo de parseo de la ejecución y los guarda con record_run.
+
+            @app.task
+            @monitor.tracked('walmart')
+            def scan_walmart_deals(): ...
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                global _active_run
+                with _run_lock:
+                    _active_run = {"items": 0, "parse_time": 0.0, "ok": True}
+                bytes_before = http_client.total_bytes()
+                start = time.perf_counter()
+                ok = True
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    ok = False
+                    raise
+                finally:
+                    with _run_lock:
+                        run, _active_run = _active_run, None
+                    self.record_run(
+                        service_name,
+                        time.perf_counter() - start,
+                        items=run["items"],
+                        bytes_downloaded=http_client.total_bytes() - bytes_before,
+                        parse_time=run["parse_time"],
+                        ok=ok and run["ok"],
+                    )
+            return wrapper
+        return decorator
+
     def get_services_status(self):
-        """Devuelve el estado actual de los servicios monitoreados"""
+        """
+        Devuelve el estado actual de los servicios monitoreados.
+        Todos los contadores (MGET) y ventanas de ejecuciones (LRANGE) en un solo pipeline.
+        """
+        services = list(self.THRESHOLDS.keys())
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.mget([self._get_key(s, t) for s in services for t in ('failures', 'empty')])
+        for service in services:
+            pipe.lrange(self._get_key(service, 'runs'), 0, -1)
+        counters, *windows = pipe.execute()
+
         status = {}
-        for service in self.THRESHOLDS.keys():
-            f_key = self._get_key(service, 'failures')
-            e_key = self._get_key(service, 'empty')
-            
-            failures = int(redis_client.get(f_key) or 0)
-            empty = int(redis_client.get(e_key) or 0)
+        for i, service in enumerate(services):
+            failures = int(counters[2 * i] or 0)
+            empty = int(counters[2 * i + 1] or 0)
             
             status[service] = {
                 "failures": failures,
                 "consecutive_empty": empty,
-                "status": "ok" if failures == 0 and empty < self.THRESHOLDS[service]['empty'] else "warning"
+                "status": "ok" if failures == 0 and empty < self.THRESHOLDS[service]['empty'] else "warning",
+                "runs": summarize_runs([json.loads(r) for r in windows[i]]),
             }
             # Si supera umbral, poner status 'critical'
             if failures >= self.THRESHOLDS[service]['failures'] or empty >= self.THRESHOLDS[service]['empty']:
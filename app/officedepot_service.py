@@ -1,10 +1,14 @@
-import requests
 import json
 import logging
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from sqlalchemy.orm import Session
-from app.models import SessionLocal, Product
+from urllib.parse import urlparse
+from app.models import SessionLocal
+from app.reconcile import reconcile_products
+from app import http_client, monitoring, product_counts
 from bs4 import BeautifulSoup
 
 # Configurar logging
@@ -39,27 +43,93 @@ SEARCH_CONFIG = {
     "min_price_drop_amount": 5000,
     "keywords_include": [],
     "keywords_exclude": [],
+    # Descarga concurrente: todas las páginas en paralelo sobre el pool keep-alive/HTTP2 compartido
+    "concurrent_fetch": True,
+    "max_concurrency_per_host": 4,
+    # 'fast': dataLayer a nivel de bytes (fallback a soup) | 'soup': BeautifulSoup completo
+    "parse_mode": "fast",
 }
 
-def fetch_officedepot_products(url):
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# Modo rápido: búsqueda a nivel de bytes del arreglo 'impressions' del dataLayer,
+# sin construir el árbol HTML. Un solo regex recorre el arreglo y reconoce
+# apertura/cierre de objetos y los campos que nos interesan en una pasada.
+IMPRESSIONS_RE = re.compile(rb"'impressions'\s*:\s*\[(.*?)\]", re.DOTALL)
+IMPRESSION_TOKEN_RE = re.compile(rb"(\{)|(\})|'(id|name|price|sale_price)'\s*:\s*'([^']*)'")
+
+def locate_impressions(content):
+    """Devuelve los bytes del arreglo 'impressions' (sin corchetes) o None"""
+    match = IMPRESSIONS_RE.search(content)
+    return match.group(1) if match else None
+
+def _build_product(pid, name, price_raw, sale_price_raw):
+    """Construye el producto con el precio real (el menor entre price y sale_price)"""
+    try:
+        p_val = float(price_raw)
+    except:
+        p_val = 0.0
+
+    try:
+        if sale_price_raw:
+            sp_val = float(sale_price_raw)
+            # Usar sale_price si es válido y menor que precio normal
+            if sp_val > 0 and sp_val < p_val:
+                p_val = sp_val
+    except:
+        pass
+
+    if p_val <= 0:
+        return None
+    return {
+        "@type": "Product",
+        "name": name,
+        "sku": pid,
+        "url": f"https://www.officedepot.com.mx/officedepot/en/p/{pid}", # Construir URL
+        "offers": {
+            "price": p_val,
+            "priceCurrency": "MXN"
+        },
+        "image": "" # No viene en dataLayer, dejamos vacio
+    }
+
+def extract_datalayer_fast(content, encoding='utf-8', impressions=None):
     """
-    Obtiene productos usando BeautifulSoup para encontrar el script dataLayer,
-    que contiene un listado más completo de productos y precios 'sale_price'.
-    Fallback: JSON-LD standard.
+    Extrae los productos del dataLayer directamente de los bytes de la respuesta.
+    Retorna None si no se encontró el arreglo (para caer al modo soup).
     """
-    logger.info(f"Escaneando Office Depot: {url}")
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    if impressions is None:
+        impressions = locate_impressions(content)
+    if impressions is None:
+        return None
 
     products = []
+    fields = None
+    count = 0
+    for match in IMPRESSION_TOKEN_RE.finditer(impressions):
+        if match.group(1):
+            fields = {}
+        elif match.group(2):
+            if fields is not None:
+                count += 1
+                if 'id' in fields and 'name' in fields:
+                    product = _build_product(fields['id'], fields['name'], fields.get('price', '0'), fields.get('sale_price'))
+                    if product:
+                        products.append(product)
+            fields = None
+        elif fields is not None:
+            fields[match.group(3).decode('ascii')] = match.group(4).decode(encoding, errors='replace')
+
+    logger.info(f"🔍 Encontrados {count} items en dataLayer (modo rápido)")
+    return products
+
+def extract_datalayer_soup(html):
+    """Modo original: árbol BeautifulSoup completo para localizar el script del dataLayer"""
+    products = []
+    soup = BeautifulSoup(html, 'lxml')
     
-    response = requests.get(url, headers=headers, timeout=20)
-    response.raise_for_status()
-    
-    soup = BeautifulSoup(response.text, 'lxml')
-    
-    # --- ESTRATEGIA 1: DataLayer (Más completa y con sale_price) ---
     scripts = soup.find_all('script')
     found_datalayer = None
     
@@ -93,161 +163,158 @@ def fetch_officedepot_products(url):
                     sale_price_match = re.search(r"'sale_price'\s*:\s*'([^']*)'", item_str)
                     
                     if id_match and name_match:
-                        pid = id_match.group(1)
-                        name = name_match.group(1)
-                        price_raw = price_match.group(1) if price_match else "0"
-                        sale_price_raw = sale_price_match.group(1) if sale_price_match else None
-                        
-                        # Determinar el precio real (el menor)
-                        try:
-                            p_val = float(price_raw)
-                        except:
-                            p_val = 0.0
-                            
-                        try:
-                            if sale_price_raw:
-                                sp_val = float(sale_price_raw)
-                                # Usar sale_price si es válido y menor que precio normal
-                                if sp_val > 0 and sp_val < p_val:
-                                    p_val = sp_val
-                        except:
-                            pass
-                            
-                        if p_val > 0:
-                            product_obj = {
-                                "@type": "Product",
-                                "name": name,
-                                "sku": pid,
-                                "url": f"https://www.officedepot.com.mx/officedepot/en/p/{pid}", # Construir URL
-                                "offers": {
-                                    "price": p_val,
-                                    "priceCurrency": "MXN"
-                                },
-                                "image": "" # No viene en dataLayer, dejamos vacio
-                            }
-                            products.append(product_obj)
+                        product = _build_product(
+                            id_match.group(1),
+                            name_match.group(1),
+                            price_match.group(1) if price_match else "0",
+                            sale_price_match.group(1) if sale_price_match else None
+                        )
+                        if product:
+                            products.append(product)
         except Exception as e:
             logger.error(f"Error parseando dataLayer: {e}")
+    return products
 
-    # --- ESTRATEGIA 2: JSON-LD (Fallback o suplemento) ---
-    # Si dataLayer falló o queremos asegurar, buscamos JSON-LD
-    # Pero priorizamos dataLayer porque tiene sale_price
-    
+def extract_json_ld(html):
+    """Fallback: productos del JSON-LD estándar (ItemList)"""
+    products = []
+    json_ld_matches = re.findall(r'<script.*?type="application/ld\+json".*?>(.*?)</script>', html, re.DOTALL)
+    for script_content in json_ld_matches:
+        try:
+            data = json.loads(script_content)
+            if isinstance(data, list): items_list = data
+            else: items_list = [data]
+            
+            for item in items_list:
+                if item.get("mainEntity", {}).get("@type") == "ItemList":
+                        for element in item["mainEntity"].get("itemListElement", []):
+                            if element.get("@type") == "Product":
+                                products.append(element)
+                elif item.get("@type") == "ItemList":
+                        for element in item.get("itemListElement", []):
+                            if element.get("@type") == "Product":
+                                products.append(element)
+        except:
+            continue
+    return products
+
+def parse_officedepot_page(content, encoding='utf-8', mode=None, impressions=None):
+    """
+    Parsea una página de categoría (bytes) y retorna la lista de productos.
+    - mode 'fast': dataLayer a nivel de bytes; si falla, cae al modo 'soup'.
+    - mode 'soup': árbol BeautifulSoup para el dataLayer.
+    En ambos casos, si no hay dataLayer se usa el JSON-LD.
+    """
+    mode = mode or SEARCH_CONFIG["parse_mode"]
+    products = None
+    if mode == 'fast':
+        try:
+            products = extract_datalayer_fast(content, encoding, impressions=impressions)
+        except Exception as e:
+            logger.error(f"Error en extracción rápida del dataLayer: {e}")
+
+    html = None
+    if not products:
+        html = content.decode(encoding, errors='replace')
+        if mode == 'fast':
+            logger.info("⚠️ Modo rápido sin resultados, usando BeautifulSoup...")
+        products = extract_datalayer_soup(html)
+
+    # --- JSON-LD (Fallback) ---
+    # Priorizamos dataLayer porque tiene sale_price
     if not products:
         logger.info("⚠️ DataLayer no encontrado o vacío, intentando JSON-LD...")
-        json_ld_matches = re.findall(r'<script.*?type="application/ld\+json".*?>(.*?)</script>', response.text, re.DOTALL)
-        for script_content in json_ld_matches:
-            try:
-                data = json.loads(script_content)
-                if isinstance(data, list): items_list = data
-                else: items_list = [data]
-                
-                for item in items_list:
-                    if item.get("mainEntity", {}).get("@type") == "ItemList":
-                            for element in item["mainEntity"].get("itemListElement", []):
-                                if element.get("@type") == "Product":
-                                    products.append(element)
-                    elif item.get("@type") == "ItemList":
-                            for element in item.get("itemListElement", []):
-                                if element.get("@type") == "Product":
-                                    products.append(element)
-            except:
-                continue
-    
-    # Eliminar duplicados por SKU/URL si mezclamos estrategias (aunque aquí es if/else implícito)
-    # Dejamos tal cual por ahora
+        products = extract_json_ld(html)
+    return products
+
+def fetch_officedepot_products(url):
+    """
+    Obtiene productos del arreglo 'impressions' del dataLayer, que contiene
+    un listado más completo de productos y precios 'sale_price'.
+    Fallback: BeautifulSoup y luego JSON-LD standard (ver parse_officedepot_page).
+
+    Retorna (productos, página) o None si la página no cambió desde el último escaneo
+    (304 o misma huella del bloque 'impressions'), para saltar parseo y DB.
+    `página` es (url, response, huella) para http_client.remember_page, que se llama
+    solo después de guardar los productos (process_products); None si no hubo productos.
+    """
+    logger.info(f"Escaneando Office Depot: {url}")
+
+    response = http_client.conditional_get(url, headers=HEADERS)
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+
+    # Huella del bloque impressions (lo único que nos interesa de la página)
+    content = response.content
+    impressions = locate_impressions(content)
+    digest = http_client.fingerprint(impressions if impressions is not None else content)
+    if http_client.payload_unchanged(url, digest):
+        return None
+
+    start = time.perf_counter()
+    products = parse_officedepot_page(content, response.encoding or 'utf-8', impressions=impressions)
+    monitoring.record_parse('officedepot', len(products), time.perf_counter() - start)
     
     logger.info(f"✅ Total productos extraídos: {len(products)}")
-    return products
+    return products, ((url, response, digest) if products else None)
 
-def process_products(products):
+def process_products(products, pages=()):
     """
     Compara los productos encontrados con la base de datos para detectar bajadas de precio.
+    La reconciliación es en bloque (una consulta IN + un upsert), ver app.reconcile.
     Retorna una lista de alertas (deals).
     """
     alerts = []
-    session = SessionLocal()
-    
-    try:
-        seen_urls = set()
-        
-        for p in products:
-            try:
-                name = p.get("name")
-                url = p.get("url")
-                sku = p.get("sku")
-                image = p.get("image")
-                
-                # Obtener precio y ofertas
-                offers = p.get("offers", {})
-                price = float(offers.get("price", 0))
-                
-                if not url or price <= 0:
+    items = []
+
+    for p in products:
+        try:
+            name = p.get("name")
+            url = p.get("url")
+
+            # Obtener precio y ofertas
+            offers = p.get("offers", {})
+            price = float(offers.get("price", 0))
+
+            if not url or price <= 0:
+                continue
+
+            # Filtrado por keywords
+            if SEARCH_CONFIG["keywords_include"]:
+                if not any(k.lower() in name.lower() for k in SEARCH_CONFIG["keywords_include"]):
                     continue
-                
-                if url in seen_urls:
+            if SEARCH_CONFIG["keywords_exclude"]:
+                if any(k.lower() in name.lower() for k in SEARCH_CONFIG["keywords_exclude"]):
                     continue
-                seen_urls.add(url)
-
-                # Filtrado por keywords
-                if SEARCH_CONFIG["keywords_include"]:
-                    if not any(k.lower() in name.lower() for k in SEARCH_CONFIG["keywords_include"]):
-                        continue
-                if SEARCH_CONFIG["keywords_exclude"]:
-                    if any(k.lower() in name.lower() for k in SEARCH_CONFIG["keywords_exclude"]):
-                        continue
-
-                # Verificar DB
-                db_product = session.query(Product).filter(Product.url == url).first()
-                
-                if db_product:
-                    # Producto existe, comparar precio
-                    old_price = db_product.current_price
-                    
-                    # Detectar bajada
-                    if price < old_price:
-                        drop_amount = old_price - price
-                        drop_pct = (drop_amount / old_price) * 100
-                        
-                        if drop_pct >= SEARCH_CONFIG["min_price_drop_percent"] or drop_amount >= SEARCH_CONFIG["min_price_drop_amount"]:
-                            logger.info(f"📉 BAJADA DE PRECIO: {name} (${old_price} -> ${price})")
-                            alerts.append({
-                                "source": "officedepot",
-                                "title": name,
-                                "price": price,
-                                "old_price": old_price,
-                                "discount_pct": round(drop_pct, 1),
-                                "url": url,
-                                "image_url": image,
-                                "sku": sku
-                            })
-                    
-                    # Actualizar precio si cambió
-                    if abs(price - db_product.current_price) > 0.1:
-                        db_product.current_price = price
-                    
-                    db_product.last_checked = datetime.utcnow()
-                    
-                else:
-                    # Nuevo producto
-                    # logger.debug(f"Nuevo producto: {name} (${price})")
-                    new_product = Product(
-                        name=name,
-                        url=url,
-                        current_price=price,
-                        last_checked=datetime.utcnow()
-                    )
-                    session.add(new_product)
-            
-            except Exception as e:
-                # logger.error(f"Error procesando item: {e}")
-                continue
-        
+
+            items.append({
+                "name": name,
+                "url": url,
+                "sku": p.get("sku"),
+                "price": price,
+                "image": p.get("image")
+            })
+        except Exception as e:
+            # logger.error(f"Error procesando item: {e}")
+            continue
+
+    session = SessionLocal()
+    try:
+        alerts, new_count = reconcile_products(
+            session, items, "officedepot",
+            min_drop_pct=SEARCH_CONFIG["min_price_drop_percent"],
+            min_drop_amount=SEARCH_CONFIG["min_price_drop_amount"],
+        )
         session.commit()
-        
+        product_counts.record_new_products("officedepot", new_count)
+        # Solo con el commit hecho: si fallara, el siguiente escaneo debe volver a procesar la página
+        for page in pages:
+            http_client.remember_page(*page)
     except Exception as e:
         logger.error(f"Error general en process_products: {e}")
         session.rollback()
+        alerts = []
     finally:
         session.close()
 
@@ -260,11 +327,68 @@ def get_officedepot_deals():
     except:
         pass
 
+    if SEARCH_CONFIG["concurrent_fetch"]:
+        products, pages = fetch_all_concurrently(SEARCH_CONFIG["urls"])
+        if not products:
+            return []
+        # Un solo process_products para todas las páginas (una sola sesión/commit)
+        return process_products(products, pages)
+
     all_alerts = []
     for url in SEARCH_CONFIG["urls"]:
-        products = fetch_officedepot_products(url)
-        if products:
-            alerts = process_products(products)
+        fetched = fetch_officedepot_products(url)
+        if fetched and fetched[0]:
+            products, page = fetched
+            alerts = process_products(products, [page])
             all_alerts.extend(alerts)
             
     return all_alerts
+
+def fetch_all_concurrently(urls, max_per_host=None):
+    """
+    Descarga y parsea todas las páginas en paralelo sobre el pool keep-alive/HTTP2
+    compartido (app.http_client). La concurrencia se limita por host con un semáforo,
+    así que el escaneo tarda lo que la página más lenta y no la suma de todas.
+
+    Las páginas que fallan se registran y se omiten; si fallan TODAS se relanza
+    el primer error para que el monitor lo cuente como fallo del servicio.
+    Retorna (productos, páginas para remember_page).
+    """
+    max_per_host = max_per_host or SEARCH_CONFIG["max_concurrency_per_host"]
+    hosts = {urlparse(u).netloc for u in urls}
+    semaphores = {h: threading.BoundedSemaphore(max_per_host) for h in hosts}
+
+    def fetch_bounded(url):
+        with semaphores[urlparse(url).netloc]:
+            return fetch_officedepot_products(url)
+
+    start_time = datetime.now()
+    products = []
+    pages = []
+    errors = []
+    unchanged = 0
+
+    with ThreadPoolExecutor(max_workers=max_per_host * len(hosts)) as executor:
+        future_to_url = {executor.submit(fetch_bounded, url): url for url in urls}
+        for future in as_completed(future_to_url):
+            url = future_to_url[future]
+            try:
+                fetched = future.result()
+                if fetched is None:
+                    unchanged += 1
+                else:
+                    page_products, page = fetched
+                    products.extend(page_products)
+                    if page:
+                        pages.append(page)
+            except Exception as e:
+                logger.error(f"❌ Error descargando {url}: {e}")
+                errors.append(e)
+
+    if errors and len(errors) == len(urls):
+        raise errors[0]
+
+    elapsed = (datetime.now() - start_time).total_seconds()
+    logger.info(f"⚡ {len(urls) - len(errors)}/{len(urls)} páginas descargadas en {elapsed:.2f}s "
+                f"({unchanged} sin cambios) - {len(products)} productos")
+    return products, pages
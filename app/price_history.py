@@ -0,0 +1,175 @@
+import logging
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select, func
+from app.models import PriceObservation, PriceDrop, dialect_insert
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000  # Filas por INSERT
+
+DOWNSAMPLE_MODES = ("minmax", "lttb")
+
+
+def record_observations(session, observations):
+    """
+    Inserta en bloque observaciones de precio (append-only).
+    `observations` son dicts con: product_id, observed_at, price, source.
+    Una observación repetida (mismo producto e instante) se ignora.
+    El llamador es responsable del commit.
+    """
+    if not observations:
+        return 0
+    insert = dialect_insert(session)
+    for i in range(0, len(observations), CHUNK_SIZE):
+        stmt = insert(PriceObservation).values(observations[i:i + CHUNK_SIZE])
+        session.execute(stmt.on_conflict_do_nothing(index_elements=['product_id', 'observed_at']))
+    logger.debug(f"📈 {len(observations)} observaciones de precio registradas")
+    return len(observations)
+
+
+def record_drops(session, drops):
+    """
+    Inserta en bloque bajadas de precio detectadas.
+    `drops` son dicts con: product_id, source, old_price, new_price, discount_pct, detected_at.
+    El llamador es responsable del commit.
+    """
+    if not drops:
+        return 0
+    for i in range(0, len(drops), CHUNK_SIZE):
+        session.execute(PriceDrop.__table__.insert(), drops[i:i + CHUNK_SIZE])
+    return len(drops)
+
+
+def last_observations(session, product_id, limit=10):
+    """Últimas N observaciones de un producto (recorrido descendente del índice)"""
+    stmt = (
+        select(PriceObservation.observed_at, PriceObservation.price)
+        .where(PriceObservation.product_id == product_id)
+        .order_by(PriceObservation.observed_at.desc())
+        .limit(limit)
+    )
+    return session.execute(stmt).all()
+
+
+def window_stats(session, product_id, start, end):
+    """Mínimo, máximo, promedio y conteo del precio de un producto en [start, end)"""
+    stmt = (
+        select(
+            func.min(PriceObservation.price).label("min"),
+            func.max(PriceObservation.price).label("max"),
+            func.avg(PriceObservation.price).label("avg"),
+            func.count().label("count"),
+        )
+        .where(
+            PriceObservation.product_id == product_id,
+            PriceObservation.observed_at >= start,
+            PriceObservation.observed_at < end,
+        )
+    )
+    return session.execute(stmt).one()
+
+
+# ==================== SERIES PARA GRÁFICAS ====================
+# La consulta recorre el índice (product_id, observed_at) INCLUDE price (index-only scan)
+# y el reducido a `points` puntos se hace vectorizado con NumPy.
+
+def load_series(session, product_id, start, end):
+    """Arrays (segundos epoch UTC, precio) de las observaciones en [start, end), ordenadas"""
+    stmt = (
+        select(PriceObservation.observed_at, PriceObservation.price)
+        .where(
+            PriceObservation.product_id == product_id,
+            PriceObservation.observed_at >= start,
+            PriceObservation.observed_at < end,
+        )
+        .order_by(PriceObservation.observed_at)
+    )
+    rows = session.execute(stmt).all()
+    if not rows:
+        return np.empty(0), np.empty(0)
+    times, prices = zip(*rows)
+    ts = np.array(times, dtype="datetime64[us]").astype(np.int64) / 1e6
+    return ts, np.array(prices, dtype=float)
+
+
+def downsample_minmax(ts, prices, buckets):
+    """
+    Divide el rango en `buckets` intervalos iguales y devuelve por cada uno con datos:
+    (inicio, mínimo, máximo, último). Conserva picos y bajadas que un promedio escondería.
+    """
+    if len(ts) == 0:
+        return np.empty(0), np.empty(0), np.empty(0), np.empty(0)
+    t0, span = ts[0], ts[-1] - ts[0]
+    width = span / buckets if span > 0 else 1.0
+    idx = np.minimum(((ts - t0) / width).astype(np.int64), buckets - 1)
+
+    # ts está ordenado: cada bucket es un tramo contiguo
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(idx)) + 1))
+    ends = np.concatenate((starts[1:], [len(ts)]))
+    return (
+        t0 + idx[starts] * width,
+        np.minimum.reduceat(prices, starts),
+        np.maximum.reduceat(prices, starts),
+        prices[ends - 1],
+    )
+
+
+def downsample_lttb(ts, prices, points):
+    """Largest-Triangle-Three-Buckets: `points` puntos reales que preservan la forma visual"""
+    n = len(ts)
+    if points >= n or points < 3:
+        return ts, prices
+
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    # Límites de los points-2 buckets intermedios (el primero y el último punto van fijos)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Promedio del bucket siguiente (o el último punto) como tercer vértice
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_t, avg_p = ts[nlo:nhi].mean(), prices[nlo:nhi].mean()
+
+        area = np.abs(
+            (ts[a] - avg_t) * (prices[lo:hi] - prices[a])
+            - (ts[a] - ts[lo:hi]) * (avg_p - prices[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return ts[keep], prices[keep]
+
+
+def _iso(seconds):
+    return datetime.utcfromtimestamp(float(seconds)).isoformat()
+
+
+def price_history(session, product_id, start, end, points=300, mode="minmax"):
+    """
+    Serie de precios reducida a lo sumo a `points` puntos para gráficas.
+      - minmax: [{t, min, max, last}] por intervalo de tiempo (conserva picos)
+      - lttb:   [{t, price}] con observaciones reales (conserva la forma)
+    Si hay menos observaciones que `points` se devuelven todas sin reducir.
+    """
+    if mode not in DOWNSAMPLE_MODES:
+        raise ValueError(f"Modo inválido: {mode}")
+    ts, prices = load_series(session, product_id, start, end)
+    raw_count = len(ts)
+
+    if mode == "lttb":
+        ts, prices = downsample_lttb(ts, prices, points)
+        series = [{"t": _iso(t), "price": float(p)} for t, p in zip(ts, prices)]
+    else:
+        if raw_count > points:
+            ts, mins, maxs, lasts = downsample_minmax(ts, prices, points)
+        else:
+            mins = maxs = lasts = prices
+        series = [
+            {"t": _iso(t), "min": float(lo), "max": float(hi), "last": float(last)}
+            for t, lo, hi, last in zip(ts, mins, maxs, lasts)
+        ]
+    return {"raw_count": raw_count, "points": series}
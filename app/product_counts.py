@@ -0,0 +1,77 @@
+import os
+import logging
+from sqlalchemy import select, func, text
+from app.models import Product
+from app import redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONTEO DE PRODUCTOS ====================
+# Un SELECT count(*) recorre toda la tabla; /stats se consulta constantemente.
+#   - Conteo exacto: cacheado en Redis (COUNTS_CONFIG["exact_ttl"]).
+#   - Estimación: pg_class.reltuples (lo que mantiene ANALYZE/autovacuum), O(1).
+#   - Por fuente: hash en Redis que los scrapers incrementan al insertar productos nuevos.
+#     Si no existe se siembra con un GROUP BY (índice source, last_checked).
+COUNTS_CONFIG = {
+    "exact_ttl": int(os.getenv('STATS_EXACT_COUNT_TTL', 300)),
+    "by_source_ttl": int(os.getenv('STATS_SOURCE_COUNTS_TTL', 86400)),  # Re-siembra diaria para corregir deriva
+}
+
+EXACT_KEY = "stats:products:count"
+BY_SOURCE_KEY = "stats:products:by_source"
+
+redis_client = redis_pool.get_redis()
+
+# HINCRBY solo si el hash ya fue sembrado (si no, crearía un hash con una sola fuente)
+_incr_if_seeded = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return false
+""")
+
+
+def record_new_products(source, count):
+    """Lo llaman los scrapers tras insertar productos nuevos (no-op si el hash aún no se sembró)"""
+    if not count:
+        return
+    try:
+        _incr_if_seeded(keys=[BY_SOURCE_KEY], args=[source, count])
+    except Exception as e:
+        logger.debug(f"No se pudo actualizar el conteo de {source}: {e}")
+
+
+def source_counts(session):
+    counts = redis_client.hgetall(BY_SOURCE_KEY)
+    if counts:
+        return {k.decode('utf-8'): int(v) for k, v in counts.items()}
+
+    rows = session.execute(select(Product.source, func.count()).group_by(Product.source)).all()
+    counts = {(source or "unknown"): count for source, count in rows}
+    if counts:
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(BY_SOURCE_KEY, mapping=counts)
+        pipe.expire(BY_SOURCE_KEY, COUNTS_CONFIG["by_source_ttl"])
+        pipe.execute()
+    return counts
+
+
+def exact_count(session):
+    cached = redis_client.get(EXACT_KEY)
+    if cached is not None:
+        return int(cached)
+    count = session.query(func.count(Product.id)).scalar()
+    redis_client.set(EXACT_KEY, count, ex=COUNTS_CONFIG["exact_ttl"])
+    return count
+
+
+def estimated_count(session):
+    """Estimación de Postgres (reltuples). Sin estadísticas aún (-1) o en SQLite cae al conteo exacto."""
+    if session.get_bind().dialect.name == 'postgresql':
+        estimate = session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'products'::regclass")
+        ).scalar()
+        if estimate is not None and estimate >= 0:
+            return estimate
+    return exact_count(session)
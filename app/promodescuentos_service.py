@@ -1,8 +1,15 @@
 import json
-import re
 import logging
+import time
 from datetime import datetime
-import requests
+from app import http_client, monitoring
+
+# Backend JSON más rápido si está instalado (orjson), si no el estándar
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -25,10 +32,50 @@ FILTER_CONFIG = {
 # En Celery Beat se configura en celerybeat-schedule
 SCAN_FREQUENCY_SECONDS = 60  # 10 minutos
 
+THREAD_NORMALIZER = 'ThreadMainListItemNormalizer'
+VUE3_ATTR = "data-vue3='"
+
+def iter_thread_payloads(html):
+    """
+    Localiza solo los atributos data-vue3 que contienen el normalizador de threads,
+    sin decodificar el resto de componentes Vue de la página.
+    Genera el JSON crudo (str) de cada atributo.
+    """
+    pos = 0
+    while True:
+        idx = html.find(THREAD_NORMALIZER, pos)
+        if idx == -1:
+            return
+        start = html.rfind(VUE3_ATTR, 0, idx)
+        end = html.find("'", idx)
+        if end == -1:
+            return
+        # El marcador debe estar dentro del atributo (sin comilla de cierre entre medio)
+        if start != -1 and html.find("'", start + len(VUE3_ATTR), idx) == -1:
+            yield html[start + len(VUE3_ATTR):end]
+        pos = end + 1
+
+def extract_threads(payloads):
+    """Decodifica los payloads de threads y genera el dict 'thread' de cada uno"""
+    for payload in payloads:
+        try:
+            vue3_json = _json_loads(payload)
+        except ValueError:
+            # Ignorar si el contenido del atributo no es un JSON válido
+            logger.debug(f"No se pudo parsear un atributo data-vue3 a JSON: {payload[:100]}...")
+            continue
+        if vue3_json.get('name') == THREAD_NORMALIZER:
+            thread_data = vue3_json.get('props', {}).get('thread')
+            if thread_data:
+                yield thread_data
+
 def fetch_promodescuentos_deals(page=1):
     """
     Obtiene las ofertas de www.promodescuentos.com/nuevas
-    Retorna lista de ofertas parseadas
+    Retorna (generador de ofertas crudas, página), o None si la página no cambió
+    desde el último escaneo (304 o mismos bloques de threads).
+    `página` es (url, response, huella) para http_client.remember_page, que se llama
+    cuando las alertas ya quedaron encoladas (tasks); None si no hubo bloques de threads.
     """
     url = "https://www.promodescuentos.com/nuevas"
     logger.info(f"Conectando a PromoDescuentos (página {page})...")
@@ -38,51 +85,61 @@ def fetch_promodescuentos_deals(page=1):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
     }
     
-    response = requests.get(url, headers=headers, timeout=10)
+    response = http_client.conditional_get(url, headers=headers)
+    if response.status_code == 304:
+        return None
     response.raise_for_status()
     logger.debug(f"HTTP Status: {response.status_code}")
     
-    logger.debug("Buscando datos de ofertas en atributos data-vue3...")
-    
-    deals = []
-    # Expresión regular para encontrar el contenido de data-vue3
-    vue3_data_matches = re.findall(r"data-vue3='(.*?)'", response.text)
-    
-    for vue3_data_str in vue3_data_matches:
-        try:
-            # El contenido de data-vue3 es un JSON
-            vue3_json = json.loads(vue3_data_str)
-            
-            # Nos interesan los componentes que normalizan la data de cada 'thread'
-            if vue3_json.get('name') == 'ThreadMainListItemNormalizer':
-                thread_data = vue3_json.get('props', {}).get('thread')
-                if thread_data:
-                    deals.append(thread_data)
-        except json.JSONDecodeError:
-            # Ignorar si el contenido del atributo no es un JSON válido
-            logger.debug(f"No se pudo parsear un atributo data-vue3 a JSON: {vue3_data_str[:100]}...")
-            continue
-    
-    if deals:
-        logger.info(f"✅ Se extrajeron {len(deals)} ofertas crudas de PromoDescuentos")
+    logger.debug("Buscando datos de threads en atributos data-vue3...")
+    start = time.perf_counter()
+    payloads = list(iter_thread_payloads(response.text))
+    scan_time = time.perf_counter() - start
+
+    # Si los bloques de threads son idénticos al último escaneo no hay nada nuevo que parsear
+    digest = http_client.fingerprint("\n".join(payloads))
+    if http_client.payload_unchanged(url, digest):
+        return None
+
+    page_state = (url, response, digest) if payloads else None
+    return _stream_deals(payloads, scan_time), page_state
+
+def _stream_deals(payloads, scan_time=0.0):
+    """Genera las ofertas una a una; al agotarse registra el tiempo de parseo"""
+    count = 0
+    parse_time = scan_time
+    threads = extract_threads(payloads)
+    while True:
+        # Solo se mide la decodificación, no lo que haga el consumidor entre ofertas
+        start = time.perf_counter()
+        thread_data = next(threads, None)
+        parse_time += time.perf_counter() - start
+        if thread_data is None:
+            break
+        count += 1
+        yield thread_data
+    monitoring.record_parse('promodescuentos', count, parse_time)
+
+    if count:
+        logger.info(f"✅ Se extrajeron {count} ofertas crudas de PromoDescuentos")
     else:
         logger.warning("❌ No se encontraron ofertas con el nuevo método de extracción (data-vue3).")
 
-    return deals
-
 def filter_deals(deals_raw):
     """
-    Filtra ofertas según los parámetros definidos en FILTER_CONFIG
+    Filtra ofertas según los parámetros definidos en FILTER_CONFIG.
+    Acepta cualquier iterable (p.ej. el generador de fetch_promodescuentos_deals).
     """
-    logger.info(f"Filtrando {len(deals_raw)} ofertas crudas...")
     logger.debug(f"Filtros: min_discount={FILTER_CONFIG['min_discount']}%, "
                 f"price_range=[${FILTER_CONFIG['min_price']}, ${FILTER_CONFIG['max_price']}], "
                 f"min_temp={FILTER_CONFIG['min_temperature']}")
     
     filtered = []
     rejected_reasons = {"type": 0, "keywords": 0, "discount": 0, "price": 0, "temperature": 0}
+    total = 0
     
     for i, deal in enumerate(deals_raw):
+        total += 1
         title = deal.get('title', '').lower()
         price = deal.get('price')
         temperature = deal.get('temperature', 0)
@@ -128,7 +185,7 @@ def filter_deals(deals_raw):
         logger.debug(f"  ✅ [{i}] Aceptado ({int(discount)}%): {title[:50]}")
         filtered.append(deal)
     
-    logger.info(f"Resultado filtrado: {len(filtered)} ofertas válidas")
+    logger.info(f"Resultado filtrado: {len(filtered)} ofertas válidas de {total} crudas")
     logger.info(f"Rechazados por: type={rejected_reasons['type']}, "
                 f"keywords={rejected_reasons['keywords']}, "
                 f"discount={rejected_reasons['discount']}, "
@@ -220,23 +277,26 @@ def build_image_url(image_data):
 
 def get_promodescuentos_deals(page=1):
     """
-    Pipeline completo: obtiene, filtra y parsea ofertas
+    Pipeline completo: obtiene, filtra y parsea ofertas.
+    Retorna (ofertas, página) o None cuando la página no cambió; el llamador pasa
+    `página` a http_client.remember_page una vez encoladas las alertas.
     """
     logger.info(f"========== ESCANEO PROMODESCUENTOS INICIADO (página {page}) ==========")
     start_time = datetime.now()
     
     # 1. Obtener datos crudos
-    raw_deals = fetch_promodescuentos_deals(page)
-    if not raw_deals:
-        logger.warning("Pipeline abortado: 0 ofertas obtenidas")
-        return []
+    fetched = fetch_promodescuentos_deals(page)
+    if fetched is None:
+        logger.info("Pipeline omitido: la página no cambió desde el último escaneo")
+        return None
+    raw_deals, page_state = fetched
     
-    # 2. Filtrar
+    # 2. Filtrar (consume el generador de ofertas crudas)
     filtered_deals = filter_deals(raw_deals)
     
     if not filtered_deals:
         logger.warning("Pipeline abortado: 0 ofertas después del filtrado")
-        return []
+        return [], page_state
     
     # 3. Parsear
     final_deals = parse_promodescuentos_deals(filtered_deals)
@@ -244,4 +304,4 @@ def get_promodescuentos_deals(page=1):
     elapsed = (datetime.now() - start_time).total_seconds()
     logger.info(f"========== ESCANEO COMPLETADO EN {elapsed:.2f}s - {len(final_deals)} OFERTAS FINALES ==========")
     
-    return final_deals
+    return final_deals, page_state
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import logging
+from urllib.parse import urlparse
+from app import metrics, redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== LÍMITE DE PETICIONES POR DOMINIO ====================
+# Token bucket en Redis por host, compartido por todos los procesos de Celery (y el API).
+# Cada petición reserva un token con un script Lua atómico que usa el reloj de Redis;
+# si el bucket está en negativo la reserva se respeta y el llamador duerme lo necesario,
+# así las peticiones de varios workers quedan espaciadas a `rate` por segundo.
+# rate = peticiones/s sostenidas, burst = ráfaga máxima. None = sin límite.
+RATE_LIMIT_CONFIG = {
+    # Al reproducir un archivo HTTP (app/http_archive.py) no hay red que proteger
+    "enabled": os.getenv('HTTP_RATE_LIMIT', '1') == '1' and os.getenv('HTTP_ARCHIVE_MODE') != 'replay',
+    "default": {"rate": float(os.getenv('HTTP_RATE_DEFAULT', 5)), "burst": 10},
+    "hosts": {
+        "www.officedepot.com.mx": {"rate": 2, "burst": 4},
+        "www.walmart.com.mx": {"rate": 1, "burst": 2},
+        "www.promodescuentos.com": {"rate": 1, "burst": 2},
+        "listado.mercadolibre.com.mx": {"rate": 2, "burst": 4},
+        "articulo.mercadolibre.com.mx": {"rate": 20, "burst": 40},
+        "api.mercadolibre.com": {"rate": 10, "burst": 20},
+        "api.keepa.com": None,       # Limitado por su presupuesto de tokens
+        "api.telegram.org": None,    # El sender del outbox tiene su propio limitador por chat
+    },
+}
+
+
+def _parse_overrides(value):
+    """HTTP_RATE_LIMITS="www.walmart.com.mx=0.5:1,api.mercadolibre.com=20:40" (rate:burst, 'off' = sin límite)"""
+    for entry in filter(None, (e.strip() for e in value.split(","))):
+        host, _, spec = entry.partition("=")
+        if spec.strip() == "off":
+            RATE_LIMIT_CONFIG["hosts"][host.strip()] = None
+            continue
+        rate, _, burst = spec.partition(":")
+        RATE_LIMIT_CONFIG["hosts"][host.strip()] = {"rate": float(rate), "burst": float(burst or rate)}
+
+
+_parse_overrides(os.getenv('HTTP_RATE_LIMITS', ''))
+
+redis_client = redis_pool.get_redis()
+
+# Reserva un token; devuelve los segundos a esperar (como string: Lua trunca números a entero)
+_reserve = redis_client.register_script("""
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+""")
+
+
+def host_limit(host):
+    limits = RATE_LIMIT_CONFIG["hosts"]
+    return limits[host] if host in limits else RATE_LIMIT_CONFIG["default"]
+
+
+def _reserve_wait(host):
+    """Segundos que hay que esperar antes de enviar al host (0 si hay token o no hay límite)"""
+    if not RATE_LIMIT_CONFIG["enabled"]:
+        return 0.0
+    limit = host_limit(host)
+    if not limit:
+        return 0.0
+    try:
+        return float(_reserve(keys=[f"ratelimit:{host}"], args=[limit["rate"], limit["burst"]]))
+    except Exception as e:
+        # Sin Redis no se bloquea el scraping: se sigue sin límite compartido
+        logger.debug(f"Límite de {host} no disponible: {e}")
+        return 0.0
+
+
+def _observe(host, wait):
+    metrics.RATE_LIMIT_WAIT_SECONDS.labels(metrics.source_for_host(host)).observe(wait)
+    if wait > 1:
+        logger.debug(f"⏳ {host}: esperando {wait:.2f}s por el límite de peticiones")
+
+
+def acquire(url):
+    """Bloquea hasta que el host de la URL tenga turno. Retorna los segundos esperados."""
+    host = urlparse(url).netloc
+    wait = _reserve_wait(host)
+    _observe(host, wait)
+    if wait > 0:
+        time.sleep(wait)
+    return wait
+
+
+async def acquire_async(url):
+    """Versión async: el EVALSHA (cliente síncrono) corre en un hilo y la espera no bloquea el loop"""
+    host = urlparse(url).netloc
+    wait = await asyncio.to_thread(_reserve_wait, host)
+    _observe(host, wait)
+    if wait > 0:
+        await asyncio.sleep(wait)
+    return wait
@@ -0,0 +1,179 @@
+import time
+import logging
+from datetime import datetime
+from sqlalchemy import select, func
+from app.models import Product, dialect_insert
+from app.price_history import record_observations, record_drops
+from app import metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONFIGURACIÓN DE RECONCILIACIÓN ====================
+RECONCILE_CONFIG = {
+    "chunk_size": 1000,        # Filas por sentencia IN / INSERT (límite de parámetros del driver)
+    "min_price_change": 0.1,   # Cambios menores se consideran ruido y no se escriben
+}
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def load_existing(session, urls=(), skus=()):
+    """
+    Carga en una consulta IN (por bloque) todos los productos de la página,
+    buscando por URL y opcionalmente por SKU.
+    Retorna dos diccionarios: url -> fila y sku -> fila.
+    """
+    by_url, by_sku = {}, {}
+    columns = (Product.id, Product.url, Product.sku, Product.current_price)
+    size = RECONCILE_CONFIG["chunk_size"]
+
+    for chunk in _chunks(list(urls), size):
+        for row in session.execute(select(*columns).where(Product.url.in_(chunk))):
+            by_url[row.url] = row
+            if row.sku:
+                by_sku[row.sku] = row
+
+    for chunk in _chunks([s for s in skus if s and s not in by_sku], size):
+        for row in session.execute(select(*columns).where(Product.sku.in_(chunk))):
+            by_url[row.url] = row
+            by_sku[row.sku] = row
+
+    return by_url, by_sku
+
+
+def upsert_products(session, rows):
+    """
+    Escribe todos los cambios con INSERT ... ON CONFLICT (url) DO UPDATE.
+    No se sobreescribe el nombre, el SKU ni la fuente de un producto ya guardado.
+    Retorna un diccionario url -> id de producto (RETURNING).
+    """
+    ids = {}
+    if not rows:
+        return ids
+    insert = dialect_insert(session)
+    for chunk in _chunks(rows, RECONCILE_CONFIG["chunk_size"]):
+        stmt = insert(Product).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.url],
+            set_={
+                "current_price": stmt.excluded.current_price,
+                "last_checked": stmt.excluded.last_checked,
+                "sku": func.coalesce(Product.sku, stmt.excluded.sku),
+                "source": func.coalesce(Product.source, stmt.excluded.source),
+            },
+        ).returning(Product.id, Product.url)
+        for row in session.execute(stmt):
+            ids[row.url] = row.id
+    return ids
+
+
+def reconcile_products(session, items, source, min_drop_pct=None, min_drop_amount=None, match_sku=False, store_sku=False):
+    """
+    Reconciliación en bloque de una página (o escaneo completo) de productos:
+      1. Una consulta IN para cargar todo lo que ya existe.
+      2. Cálculo de bajadas de precio en memoria.
+      3. Un solo INSERT ... ON CONFLICT DO UPDATE con todos los cambios.
+      4. Un INSERT en bloque del precio observado en price_observations.
+
+    `items` son dicts con: name, url, sku, price, image.
+    Si `min_drop_pct`/`min_drop_amount` son None no se generan alertas.
+    El llamador es responsable del commit, y de sumar los productos nuevos a
+    product_counts solo después de que el commit tenga éxito.
+    Retorna (alertas, productos nuevos).
+    """
+    alerts = []
+
+    # Deduplicar por URL manteniendo el primero (ON CONFLICT no puede tocar la misma fila dos veces).
+    # Con match_sku también por SKU: dos URLs (permalinks) del mismo SKU nuevo serían dos
+    # INSERT y el segundo violaría la unicidad de products.sku; se quedan en una sola fila.
+    unique = {}
+    seen_skus = set()
+    for item in items:
+        if item["url"] in unique:
+            continue
+        sku = item.get("sku")
+        if match_sku and sku:
+            if sku in seen_skus:
+                continue
+            seen_skus.add(sku)
+        unique[item["url"]] = item
+    items = list(unique.values())
+    if not items:
+        return alerts, 0
+    start = time.perf_counter()
+
+    by_url, by_sku = load_existing(
+        session,
+        urls=[i["url"] for i in items],
+        skus=[i["sku"] for i in items] if match_sku else (),
+    )
+
+    now = datetime.utcnow()
+    rows = {}
+    observed = {}
+    drops = []
+    new_count = 0
+    for item in items:
+        name, url, sku, price = item["name"], item["url"], item.get("sku"), item["price"]
+        existing = by_url.get(url) or (by_sku.get(sku) if match_sku and sku else None)
+
+        if existing:
+            old_price = existing.current_price or 0
+            if price < old_price:
+                drop_amount = old_price - price
+                drop_pct = (drop_amount / old_price) * 100
+                if min_drop_pct is not None and (drop_pct >= min_drop_pct or drop_amount >= min_drop_amount):
+                    logger.info(f"📉 BAJADA DE PRECIO: {name} (${old_price} -> ${price})")
+                    alerts.append({
+                        "source": source,
+                        "title": name,
+                        "price": price,
+                        "old_price": old_price,
+                        "discount_pct": round(drop_pct, 1),
+                        "url": url,
+                        "image_url": item.get("image"),
+                        "sku": sku
+                    })
+                    drops.append({
+                        "product_id": existing.id,
+                        "source": source,
+                        "old_price": old_price,
+                        "new_price": price,
+                        "discount_pct": round(drop_pct, 1),
+                        "detected_at": now,
+                    })
+
+            new_price = price if abs(price - old_price) > RECONCILE_CONFIG["min_price_change"] else old_price
+            # La clave de conflicto es la URL guardada (puede diferir si se encontró por SKU)
+            key = existing.url
+        else:
+            new_price = price
+            key = url
+            new_count += 1
+
+        if key in rows:
+            continue
+        observed[key] = price
+        rows[key] = {
+            "name": name,
+            "url": key,
+            "sku": sku if store_sku else None,
+            "source": source,
+            "current_price": new_price,
+            "last_checked": now,
+        }
+
+    ids = upsert_products(session, list(rows.values()))
+    record_observations(session, [
+        {"product_id": product_id, "observed_at": now, "price": observed[url], "source": source}
+        for url, product_id in ids.items()
+    ])
+    record_drops(session, drops)
+    metrics.RECONCILE_SECONDS.labels(source).observe(time.perf_counter() - start)
+    metrics.DROPS.labels(source).inc(len(alerts))
+    logger.debug(f"Reconciliados {len(rows)} productos ({new_count} nuevos), {len(alerts)} alertas")
+    return alerts, new_count
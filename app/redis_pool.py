@@ -0,0 +1,93 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+import redis
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== CONEXIÓN A REDIS ====================
+# Un único pool acotado por proceso para todo el código de la app (cache de páginas,
+# dedup de alertas, outbox de Telegram, monitor, tokens de ML). El broker de Celery
+# se configura aparte (CELERY_BROKER_URL).
+# REDIS_URL permite apuntar todo a un Redis local para benchmarks/desarrollo.
+REDIS_CONFIG = {
+    "url": os.getenv('REDIS_URL', 'redis://redis:6379/1'),
+    "max_connections": int(os.getenv('REDIS_MAX_CONNECTIONS', 20)),
+    "pool_timeout": float(os.getenv('REDIS_POOL_TIMEOUT', 5)),          # Espera por una conexión libre
+    "socket_timeout": float(os.getenv('REDIS_SOCKET_TIMEOUT', 5)),
+    "socket_connect_timeout": float(os.getenv('REDIS_CONNECT_TIMEOUT', 3)),
+    "health_check_interval": int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+    "pipeline_chunk_size": 500,   # Comandos por ida a Redis en pipelined()
+}
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    BlockingConnectionPool: al llegar a max_connections espera (pool_timeout) en vez de
+    abrir más sockets. redis-py detecta el fork de Celery y recrea las conexiones en el hijo.
+    """
+    return redis.BlockingConnectionPool.from_url(
+        REDIS_CONFIG["url"],
+        max_connections=REDIS_CONFIG["max_connections"],
+        timeout=REDIS_CONFIG["pool_timeout"],
+        socket_timeout=REDIS_CONFIG["socket_timeout"],
+        socket_connect_timeout=REDIS_CONFIG["socket_connect_timeout"],
+        health_check_interval=REDIS_CONFIG["health_check_interval"],
+        retry_on_timeout=True,
+    )
+
+
+def get_redis():
+    """Cliente compartido (no conecta hasta el primer comando)"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis(connection_pool=get_pool())
+                logger.debug(f"🔌 Pool Redis: {REDIS_CONFIG['url'].split('@')[-1]} (máx {REDIS_CONFIG['max_connections']})")
+    return _client
+
+
+@contextmanager
+def pipeline(transaction=False):
+    """
+    with redis_pool.pipeline() as pipe:
+        pipe.incr(...); pipe.get(...)
+        results = pipe.execute()
+    """
+    pipe = get_redis().pipeline(transaction=transaction)
+    try:
+        yield pipe
+    finally:
+        pipe.reset()
+
+
+def pipelined(items, add_command, chunk_size=None):
+    """
+    Ejecuta `add_command(pipe, item)` para cada item en pipelines de `chunk_size`
+    comandos y retorna la lista concatenada de resultados (uno por comando encolado).
+    Para lotes grandes evita respuestas gigantes y bloquear Redis con un solo pipeline.
+    """
+    chunk_size = chunk_size or REDIS_CONFIG["pipeline_chunk_size"]
+    items = list(items)
+    results = []
+    for i in range(0, len(items), chunk_size):
+        with pipeline() as pipe:
+            for item in items[i:i + chunk_size]:
+                add_command(pipe, item)
+            results.extend(pipe.execute())
+    return results
+
+
+def ping():
+    """True si Redis responde (para /stats y healthchecks)"""
+    try:
+        return bool(get_redis().ping())
+    except redis.RedisError as e:
+        logger.warning(f"⚠️ Redis no responde: {e}")
+        return False
@@ -4,9 +4,11 @@ from app.promodescuentos_service import get_promodescuentos_deals
 from app.officedepot_service import get_officedepot_deals
 from app.walmart_service import get_walmart_deals
 from app.mercadolibre_service import update_tracked_products, search_products
-import requests
+from app import http_client, metrics, telegram_outbox
+from app.models import engine, ensure_observation_partitions
+from app.alert_dedup import claim_unseen, release_claims, price_drop_key
+from celery.signals import task_postrun, worker_process_shutdown
 import os
-import redis
 import logging
 from datetime import datetime
 
@@ -17,73 +19,64 @@ logger = logging.getLogger(__name__)
 from app.monitoring import Monitor
 monitor = Monitor()
 
-# Usamos Redis para no repetir alertas del mismo producto cada 10 min
-redis_client = redis.Redis(host='redis', port=6379, db=1)
+# Claves de deduplicación (Redis SET NX EX, ver app/alert_dedup.py) para no repetir alertas
+def keepa_key(deal):
+    return deal['asin']
+
+def promodesc_key(deal):
+    return deal['thread_id']
 
 def send_telegram_alert(deal):
-    token = os.getenv('TELEGRAM_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    
-    if not token or not chat_id:
-        logger.error("❌ Variables de entorno TELEGRAM_TOKEN o TELEGRAM_CHAT_ID no configuradas")
-        return False
-    
-    source = deal.get('source', 'keepa')
-    
-    # Formato diferente según la fuente
-    if source == 'promodescuentos':
-        msg = (
-            f"🔥 ¡OFERTA DETECTADA EN PROMODESCUENTOS! ({deal['discount_pct']}% OFF)\n\n"
-            f"📦 {deal['title']}\n"
-            f"💰 Precio: ${deal['price']}\n"
-            f"🌡️ Popularidad: {deal.get('temperature_level', 'N/A')}\n"
-            f"🔗 {deal.get('url', '')}"
-        )
-    elif source == 'officedepot':
-        msg = (
-            f"📉 ¡BAJADA DE PRECIO EN OFFICE DEPOT! ({deal['discount_pct']}% OFF)\n\n"
-            f"📦 {deal['title']}\n"
-            f"💰 Nuevo Precio: ${deal['price']}\n"
-            f"❌ Antes: ${deal['old_price']}\n"
-            f"🔗 {deal['url']}"
-        )
-    elif source == 'mercadolibre':
-        old_price_str = f"${deal['old_price']}" if deal.get('old_price') else "N/A"
-        original_price_str = f"${deal['original_price']}" if deal.get('original_price') else "N/A"
-        
-        msg = (
-            f"📉 ¡BAJADA DE PRECIO EN MERCADO LIBRE! ({deal['discount_pct']}% OFF)\n\n"
-            f"📦 {deal['title']}\n"
-            f"💰 Nuevo Precio: ${deal['price']}\n"
-            f"❌ Antes: {old_price_str} (Original: {original_price_str})\n"
-            f"🔗 {deal['url']}"
-        )
-    else:  # keepa
-        msg = (
-            f"🔥 ¡OFERTA REAL DETECTADA EN AMAZON! ({deal['discount_pct']}% OFF)\n\n"
-            f"📦 {deal['title']}\n"
-            f"💰 Precio Actual: ${deal['price']}\n"
-            f"📉 Promedio 90 días: ${deal.get('avg_90', deal.get('avg_price', 'N/A'))}\n"
-            f"🔗 {deal['url']}"
-        )
-    
-    try:
-        response = requests.post(
-            f"https://api.telegram.org/bot{token}/sendMessage",
-            json={"chat_id": chat_id, "text": msg},
-            timeout=5
-        )
-        if response.status_code == 200:
-            logger.info(f"✅ Alerta enviada a Telegram: {deal['title'][:50]}")
-            return True
-        else:
-            logger.error(f"❌ Error enviando alerta Telegram: {response.status_code}")
-            return False
-    except Exception as e:
-        logger.exception(f"❌ Excepción enviando alerta: {e}")
-        return False
+    """
+    Encola la alerta en el outbox de Telegram (ver app/telegram_outbox.py).
+    El envío real lo hace el sender dedicado; True significa que la alerta quedó guardada.
+    """
+    if telegram_outbox.enqueue_alert(deal):
+        logger.info(f"📨 Alerta encolada: {deal['title'][:50]}")
+        return True
+    return False
+
+def send_alerts(deals, source, key_fn):
+    """
+    Encola una alerta por deal (ya reclamados con claim_unseen).
+    Los que no se pudieron encolar se liberan para reintentar en la próxima ejecución.
+    """
+    failed = []
+    for deal in deals:
+        logger.info(f"  🔔 Alertando: {deal['discount_pct']}% OFF - {deal['title'][:50]}")
+        if not send_telegram_alert(deal):
+            failed.append(deal)
+    release_claims(failed, source, key_fn)
+    return len(deals) - len(failed)
+
+def send_telegram_digest(deals, source):
+    """
+    Para lotes de alertas de una misma fuente: se descartan las ya alertadas y el resto
+    se agrupa en un digest que el sender envía como pocos mensajes (ver DIGEST_CONFIG).
+    Retorna cuántas quedaron encoladas.
+    """
+    fresh = claim_unseen(deals, source, price_drop_key)
+    if len(fresh) < len(deals):
+        logger.info(f"✋ {len(deals) - len(fresh)} alertas de {source} ya enviadas por otra ejecución")
+    queued = telegram_outbox.enqueue_digest(fresh)
+    if fresh and not queued:
+        release_claims(fresh, source, price_drop_key)
+    if queued:
+        logger.info(f"🗞️ {queued} alertas agregadas al digest")
+    return queued
+
+@task_postrun.connect
+def report_http_stats(**kwargs):
+    """Al final de cada tarea, reporta reutilización de conexiones y tiempo TLS del proceso"""
+    http_client.log_stats()
+
+@worker_process_shutdown.connect
+def cleanup_process_metrics(pid=None, **kwargs):
+    """Prefork: al terminar un hijo se liberan sus archivos de métricas multiproceso"""
+    metrics.mark_process_dead(pid or os.getpid())
 
 @app.task
+@monitor.tracked('keepa')
 def scan_amazon_deals():
     logger.info("=" * 60)
     logger.info("▶️ TAREA INICIADA: scan_amazon_deals")
@@ -92,7 +85,11 @@ def scan_amazon_deals():
     
     try:
         deals = get_keepa_deals()
-        
+
+        if deals is None:
+            # Escaneo omitido por presupuesto de tokens: no cuenta como ejecución vacía
+            return
+
         if not deals:
             logger.warning("❌ No se encontraron ofertas en Keepa")
             monitor.record_no_deals('keepa')
@@ -107,28 +104,19 @@ def scan_amazon_deals():
 
         alerted_count = 0
         skipped_count = 0
+        candidates = []
         
         for deal in deals:
-            asin = deal['asin']
-            title = deal['title'][:50]
-            price = deal['price']
-            discount = deal['discount_pct']
-            
             # Filtro de precio mínimo
-            if price < 200:
-                logger.debug(f"  ⏭️ {asin}: Precio muy bajo (${price})")
+            if deal['price'] < 200:
+                logger.debug(f"  ⏭️ {deal['asin']}: Precio muy bajo (${deal['price']})")
                 skipped_count += 1
                 continue
+            candidates.append(deal)
 
-            cache_key = f"alerted:keepa:{asin}"
-            if not redis_client.get(cache_key):
-                logger.info(f"  🔔 Alertando: {discount}% OFF - {title}")
-                if send_telegram_alert(deal):
-                    redis_client.setex(cache_key, 86400, "1")
-                    alerted_count += 1
-            else:
-                logger.debug(f"  ✋ {asin}: Ya alertado recientemente")
-                skipped_count += 1
+        fresh = claim_unseen(candidates, 'keepa', keepa_key)
+        skipped_count += len(candidates) - len(fresh)
+        alerted_count = send_alerts(fresh, 'keepa', keepa_key)
         
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {alerted_count} alertas, {skipped_count} saltadas")
@@ -140,6 +128,7 @@ def scan_amazon_deals():
         logger.info("=" * 60)
 
 @app.task
+@monitor.tracked('promodescuentos')
 def scan_promodescuentos_deals():
     logger.info("=" * 60)
     logger.info("▶️ TAREA INICIADA: scan_promodescuentos_deals")
@@ -147,11 +136,19 @@ def scan_promodescuentos_deals():
     start_time = datetime.now()
     
     try:
-        deals = get_promodescuentos_deals(page=1)
-        
+        result = get_promodescuentos_deals(page=1)
+
+        if result is None:
+            # Página idéntica al último escaneo: no cuenta como ejecución vacía
+            logger.info("♻️ PromoDescuentos sin cambios desde el último escaneo")
+            return
+        deals, page_state = result
+
         if not deals:
             logger.warning("❌ No se encontraron ofertas en PromoDescuentos")
             monitor.record_no_deals('promodescuentos')
+            if page_state:
+                http_client.remember_page(*page_state)
             return
         
         monitor.record_found_deals('promodescuentos')
@@ -161,25 +158,13 @@ def scan_promodescuentos_deals():
         
         logger.info(f"📊 Procesando TOP {len(deals)} ofertas de PromoDescuentos...")
         
-        alerted_count = 0
-        skipped_count = 0
-        
-        for deal in deals:
-            thread_id = deal['thread_id']
-            title = deal['title'][:50]
-            discount = deal['discount_pct']
-            temp_level = deal.get('temperature_level', 'N/A')
-            
-            cache_key = f"alerted:promodesc:{thread_id}"
-            
-            if not redis_client.get(cache_key):
-                logger.info(f"  🔔 Alertando: {discount}% OFF [{temp_level}] - {title}")
-                if send_telegram_alert(deal):
-                    redis_client.setex(cache_key, 43200, "1")  # 12 horas
-                    alerted_count += 1
-            else:
-                logger.debug(f"  ✋ {thread_id}: Ya alertado recientemente")
-                skipped_count += 1
+        fresh = claim_unseen(deals, 'promodescuentos', promodesc_key)
+        skipped_count = len(deals) - len(fresh)
+        alerted_count = send_alerts(fresh, 'promodescuentos', promodesc_key)
+        # La huella solo se guarda con todas las alertas encoladas: si no, el próximo
+        # escaneo vuelve a procesar la página y reintenta las que quedaron liberadas
+        if page_state and alerted_count == len(fresh):
+            http_client.remember_page(*page_state)
         
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {alerted_count} alertas, {skipped_count} saltadas")
@@ -191,6 +176,7 @@ def scan_promodescuentos_deals():
         logger.info("=" * 60)
 
 @app.task
+@monitor.tracked('officedepot')
 def scan_officedepot_deals():
     logger.info("=" * 60)
     logger.info("▶️ TAREA INICIADA: scan_officedepot_deals")
@@ -209,26 +195,12 @@ def scan_officedepot_deals():
         
         logger.info(f"📊 Procesando {len(deals)} alertas de precio de Office Depot...")
         
-        alerted_count = 0
-        
-        for deal in deals:
-            try:
-                # Usar el SKU o URL como clave única para no alertar lo mismo repetidamente en corto tiempo
-                # Aunque para bajadas de precio, queremos saber cada vez que baja, pero quizás no cada 10 mins si no cambió más.
-                # La lógica de process_products ya filtra, solo devuelve si *acaba* de bajar.
-                # Sin embargo, si falla el envío a Telegram, querriamos reintentar? 
-                # Por ahora asumimos que process_products actualizó la DB, así que "ya bajó".
-                # Si enviamos alerta y falla, tal vez perdamos la notificación.
-                # Pero está bien.
-                
-                logger.info(f"  🔔 Alertando: {deal['title']}")
-                send_telegram_alert(deal)
-                alerted_count += 1
-            except Exception as e:
-                logger.error(f"Error enviando alerta individual: {e}")
+        # process_products ya filtra: solo devuelve lo que *acaba* de bajar.
+        # El outbox reintenta el envío si Telegram falla, así que la alerta no se pierde.
+        alerted_count = send_telegram_digest(deals, 'officedepot')
         
         elapsed = (datetime.now() - start_time).total_seconds()
-        logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {alerted_count} alertas enviadas")
+        logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {alerted_count} alertas encoladas")
         
     except Exception as e:
         logger.exception(f"❌ Error en scan_officedepot_deals: {e}")
@@ -237,6 +209,7 @@ def scan_officedepot_deals():
         logger.info("=" * 60)
 
 @app.task
+@monitor.tracked('walmart')
 def scan_walmart_deals():
     logger.info("=" * 60)
     logger.info("▶️ TAREA INICIADA: scan_walmart_deals")
@@ -244,19 +217,21 @@ def scan_walmart_deals():
     try:
         deals = get_walmart_deals()
         if deals:
+            monitor.record_found_deals('walmart')
             logger.info(f"Encontradas {len(deals)} ofertas en Walmart")
-            for deal in deals:
-                send_telegram_alert(deal)
+            send_telegram_digest(deals, 'walmart')
         else:
+            monitor.record_no_deals('walmart')
             logger.info("No se encontraron ofertas nuevas en Walmart")
     except Exception as e:
         logger.exception(f"❌ Error en scan_walmart_deals: {e}")
-        # monitor.record_failure('walmart', str(e)) # Uncomment when we add walmart to monitor
+        monitor.record_failure('walmart', str(e))
     finally:
         logger.info("=" * 60)
 
 
 @app.task
+@monitor.tracked('mercadolibre')
 def scan_mercadolibre_monitoring():
     logger.info("=" * 60)
     logger.info("▶️ TAREA INICIADA: scan_mercadolibre_monitoring")
@@ -283,11 +258,10 @@ def scan_mercadolibre_monitoring():
         monitor.record_found_deals('mercadolibre')
         logger.info(f"📊 Detectados {len(filtered_deals)} cambios de precio RELEVANTES (>{min_discount}%)")
         
-        for deal in filtered_deals:
-            send_telegram_alert(deal)
+        send_telegram_digest(filtered_deals, 'mercadolibre')
             
         elapsed = (datetime.now() - start_time).total_seconds()
-        logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {len(filtered_deals)} alertas enviadas")
+        logger.info(f"✅ Tarea completada en {elapsed:.2f}s - {len(filtered_deals)} alertas encoladas")
         
     except Exception as e:
         logger.exception(f"❌ Error en scan_mercadolibre_monitoring: {e}")
@@ -314,3 +288,18 @@ def scan_mercadolibre_discovery(keywords, sort_by='relevancia', free_shipping=Fa
         logger.info("=" * 60)
 
 
+@app.task
+def maintain_observation_partitions():
+    """
+    Crea por adelantado las particiones mensuales de price_observations (diaria, ver celery_app).
+    Así un mes nuevo nunca empieza escribiendo en la partición DEFAULT.
+    """
+    months_ahead = int(os.getenv('PRICE_PARTITIONS_AHEAD', 3))
+    try:
+        created = ensure_observation_partitions(engine, months_ahead=months_ahead)
+        if created:
+            logger.info(f"🗂️ Particiones de price_observations creadas: {', '.join(created)}")
+        return created
+    except Exception as e:
+        logger.exception(f"❌ Error creando particiones de price_observations: {e}")
+        raise
@@ -0,0 +1,505 @@
+import os
+import json
+import time
+import socket
+import logging
+import redis
+from app import http_client, metrics, redis_pool
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# ==================== OUTBOX DE TELEGRAM ====================
+# Las tareas de escaneo solo encolan (XADD en un stream de Redis); un proceso dedicado
+# (python -m app.telegram_outbox) drena la cola respetando los límites de Telegram.
+# Un mensaje solo se confirma (XACK) cuando Telegram respondió: si el sender muere,
+# los pendientes se reclaman al arrancar.
+OUTBOX_CONFIG = {
+    "stream": "telegram:outbox",
+    "dead_letter": "telegram:outbox:dead",
+    "group": "telegram-sender",
+    "consumer": os.getenv('TELEGRAM_SENDER_NAME', socket.gethostname()),
+    "maxlen": 10000,                                                      # Tope aproximado del stream
+    "per_chat_interval": float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', 1.0)),  # ~1 msg/s por chat
+    "global_rate": float(os.getenv('TELEGRAM_GLOBAL_RATE', 25)),              # msgs/s del bot (límite ~30)
+    "max_attempts": 5,           # Errores transitorios antes de mover a dead letter (429 no cuenta)
+    "retry_backoff": 2.0,        # Base (s) del backoff exponencial en errores transitorios
+    "block_ms": 5000,            # Espera de XREADGROUP sin mensajes (también cadencia de los digests)
+    "claim_idle_ms": 60000,      # Pendientes de un sender caído se reclaman tras este tiempo
+    "latency_samples": 500,      # Muestras de latencia para p50/p95
+}
+
+# Modo digest: las alertas en lote (p.ej. una categoría que cambió de precios) se acumulan
+# por chat y fuente durante `window` segundos y salen como pocos mensajes en vez de uno por deal.
+DIGEST_CONFIG = {
+    "enabled": os.getenv('TELEGRAM_DIGEST', '1') == '1',
+    "window": float(os.getenv('TELEGRAM_DIGEST_WINDOW', 60)),         # Segundos que se acumula un digest
+    "max_items": int(os.getenv('TELEGRAM_DIGEST_MAX_ITEMS', 15)),     # Deals por mensaje
+    "max_chars": 4000,                                                # Límite de Telegram: 4096
+}
+
+SOURCE_NAMES = {
+    "officedepot": "OFFICE DEPOT",
+    "walmart": "WALMART",
+    "mercadolibre": "MERCADO LIBRE",
+    "promodescuentos": "PROMODESCUENTOS",
+    "keepa": "AMAZON",
+}
+
+DIGEST_BUFFERS_KEY = "telegram:digest:buffers"
+STATS_KEY = "telegram:outbox:stats"
+LATENCY_KEY = "telegram:outbox:latency"
+
+redis_client = redis_pool.get_redis()
+
+
+def format_alert(deal):
+    """Texto del mensaje según la fuente del deal"""
+    source = deal.get('source', 'keepa')
+
+    if source == 'promodescuentos':
+        return (
+            f"🔥 ¡OFERTA DETECTADA EN PROMODESCUENTOS! ({deal['discount_pct']}% OFF)\n\n"
+            f"📦 {deal['title']}\n"
+            f"💰 Precio: ${deal['price']}\n"
+            f"🌡️ Popularidad: {deal.get('temperature_level', 'N/A')}\n"
+            f"🔗 {deal.get('url', '')}"
+        )
+    if source == 'officedepot':
+        return (
+            f"📉 ¡BAJADA DE PRECIO EN OFFICE DEPOT! ({deal['discount_pct']}% OFF)\n\n"
+            f"📦 {deal['title']}\n"
+            f"💰 Nuevo Precio: ${deal['price']}\n"
+            f"❌ Antes: ${deal['old_price']}\n"
+            f"🔗 {deal['url']}"
+        )
+    if source == 'mercadolibre':
+        old_price_str = f"${deal['old_price']}" if deal.get('old_price') else "N/A"
+        original_price_str = f"${deal['original_price']}" if deal.get('original_price') else "N/A"
+        return (
+            f"📉 ¡BAJADA DE PRECIO EN MERCADO LIBRE! ({deal['discount_pct']}% OFF)\n\n"
+            f"📦 {deal['title']}\n"
+            f"💰 Nuevo Precio: ${deal['price']}\n"
+            f"❌ Antes: {old_price_str} (Original: {original_price_str})\n"
+            f"🔗 {deal['url']}"
+        )
+    # keepa
+    return (
+        f"🔥 ¡OFERTA REAL DETECTADA EN AMAZON! ({deal['discount_pct']}% OFF)\n\n"
+        f"📦 {deal['title']}\n"
+        f"💰 Precio Actual: ${deal['price']}\n"
+        f"📉 Promedio 90 días: ${deal.get('avg_90', deal.get('avg_price', 'N/A'))}\n"
+        f"🔗 {deal['url']}"
+    )
+
+
+def _message_fields(chat_id, text, label="", parse_mode=None, source="system"):
+    fields = {
+        "chat_id": str(chat_id),
+        "text": text,
+        "label": label[:80],
+        "source": source,
+        "enqueued_at": f"{time.time():.3f}",
+        "attempts": "0",
+    }
+    if parse_mode:
+        fields["parse_mode"] = parse_mode
+    return fields
+
+
+def enqueue_message(chat_id, text, label="", parse_mode=None, source="system"):
+    """Encola un mensaje. Retorna True si quedó guardado en el stream."""
+    fields = _message_fields(chat_id, text, label, parse_mode, source)
+    try:
+        redis_client.xadd(OUTBOX_CONFIG["stream"], fields, maxlen=OUTBOX_CONFIG["maxlen"], approximate=True)
+        return True
+    except Exception as e:
+        logger.error(f"❌ No se pudo encolar mensaje de Telegram: {e}")
+        return False
+
+
+def enqueue_alert(deal, chat_id=None):
+    chat_id = chat_id or os.getenv('TELEGRAM_CHAT_ID')
+    if not chat_id:
+        logger.error("❌ Variable de entorno TELEGRAM_CHAT_ID no configurada")
+        return False
+    return enqueue_message(chat_id, format_alert(deal), label=deal.get('title', ''), source=deal.get('source', 'keepa'))
+
+
+def _digest_key(chat_id, source):
+    return f"telegram:digest:{chat_id}:{source}"
+
+
+def enqueue_digest(deals, chat_id=None):
+    """
+    Acumula deals para el digest de su fuente (una sola ida a Redis para todo el lote).
+    El sender lo convierte en mensajes al cerrar la ventana. Con el digest desactivado
+    cae a un mensaje por deal. Retorna cuántos deals quedaron guardados.
+    """
+    if not DIGEST_CONFIG["enabled"]:
+        return sum(1 for deal in deals if enqueue_alert(deal, chat_id))
+
+    chat_id = chat_id or os.getenv('TELEGRAM_CHAT_ID')
+    if not chat_id:
+        logger.error("❌ Variable de entorno TELEGRAM_CHAT_ID no configurada")
+        return 0
+    if not deals:
+        return 0
+
+    now = f"{time.time():.3f}"
+    pipe = redis_client.pipeline()
+    for deal in deals:
+        key = _digest_key(chat_id, deal.get('source', 'keepa'))
+        pipe.rpush(key, json.dumps(deal, ensure_ascii=False, default=str))
+        pipe.set(f"{key}:since", now, nx=True)
+        pipe.sadd(DIGEST_BUFFERS_KEY, key)
+    try:
+        pipe.execute()
+        return len(deals)
+    except Exception as e:
+        logger.error(f"❌ No se pudo encolar el digest de Telegram: {e}")
+        return 0
+
+
+def _digest_line(deal):
+    line = f"• {deal['title'][:90].strip()}\n   💰 ${deal['price']}"
+    if deal.get('old_price'):
+        line += f" (antes ${deal['old_price']}, -{deal.get('discount_pct', '?')}%)"
+    elif deal.get('discount_pct'):
+        line += f" (-{deal['discount_pct']}%)"
+    return line + f"\n   🔗 {deal.get('url', '')}"
+
+
+def format_digest(source, deals):
+    """Parte los deals en mensajes respetando el tope de items y de caracteres"""
+    name = SOURCE_NAMES.get(source, source.upper())
+    chunks, current, size = [], [], 0
+    for deal in deals:
+        line = _digest_line(deal)
+        if current and (len(current) >= DIGEST_CONFIG["max_items"] or size + len(line) > DIGEST_CONFIG["max_chars"]):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 2
+    if current:
+        chunks.append(current)
+
+    messages = []
+    for i, lines in enumerate(chunks, 1):
+        part = f" ({i}/{len(chunks)})" if len(chunks) > 1 else ""
+        header = f"📉 {len(lines)} BAJADAS DE PRECIO EN {name}{part}\n\n"
+        messages.append(header + "\n\n".join(lines))
+    return messages
+
+
+def _digest_messages(chat_id, source, deals):
+    if len(deals) == 1:
+        return [_message_fields(chat_id, format_alert(deals[0]), label=deals[0].get('title', ''), source=source)]
+    return [_message_fields(chat_id, text, label=f"digest {source}", source=source)
+            for text in format_digest(source, deals)]
+
+
+def _decode_buffer(raw):
+    """Deals del buffer y entradas que no se pudieron leer (JSON corrupto o no es un deal)"""
+    deals, corrupt = [], []
+    for item in raw:
+        try:
+            deal = json.loads(item)
+        except ValueError as e:
+            corrupt.append((item, e))
+            continue
+        if isinstance(deal, dict):
+            deals.append(deal)
+        else:
+            corrupt.append((item, TypeError(f"se esperaba un objeto, llegó {type(deal).__name__}")))
+    return deals, corrupt
+
+
+def _flush_digest(key):
+    """
+    Pasa un buffer al outbox: WATCH del buffer, lectura, y los XADD junto con el borrado
+    en un solo MULTI/EXEC. Si Redis falla no se pierde nada (el buffer sigue ahí) y si
+    llega un deal entre la lectura y el EXEC se reintenta con él incluido.
+    Las entradas corruptas van a dead letter en la misma transacción y el resto sale igual.
+    Retorna cuántos deals salieron.
+    """
+    _, _, chat_id, source = key.split(":", 3)
+    with redis_client.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                deals, corrupt = _decode_buffer(pipe.lrange(key, 0, -1))
+                pipe.multi()
+                for item, error in corrupt:
+                    pipe.xadd(OUTBOX_CONFIG["dead_letter"], {"digest": key, "payload": item, "error": str(error)[:500]},
+                              maxlen=1000, approximate=True)
+                for fields in (_digest_messages(chat_id, source, deals) if deals else ()):
+                    pipe.xadd(OUTBOX_CONFIG["stream"], fields, maxlen=OUTBOX_CONFIG["maxlen"], approximate=True)
+                pipe.delete(key, f"{key}:since")
+                pipe.srem(DIGEST_BUFFERS_KEY, key)
+                pipe.execute()
+                break
+            except redis.WatchError:
+                continue
+    if corrupt:
+        logger.error(f"❌ Digest de {source}: {len(corrupt)} entradas corruptas movidas a dead letter")
+    if deals:
+        logger.info(f"🗞️ Digest de {source}: {len(deals)} deals")
+    return len(deals)
+
+
+def flush_digests(force=False):
+    """Convierte en mensajes del outbox los digests cuya ventana ya cerró"""
+    flushed = 0
+    now = time.time()
+    for key in redis_client.smembers(DIGEST_BUFFERS_KEY):
+        key = key.decode('utf-8')
+        since = redis_client.get(f"{key}:since")
+        if not force and since is not None and now - float(since) < DIGEST_CONFIG["window"]:
+            continue
+        flushed += _flush_digest(key)
+    return flushed
+
+
+def _ensure_group():
+    try:
+        redis_client.xgroup_create(OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"], id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def _decode(fields):
+    return {k.decode('utf-8'): v.decode('utf-8') for k, v in fields.items()}
+
+
+class _RateLimiter:
+    """Espaciado mínimo entre envíos: global (todo el bot) y por chat"""
+
+    def __init__(self):
+        self.global_next = 0.0
+        self.chat_next = {}
+
+    def wait(self, chat_id):
+        ready_at = max(self.global_next, self.chat_next.get(chat_id, 0.0))
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def sent(self, chat_id):
+        now = time.monotonic()
+        self.global_next = now + 1.0 / OUTBOX_CONFIG["global_rate"]
+        self.chat_next[chat_id] = now + OUTBOX_CONFIG["per_chat_interval"]
+
+    def pause(self, chat_id, seconds):
+        until = time.monotonic() + seconds
+        self.global_next = max(self.global_next, until)
+        self.chat_next[chat_id] = max(self.chat_next.get(chat_id, 0.0), until)
+
+
+def _send(token, message):
+    payload = {"chat_id": message["chat_id"], "text": message["text"]}
+    if message.get("parse_mode"):
+        payload["parse_mode"] = message["parse_mode"]
+    return http_client.post(f"https://api.telegram.org/bot{token}/sendMessage", json=payload)
+
+
+def _retry_after(response):
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return float(response.headers.get("retry-after") or 1)
+
+
+def _finish(msg_id, message, outcome, started):
+    """ACK + borrado del stream y contadores/latencias del resultado"""
+    now = time.time()
+    pipe = redis_client.pipeline()
+    pipe.xack(OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"], msg_id)
+    pipe.xdel(OUTBOX_CONFIG["stream"], msg_id)
+    pipe.hincrby(STATS_KEY, outcome, 1)
+    if outcome == "sent":
+        latency = now - float(message["enqueued_at"])
+        pipe.lpush(LATENCY_KEY, f"{latency:.3f}")
+        pipe.ltrim(LATENCY_KEY, 0, OUTBOX_CONFIG["latency_samples"] - 1)
+        pipe.hset(STATS_KEY, mapping={"last_sent_at": f"{now:.0f}", "last_send_ms": f"{(now - started) * 1000:.0f}"})
+    else:
+        pipe.xadd(OUTBOX_CONFIG["dead_letter"], message, maxlen=1000, approximate=True)
+    pipe.execute()
+
+
+def process_message(token, limiter, msg_id, message):
+    """
+    Envía un mensaje hasta lograrlo o agotar reintentos.
+    429: se respeta retry_after (no consume intento). 5xx/red: backoff exponencial.
+    Otros 4xx: el mensaje es inválido, va directo a dead letter.
+    """
+    attempts = int(message.get("attempts", 0))
+    while True:
+        limiter.wait(message["chat_id"])
+        started = time.time()
+        try:
+            response = _send(token, message)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, None
+            logger.warning(f"⚠️ Error de red enviando a Telegram: {e}")
+
+        if status == 200:
+            source = message.get("source", "system")
+            metrics.TELEGRAM_SEND_SECONDS.labels(source).observe(time.time() - started)
+            metrics.ALERTS_SENT.labels(source).inc()
+            limiter.sent(message["chat_id"])
+            _finish(msg_id, message, "sent", started)
+            logger.info(f"✅ Alerta enviada a Telegram: {message.get('label', '')[:50]}")
+            return True
+
+        if status == 429:
+            retry_after = _retry_after(response)
+            limiter.pause(message["chat_id"], retry_after)
+            redis_client.hincrby(STATS_KEY, "throttled", 1)
+            logger.warning(f"⏳ Telegram 429, reintentando en {retry_after:.1f}s")
+            continue
+
+        if status is not None and 400 <= status < 500:
+            logger.error(f"❌ Telegram rechazó el mensaje ({status}): {response.text[:200]}")
+            _finish(msg_id, message, "rejected", started)
+            return False
+
+        attempts += 1
+        message["attempts"] = str(attempts)
+        if attempts >= OUTBOX_CONFIG["max_attempts"]:
+            logger.error(f"❌ Mensaje descartado tras {attempts} intentos: {message.get('label', '')[:50]}")
+            _finish(msg_id, message, "failed", started)
+            return False
+        redis_client.hincrby(STATS_KEY, "retried", 1)
+        time.sleep(OUTBOX_CONFIG["retry_backoff"] ** attempts)
+
+
+def _dead_letter(msg_id, fields, error):
+    """Mensaje que no se pudo procesar (payload corrupto, error inesperado): a dead letter y XACK"""
+    entry = dict(fields)
+    entry["error"] = f"{type(error).__name__}: {error}"[:500]
+    pipe = redis_client.pipeline()
+    pipe.xadd(OUTBOX_CONFIG["dead_letter"], entry, maxlen=1000, approximate=True)
+    pipe.xack(OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"], msg_id)
+    pipe.xdel(OUTBOX_CONFIG["stream"], msg_id)
+    pipe.hincrby(STATS_KEY, "failed", 1)
+    pipe.execute()
+
+
+def _claim_stale():
+    """Mensajes entregados a un sender que murió sin confirmarlos"""
+    try:
+        _, messages, *_ = redis_client.xautoclaim(
+            OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"], OUTBOX_CONFIG["consumer"],
+            min_idle_time=OUTBOX_CONFIG["claim_idle_ms"], start_id="0-0", count=100,
+        )
+        return messages
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron reclamar pendientes: {e}")
+        return []
+
+
+def _read_own_pending():
+    # Pendientes de este mismo consumer (reinicio del proceso): id "0" relee su PEL
+    response = redis_client.xreadgroup(
+        OUTBOX_CONFIG["group"], OUTBOX_CONFIG["consumer"], {OUTBOX_CONFIG["stream"]: "0"}, count=100
+    )
+    return response[0][1] if response else []
+
+
+def run_sender():
+    """Bucle del sender dedicado"""
+    token = os.getenv('TELEGRAM_TOKEN')
+    if not token:
+        logger.error("❌ Variable de entorno TELEGRAM_TOKEN no configurada")
+        return
+
+    _ensure_group()
+    limiter = _RateLimiter()
+    logger.info(f"📨 Sender de Telegram iniciado ({OUTBOX_CONFIG['consumer']})")
+
+    backlog = _read_own_pending() + _claim_stale()
+    while True:
+        try:
+            flush_digests()
+            if not backlog:
+                response = redis_client.xreadgroup(
+                    OUTBOX_CONFIG["group"], OUTBOX_CONFIG["consumer"], {OUTBOX_CONFIG["stream"]: ">"},
+                    count=50, block=OUTBOX_CONFIG["block_ms"],
+                )
+                backlog = response[0][1] if response else _claim_stale()
+            for msg_id, fields in backlog:
+                if not fields:  # Entradas borradas del stream aparecen sin campos en el PEL
+                    redis_client.xack(OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"], msg_id)
+                    continue
+                try:
+                    process_message(token, limiter, msg_id, _decode(fields))
+                except redis.RedisError:
+                    raise
+                except Exception as e:
+                    # Un mensaje malo no puede tumbar el sender (la cola se acumularía sin nadie que la drene)
+                    logger.exception(f"❌ Mensaje {msg_id} movido a dead letter: {e}")
+                    _dead_letter(msg_id, fields, e)
+            backlog = []
+        except redis.ConnectionError as e:
+            logger.error(f"❌ Redis no disponible para el outbox: {e}")
+            time.sleep(5)
+        except redis.ResponseError as e:
+            # NOGROUP si alguien borró el stream: se recrea el grupo y se sigue
+            logger.warning(f"⚠️ Outbox: {e}")
+            _ensure_group()
+            backlog = []
+        except Exception as e:
+            # Cualquier otro fallo (p.ej. al armar digests): se registra y el bucle sigue;
+            # los mensajes sin ACK se reclaman en una vuelta posterior
+            logger.exception(f"❌ Error inesperado en el sender de Telegram: {e}")
+            backlog = []
+            time.sleep(1)
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def get_outbox_stats():
+    """Profundidad de la cola, pendientes sin confirmar, contadores y latencia encolado->enviado"""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.xlen(OUTBOX_CONFIG["stream"])
+        pipe.hgetall(STATS_KEY)
+        pipe.lrange(LATENCY_KEY, 0, -1)
+        pipe.scard(DIGEST_BUFFERS_KEY)
+        depth, counters, latencies, digest_buffers = pipe.execute()
+        try:
+            pending = redis_client.xpending(OUTBOX_CONFIG["stream"], OUTBOX_CONFIG["group"])["pending"]
+        except redis.ResponseError:
+            pending = 0  # El sender aún no creó el grupo
+    except Exception as e:
+        return {"error": str(e)}
+
+    latencies = [float(v) for v in latencies]
+    stats = {k.decode('utf-8'): int(v) for k, v in counters.items() if v.isdigit()}
+    return {
+        "queue_depth": depth,
+        "digest_buffers": digest_buffers,
+        "pending": pending,
+        "sent": stats.get("sent", 0),
+        "rejected": stats.get("rejected", 0),
+        "failed": stats.get("failed", 0),
+        "throttled": stats.get("throttled", 0),
+        "retried": stats.get("retried", 0),
+        "last_send_ms": stats.get("last_send_ms"),
+        "latency_p50": _percentile(latencies, 50),
+        "latency_p95": _percentile(latencies, 95),
+    }
+
+
+if __name__ == "__main__":
+    from app.logging_config import setup_logging
+    setup_logging()
+    run_sender()
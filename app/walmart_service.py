@@ -1,12 +1,11 @@
-import httpx
-import requests
 import json
 import logging
 import re
-from datetime import datetime
-from sqlalchemy.orm import Session
-from bs4 import BeautifulSoup
-from app.models import SessionLocal, Product
+import time
+from app.extraction import compile_spec, parse_html, extract_items
+from app.models import SessionLocal
+from app.reconcile import reconcile_products
+from app import http_client, monitoring, product_counts
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -26,9 +25,123 @@ SEARCH_CONFIG = {
     "min_price_drop_amount": 5000, 
 }
 
+# Spec declarativa de los tiles de producto, compilada a XPath una sola vez al importar.
+# Observado en dump: div[role="group"] o data-testid="product-tile-..."
+WALMART_TILE_SPEC = compile_spec({
+    "items": [
+        "//div[@role='group']",
+        "//div[starts-with(@data-testid, 'product-tile')]",
+    ],
+    "fields": {
+        "title": {"xpath": ".//span[@data-automation-id='product-title']", "text": ""},
+        "price": {"xpath": ".//div[@data-automation-id='product-price']", "text": " "},
+        "link": {"xpath": "(.//a)[1]", "attr": "href"},
+        "image": {"xpath": ".//img[@data-testid='productTileImage']", "attr": "src"},
+    },
+})
+
+def _parse_price(price_text):
+    # Limpieza de precio "$5,299.00" -> 5299.00 (primer grupo de números, puntos y comas)
+    price_digits = re.findall(r'[0-9,.]+', price_text or "")
+    if price_digits:
+        return float(price_digits[0].replace(',', ''))
+    return 0.0
+
+def _extract_next_data(tree):
+    """Estado de Next.js desde el script __NEXT_DATA__ o cualquier script inline que lo contenga"""
+    # Intento 1: ID explícito
+    for content in tree.xpath("//script[@id='__NEXT_DATA__']/text()"):
+        try:
+            return json.loads(content)
+        except: pass
+
+    # Intento 2: Buscar en todos los scripts
+    for content in tree.xpath("//script[not(@src)]/text()"):
+        if 'initialState' in content and 'pageProps' in content:
+            try:
+                possible_data = json.loads(content)
+                if 'props' in possible_data and 'pageProps' in possible_data:
+                    return possible_data
+            except: continue
+    return None
+
+def parse_walmart_page(content, encoding='utf-8'):
+    """
+    Parsea una página de categoría (bytes) con el motor de extracción lxml.
+    ESTRATEGIA 1: tiles HTML (spec WALMART_TILE_SPEC) - Prioridad
+    ESTRATEGIA 2: Fallback a JSON (__NEXT_DATA__)
+    """
+    products = []
+    tree = parse_html(content, encoding)
+
+    tiles = extract_items(tree, WALMART_TILE_SPEC)
+    if tiles:
+        logger.info(f"✅ Encontrados {len(tiles)} tiles de productos vía HTML.")
+    for tile in tiles:
+        try:
+            title = tile["title"]
+            if not title: continue
+            price_val = _parse_price(tile["price"] or "0")
+
+            link = tile["link"] or ""
+            if link and not link.startswith("http"):
+                link = "https://www.walmart.com.mx" + link
+
+            if price_val > 0:
+                products.append({
+                    "name": title,
+                    "url": link,
+                    "sku": link.split('/')[-1].split('?')[0] if link else "",
+                    "image": tile["image"] or "",
+                    "offers": {
+                        "price": price_val,
+                        "priceCurrency": "MXN"
+                    }
+                })
+        except Exception as e:
+            continue
+
+    if not products:
+        logger.info("⚠️ Parsing HTML retornó 0 productos. Intentando fallback scripts...")
+        data = _extract_next_data(tree)
+        if data:
+            try:
+                # Path común: props -> pageProps -> initialData -> searchResult -> itemStacks -> [0] -> items
+                initial_data = data.get('props', {}).get('pageProps', {}).get('initialData', {})
+                search_result = initial_data.get('searchResult', {})
+                item_stacks = search_result.get('itemStacks', [])
+                if item_stacks:
+                    items = item_stacks[0].get('items', [])
+                    for item in items:
+                        p_title = item.get('name', '')
+                        p_price = float(item.get('price', 0))
+                        canonical = item.get('canonicalUrl', '')
+                        p_url = f"https://www.walmart.com.mx{canonical}" if canonical else ""
+                        p_image = item.get('image', '')
+                        p_id = item.get('id', '')
+
+                        if p_title and p_price > 0:
+                            products.append({
+                               "name": p_title,
+                               "url": p_url,
+                               "sku": p_id,
+                               "image": p_image,
+                               "offers": {
+                                   "price": p_price,
+                                   "priceCurrency": "MXN"
+                               }
+                            })
+            except Exception as e:
+                logger.error(f"Error en JSON fallback: {e}")
+
+    return products
+
 def fetch_walmart_products(url):
     """
     Obtiene productos de Walmart MX mediante HTML parsing (prioridad) o script parsing (fallback).
+    Retorna (productos, página) o None si la página no cambió desde el último escaneo
+    (304 o misma huella). `página` es (url, response, huella) para http_client.remember_page,
+    que process_products llama tras el commit; None si no hubo productos.
     """
     logger.info(f"Escaneando Walmart: {url}")
     
@@ -49,130 +162,25 @@ def fetch_walmart_products(url):
     }
 
     products = []
-    
+    page = None
+
     try:
-        # Usar HTTPX con HTTP/2 para evadir bloqueos básicos
-        with httpx.Client(http2=True, timeout=30.0) as client:
-            response = client.get(url, headers=headers)
+        # Pool HTTP/2 compartido (ayuda a evadir bloqueos básicos y reutiliza la conexión)
+        response = http_client.conditional_get(url, headers=headers)
+        if response.status_code == 304:
+            return None
         
         response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # ---------------------------------------------------------
-        # ESTRATEGIA 1: Parsing HTML (Selectores CSS) - Prioridad
-        # ---------------------------------------------------------
-        # Buscamos contenedores de productos. 
-        # Observado en dump: div[role="group"] o data-testid="product-tile-..."
-        product_tiles = soup.find_all("div", role="group")
-        
-        if not product_tiles:
-            logger.info("ℹ️ No se encontraron items con role='group', intentando data-testid='product-tile'...")
-            product_tiles = soup.select("div[data-testid^='product-tile']")
-
-        if product_tiles:
-            logger.info(f"✅ Encontrados {len(product_tiles)} tiles de productos vía HTML.")
-            for tile in product_tiles:
-                try:
-                    # Título: span[data-automation-id="product-title"]
-                    title_tag = tile.select_one("span[data-automation-id='product-title']")
-                    if not title_tag: continue
-                    title = title_tag.get_text(strip=True)
-
-                    # Precio: div[data-automation-id="product-price"]
-                    price_tag = tile.select_one("div[data-automation-id='product-price']")
-                    price_text = price_tag.get_text(" ", strip=True) if price_tag else "0"
-                    
-                    # Limpieza de precio "$5,299.00" -> 5299.00
-                    # Extraemos números, puntos y comas
-                    price_digits = re.findall(r'[0-9,.]+', price_text)
-                    if price_digits:
-                        # Usamos el primer match
-                        price_val = float(price_digits[0].replace(',', ''))
-                    else:
-                        price_val = 0.0
-
-                    # Link: tag <a>
-                    link_tag = tile.find("a")
-                    link = link_tag['href'] if link_tag else ""
-                    if link and not link.startswith("http"):
-                        link = "https://www.walmart.com.mx" + link
 
-                    # Imagen: img[data-testid="productTileImage"]
-                    img_tag = tile.select_one("img[data-testid='productTileImage']")
-                    image_url = img_tag['src'] if img_tag else ""
+        # Huella del estado de la página (__NEXT_DATA__) o, si no existe, del HTML completo
+        next_data_block = re.search(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', response.text, re.DOTALL)
+        digest = http_client.fingerprint(next_data_block.group(1) if next_data_block else response.text)
+        if http_client.payload_unchanged(url, digest):
+            return None
 
-                    if title and price_val > 0:
-                        products.append({
-                            "name": title,
-                            "url": link,
-                            "sku": link.split('/')[-1].split('?')[0] if link else "",
-                            "image": image_url,
-                            "offers": {
-                                "price": price_val,
-                                "priceCurrency": "MXN"
-                            }
-                        })
-                except Exception as e:
-                    continue
-
-        # ---------------------------------------------------------
-        # ESTRATEGIA 2: Fallback a JSON Parsing (Scripts)
-        # ---------------------------------------------------------
-        if not products:
-             logger.info("⚠️ Parsing HTML retornó 0 productos. Intentando fallback scripts...")
-             
-             data = None
-             # Intento 1: ID explícito
-             next_data_script = soup.find("script", id="__NEXT_DATA__")
-             if next_data_script:
-                 try:
-                     data = json.loads(next_data_script.string)
-                 except: pass
-            
-             # Intento 2: Buscar en todos los scripts
-             if not data:
-                scripts = soup.find_all("script")
-                for script in scripts:
-                    if script.get("src"): continue
-                    content = script.string
-                    if content and 'initialState' in content and 'pageProps' in content:
-                        try:
-                            possible_data = json.loads(content)
-                            if 'props' in possible_data and 'pageProps' in possible_data:
-                                data = possible_data
-                                break
-                        except: continue
-
-             if data:
-                 try:
-                     # Path común: props -> pageProps -> initialData -> searchResult -> itemStacks -> [0] -> items
-                     initial_data = data.get('props', {}).get('pageProps', {}).get('initialData', {})
-                     search_result = initial_data.get('searchResult', {})
-                     item_stacks = search_result.get('itemStacks', [])
-                     if item_stacks:
-                         items = item_stacks[0].get('items', [])
-                         for item in items:
-                             p_title = item.get('name', '')
-                             p_price = float(item.get('price', 0))
-                             canonical = item.get('canonicalUrl', '')
-                             p_url = f"https://www.walmart.com.mx{canonical}" if canonical else ""
-                             p_image = item.get('image', '')
-                             p_id = item.get('id', '')
-
-                             if p_title and p_price > 0:
-                                 products.append({
-                                    "name": p_title,
-                                    "url": p_url,
-                                    "sku": p_id,
-                                    "image": p_image,
-                                    "offers": {
-                                        "price": p_price,
-                                        "priceCurrency": "MXN"
-                                    }
-                                 })
-                 except Exception as e:
-                     logger.error(f"Error en JSON fallback: {e}")
+        start = time.perf_counter()
+        products = parse_walmart_page(response.content, response.encoding or 'utf-8')
+        monitoring.record_parse('walmart', len(products), time.perf_counter() - start)
 
         # ---------------------------------------------------------
         # Verificamos Bloqueo REAL (Solo si no hay productos)
@@ -189,84 +197,61 @@ def fetch_walmart_products(url):
                 with open("failed_dump.html", "w", encoding="utf-8") as f:
                     f.write(response.text)
             except: pass
+        else:
+            page = (url, response, digest)
 
     except Exception as e:
         logger.error(f"Error general en fetch_walmart_products: {e}")
 
     logger.info(f"✅ Total productos válidos extraídos: {len(products)}")
-    return products
+    return products, page
 
-def process_products(products):
+def process_products(products, pages=()):
     """
     Compara los productos encontrados con la DB para detectar bajadas.
-    Reutiliza lógica similar a Office Depot.
+    Reutiliza la reconciliación en bloque de Office Depot (app.reconcile).
     """
     alerts = []
-    session = SessionLocal()
-    
-    try:
-        for p in products:
-            try:
-                name = p.get("name")
-                url = p.get("url")
-                sku = p.get("sku")
-                image = p.get("image")
-                
-                # Obtener precio
-                offers = p.get("offers", {})
-                price = float(offers.get("price", 0))
-                
-                if not url or price <= 0:
-                    continue
+    items = []
 
-                # Verificar DB
-                db_product = session.query(Product).filter(Product.url == url).first()
-                
-                if db_product:
-                    old_price = db_product.current_price
-                    
-                    # Detectar bajada
-                    if price < old_price:
-                        drop_amount = old_price - price
-                        drop_pct = (drop_amount / old_price) * 100
-                        
-                        if drop_pct >= SEARCH_CONFIG["min_price_drop_percent"] or drop_amount >= SEARCH_CONFIG["min_price_drop_amount"]:
-                            logger.info(f"📉 BAJADA DE PRECIO: {name} (${old_price} -> ${price})")
-                            alerts.append({
-                                "source": "walmart",
-                                "title": name,
-                                "price": price,
-                                "old_price": old_price,
-                                "discount_pct": round(drop_pct, 1),
-                                "url": url,
-                                "image_url": image,
-                                "sku": sku
-                            })
-                    
-                    # Actualizar precio
-                    if abs(price - db_product.current_price) > 0.1:
-                        db_product.current_price = price
-                    
-                    db_product.last_checked = datetime.utcnow()
-                    
-                else:
-                    # Nuevo producto
-                    new_product = Product(
-                        name=name,
-                        url=url,
-                        current_price=price,
-                        last_checked=datetime.utcnow()
-                    )
-                    session.add(new_product)
-            
-            except Exception as e:
-                logger.error(f"Error procesando item {p.get('name')}: {e}")
+    for p in products:
+        try:
+            url = p.get("url")
+
+            # Obtener precio
+            offers = p.get("offers", {})
+            price = float(offers.get("price", 0))
+
+            if not url or price <= 0:
                 continue
-        
+
+            items.append({
+                "name": p.get("name"),
+                "url": url,
+                "sku": p.get("sku"),
+                "price": price,
+                "image": p.get("image")
+            })
+        except Exception as e:
+            logger.error(f"Error procesando item {p.get('name')}: {e}")
+            continue
+
+    session = SessionLocal()
+    try:
+        alerts, new_count = reconcile_products(
+            session, items, "walmart",
+            min_drop_pct=SEARCH_CONFIG["min_price_drop_percent"],
+            min_drop_amount=SEARCH_CONFIG["min_price_drop_amount"],
+        )
         session.commit()
+        product_counts.record_new_products("walmart", new_count)
+        # Solo con el commit hecho: si fallara, el siguiente escaneo debe volver a procesar la página
+        for page in pages:
+            http_client.remember_page(*page)
     except Exception as e:
         logger.error(f"Error general en process_products: {e}")
         session.rollback()
+        alerts = []
     finally:
         session.close()
 
@@ -281,9 +266,10 @@ def get_walmart_deals():
 
     all_alerts = []
     for url in SEARCH_CONFIG["urls"]:
-        products = fetch_walmart_products(url)
-        if products:
-            alerts = process_products(products)
+        fetched = fetch_walmart_products(url)
+        if fetched and fetched[0]:
+            products, page = fetched
+            alerts = process_products(products, [page])
             all_alerts.extend(alerts)
             
     return all_alerts
@@ -0,0 +1,132 @@
+"""
+Benchmark del motor de extracción (app.extraction, XPath precompilado sobre lxml)
+contra la ruta anterior con BeautifulSoup('html.parser') y select_one/find por tile.
+
+Sitios: walmart (tiles de categoría), ml_search (listado), ml_item (página de artículo).
+
+Uso:
+    python benchmarks/bench_extraction.py
+    python benchmarks/bench_extraction.py --site walmart --pages dump1.html dump2.html
+    python benchmarks/bench_extraction.py --repeat 50
+"""
+import os
+import re
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from bs4 import BeautifulSoup
+from app.extraction import parse_html, extract_items, extract_fields
+from app.walmart_service import parse_walmart_page
+from app.mercadolibre_service import ML_SEARCH_SPEC, ML_ITEM_SPEC, parse_ml_price
+from benchmarks.fixtures import load_pages, walmart_page, ml_search_page, ml_item_page
+
+
+# ---------------- Rutas anteriores (BeautifulSoup) ----------------
+
+def legacy_walmart(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    tiles = soup.find_all("div", role="group") or soup.select("div[data-testid^='product-tile']")
+    products = []
+    for tile in tiles:
+        title_tag = tile.select_one("span[data-automation-id='product-title']")
+        if not title_tag: continue
+        price_tag = tile.select_one("div[data-automation-id='product-price']")
+        price_text = price_tag.get_text(" ", strip=True) if price_tag else "0"
+        digits = re.findall(r'[0-9,.]+', price_text)
+        price = float(digits[0].replace(',', '')) if digits else 0.0
+        link_tag = tile.find("a")
+        img_tag = tile.select_one("img[data-testid='productTileImage']")
+        products.append((title_tag.get_text(strip=True), price, link_tag['href'] if link_tag else "",
+                         img_tag['src'] if img_tag else ""))
+    return products
+
+
+def legacy_ml_search(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    items = soup.find_all('li', class_='ui-search-layout__item') or soup.find_all('div', class_='ui-search-result__wrapper')
+    products = []
+    for item in items:
+        link_tag = (item.find('a', class_='ui-search-link') or item.find('a', class_='ui-search-result__content')
+                    or item.find('a', href=True))
+        if not link_tag: continue
+        title_tag = item.find('h2', class_='ui-search-item__title')
+        price_tag = item.find('span', class_='andes-money-amount__fraction')
+        products.append((link_tag.get('href', ''), title_tag.get_text().strip() if title_tag else "Sin titulo",
+                         parse_ml_price(price_tag.get_text() if price_tag else None)))
+    return products
+
+
+def legacy_ml_item(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    price_meta = soup.find("meta", property="product:price:amount")
+    if price_meta and price_meta.get("content"):
+        return float(price_meta.get("content"))
+    container = soup.find("div", class_="ui-pdp-price__second-line")
+    fraction = container.find("span", class_="andes-money-amount__fraction") if container else None
+    return parse_ml_price(fraction.get_text()) if fraction else 0.0
+
+
+# ---------------- Rutas nuevas (motor de extracción) ----------------
+
+def engine_walmart(content):
+    return [(p["name"], p["offers"]["price"]) for p in parse_walmart_page(content)]
+
+
+def engine_ml_search(content):
+    return [(i["link"], i["title"], parse_ml_price(i["price"])) for i in extract_items(parse_html(content), ML_SEARCH_SPEC)]
+
+
+def engine_ml_item(content):
+    fields = extract_fields(parse_html(content), ML_ITEM_SPEC)
+    return float(fields["price_meta"]) if fields["price_meta"] else parse_ml_price(fields["price_ui"])
+
+
+SITES = {
+    "walmart": (walmart_page, legacy_walmart, engine_walmart),
+    "ml_search": (ml_search_page, legacy_ml_search, engine_ml_search),
+    "ml_item": (ml_item_page, legacy_ml_item, engine_ml_item),
+}
+
+
+def timeit(fn, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            fn(page)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--site", choices=list(SITES), action="append", help="Sitio a medir (por defecto todos)")
+    parser.add_argument("--pages", nargs="*", default=[], help="Páginas guardadas del sitio (requiere un solo --site)")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    sites = args.site or list(SITES)
+    if args.pages and len(sites) != 1:
+        parser.error("--pages requiere exactamente un --site")
+
+    print(f"{'sitio':>10} | {'soup ms/pág':>11} | {'lxml ms/pág':>11} | {'aceleración':>11}")
+    print("-" * 53)
+    for site in sites:
+        make_page, legacy, engine = SITES[site]
+        pages = load_pages(args.pages) if args.pages else [make_page()]
+        raw_pages = [p.encode('utf-8') for p in pages]
+        if isinstance(legacy(pages[0]), list):
+            assert len(legacy(pages[0])) == len(engine(raw_pages[0])), f"{site}: distinto número de resultados"
+        else:
+            assert legacy(pages[0]) == engine(raw_pages[0]), f"{site}: resultados distintos"
+        soup_time = timeit(legacy, pages, args.repeat)
+        lxml_time = timeit(engine, raw_pages, args.repeat)
+        print(f"{site:>10} | {soup_time * 1000:>11.3f} | {lxml_time * 1000:>11.3f} | {soup_time / lxml_time:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compara los dos modos de parseo de páginas de Office Depot:
+  - fast: arreglo 'impressions' localizado en los bytes de la respuesta, una sola pasada
+  - soup: árbol BeautifulSoup/lxml completo para encontrar el script del dataLayer
+Reporta tiempo por página y memoria pico (tracemalloc) de cada modo.
+
+Uso:
+    python benchmarks/bench_officedepot_parse.py                   # página sintética
+    python benchmarks/bench_officedepot_parse.py categoria1.html categoria2.html
+    python benchmarks/bench_officedepot_parse.py --products 96 --repeat 50
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app.officedepot_service import parse_officedepot_page
+from benchmarks.fixtures import load_pages, officedepot_page
+
+
+def measure(pages, mode, repeat):
+    # Tiempo (sin tracemalloc, que distorsiona los tiempos)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            parse_officedepot_page(page, mode=mode)
+    per_page = (time.perf_counter() - start) / (repeat * len(pages))
+
+    # Memoria pico de parsear una página
+    peak = 0
+    for page in pages:
+        tracemalloc.start()
+        parse_officedepot_page(page, mode=mode)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return per_page, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="Páginas de categoría guardadas (HTML)")
+    parser.add_argument("--products", type=int, default=48)
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    pages = load_pages(args.pages) if args.pages else [officedepot_page(args.products)]
+    pages = [p.encode('utf-8') for p in pages]
+
+    fast_count = sum(len(parse_officedepot_page(p, mode='fast')) for p in pages)
+    soup_count = sum(len(parse_officedepot_page(p, mode='soup')) for p in pages)
+    assert fast_count == soup_count, f"Resultados distintos: fast={fast_count} soup={soup_count}"
+
+    size_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"Páginas: {len(pages)} (~{size_kb:.0f} KB c/u), productos por página: {fast_count // len(pages)}")
+    print(f"{'modo':>6} | {'ms/página':>10} | {'memoria pico (KB)':>18}")
+    print("-" * 42)
+    results = {}
+    for mode in ('soup', 'fast'):
+        per_page, peak = measure(pages, mode, args.repeat)
+        results[mode] = per_page
+        print(f"{mode:>6} | {per_page * 1000:>10.3f} | {peak / 1024:>18.0f}")
+    print(f"Aceleración: {results['soup'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Benchmark de punta a punta por fuente: parseo -> reconciliación en la DB -> alertas,
+sobre páginas sintéticas (benchmarks/fixtures.py), sin red.
+
+Por etapa reporta llamadas, items, throughput, latencia p50/p99 por llamada, pico de
+memoria de Python de una llamada (tracemalloc) y pico de RSS del proceso. Cada fuente
+corre en un proceso nuevo para que el RSS de una no contamine a las demás.
+
+Los resultados se guardan en JSON para comparar entre commits:
+
+Uso:
+    python benchmarks/bench_pipeline.py                                   # todas las fuentes
+    python benchmarks/bench_pipeline.py --sources walmart officedepot --pages 20 --products 96
+    python benchmarks/bench_pipeline.py --output antes.json
+    python benchmarks/bench_pipeline.py --output despues.json --compare antes.json
+
+Base de datos: BENCH_DATABASE_URL (se recrean las tablas) o un SQLite temporal.
+Redis: BENCH_REDIS_URL (por defecto redis://localhost:6379/15). Si no responde, la etapa
+de alertas mide solo el formateo y la reconciliación omite los contadores de Redis.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+SOURCES = ("promodescuentos", "officedepot", "walmart", "mercadolibre", "keepa")
+
+
+# ---------------- Medición ----------------
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def _rss_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def measure(fn, inputs, repeat):
+    """
+    Corre fn(input) -> items procesados para cada input, `repeat` veces.
+    La memoria se mide aparte con una sola llamada (tracemalloc distorsiona los tiempos).
+    """
+    timings, items = [], 0
+    for _ in range(repeat):
+        for value in inputs:
+            start = time.perf_counter()
+            items += fn(value)
+            timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(inputs[0])
+    alloc_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = sum(timings)
+    return {
+        "calls": len(timings),
+        "items": items,
+        "items_per_sec": round(items / total, 1) if total else 0.0,
+        "p50_ms": round(_percentile(timings, 50) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 99) * 1000, 3),
+        "total_s": round(total, 4),
+        "alloc_peak_kb": int(alloc_peak / 1024),
+        "rss_peak_mb": _rss_mb(),
+    }
+
+
+# ---------------- Etapas por fuente ----------------
+# Cada fuente devuelve {etapa: resultado}. Las páginas de los fixtures repiten URLs,
+# así que para la reconciliación se distinguen los productos por número de página.
+
+def _scan_rounds(rounds, rnd):
+    """Variaciones de precio entre escaneos: ~10% baja fuerte, ~10% sube"""
+    factors = []
+    for _ in range(rounds):
+        r = rnd.random()
+        factors.append(0.4 if r < 0.1 else 1.05 if r < 0.2 else 1.0)
+    return factors
+
+
+def _reprice(products, page, factor, price_path):
+    repriced = []
+    for p in products:
+        p = json.loads(json.dumps(p))
+        p["url"] = f"{p['url']}?pagina={page}"
+        prices = p["offers"] if price_path == "offers" else p
+        prices["price"] = round(float(prices["price"]) * factor, 2)
+        repriced.append(p)
+    return repriced
+
+
+def _alert_stage(deals, source, redis_ok, repeat):
+    from app import alert_dedup, telegram_outbox
+
+    counter = {"n": 0}
+
+    def alert(batch):
+        for deal in batch:
+            telegram_outbox.format_alert(deal)
+        telegram_outbox.format_digest(source, batch)
+        if redis_ok:
+            # Fuente distinta por llamada: cada iteración reclama todas las claves de dedup
+            counter["n"] += 1
+            alert_dedup.claim_unseen(batch, f"bench-{source}-{counter['n']}", alert_dedup.price_drop_key, ttl=60)
+        return len(batch)
+
+    return measure(alert, [deals], repeat) if deals else None
+
+
+def _reconcile_stage(process, pages, price_path, args):
+    rnd = random.Random(7)
+    # Primer escaneo sin medir: siembra la DB
+    for k, products in enumerate(pages):
+        process(_reprice(products, k, 1.0, price_path))
+
+    inputs = []
+    for factor in _scan_rounds(args.repeat, rnd):
+        inputs.append([p for k, products in enumerate(pages) for p in _reprice(products, k, factor, price_path)])
+    alerts = []
+
+    def reconcile(products):
+        found = process(products)
+        alerts.extend(found or [])
+        return len(products)
+
+    return measure(reconcile, inputs, 1), alerts
+
+
+def bench_promodescuentos(args, redis_ok):
+    from app.promodescuentos_service import iter_thread_payloads, extract_threads, filter_deals, parse_promodescuentos_deals
+    from benchmarks.fixtures import promodescuentos_page
+
+    pages = [promodescuentos_page(args.products, seed=k) for k in range(args.pages)]
+    deals = []
+
+    def parse(html):
+        parsed = parse_promodescuentos_deals(filter_deals(extract_threads(iter_thread_payloads(html))))
+        deals.extend(parsed)
+        return args.products
+
+    results = {"parse": measure(parse, pages, args.repeat)}
+    results["alert"] = _alert_stage(deals[:args.products * args.pages], "promodescuentos", redis_ok, args.repeat)
+    return results
+
+
+def _bench_catalog(args, redis_ok, source, page_fn, parse_page, process_products):
+    pages = [page_fn(args.products, seed=k).encode("utf-8") for k in range(args.pages)]
+    parsed = []
+
+    def parse(content):
+        products = parse_page(content)
+        parsed.append(products)
+        return len(products)
+
+    results = {"parse": measure(parse, pages, args.repeat)}
+    results["reconcile"], alerts = _reconcile_stage(process_products, parsed[:args.pages], "offers", args)
+    results["alert"] = _alert_stage(alerts, source, redis_ok, args.repeat)
+    return results
+
+
+def bench_officedepot(args, redis_ok):
+    from app.officedepot_service import parse_officedepot_page, process_products
+    from benchmarks.fixtures import officedepot_page
+    return _bench_catalog(args, redis_ok, "officedepot", officedepot_page, parse_officedepot_page, process_products)
+
+
+def bench_walmart(args, redis_ok):
+    from app.walmart_service import parse_walmart_page, process_products
+    from benchmarks.fixtures import walmart_page
+    return _bench_catalog(args, redis_ok, "walmart", walmart_page, parse_walmart_page, process_products)
+
+
+def bench_mercadolibre(args, redis_ok):
+    import httpx
+    from app.models import SessionLocal
+    from app.extraction import parse_html, extract_items
+    from app.mercadolibre_service import ML_SEARCH_SPEC, parse_ml_price, parse_item_price
+    from app.reconcile import reconcile_products
+    from benchmarks.fixtures import ml_search_page, ml_item_page
+
+    search_pages = [ml_search_page(args.products, seed=k).encode("utf-8") for k in range(args.pages)]
+    item_pages = [httpx.Response(200, content=ml_item_page(price=1000 + k).encode("utf-8")) for k in range(args.products)]
+    parsed = []
+
+    def parse_search(content):
+        items = extract_items(parse_html(content, 'utf-8'), ML_SEARCH_SPEC)
+        parsed.append([{"name": i["title"], "url": i["link"], "sku": None, "price": parse_ml_price(i["price"])}
+                       for i in items])
+        return len(items)
+
+    def parse_item(response):
+        parse_item_price(response)
+        return 1
+
+    def process(items):
+        session = SessionLocal()
+        try:
+            alerts, _ = reconcile_products(session, items, "mercadolibre", min_drop_pct=30, min_drop_amount=1000)
+            session.commit()
+            return alerts
+        finally:
+            session.close()
+
+    results = {
+        "parse_search": measure(parse_search, search_pages, args.repeat),
+        "parse_item": measure(parse_item, item_pages, args.repeat),
+    }
+    results["reconcile"], alerts = _reconcile_stage(process, parsed[:args.pages], "price", args)
+    results["alert"] = _alert_stage(alerts, "mercadolibre", redis_ok, args.repeat)
+    return results
+
+
+def bench_keepa(args, redis_ok):
+    from app.keepa_service import parse_deals, store_price_history
+    from benchmarks.fixtures import keepa_deals
+
+    batches = [keepa_deals(args.products, seed=k) for k in range(args.pages)]
+    # Cada lote con ASINs propios para que la reconciliación escriba productos distintos
+    for k, batch in enumerate(batches):
+        for deal in batch:
+            deal["asin"] = f"{deal['asin']}{k}"
+    deals = []
+
+    def parse(batch):
+        deals.extend(parse_deals(batch, min_discount=50))
+        return len(batch)
+
+    def reconcile(batch):
+        store_price_history(batch)
+        return len(batch)
+
+    results = {
+        "parse": measure(parse, batches, args.repeat),
+        "reconcile": measure(reconcile, batches, args.repeat),
+    }
+    results["alert"] = _alert_stage(deals[:args.products * args.pages], "keepa", redis_ok, args.repeat)
+    return results
+
+
+# ---------------- Proceso por fuente ----------------
+
+def run_worker(args):
+    """Corre una fuente en este proceso e imprime su resultado como JSON"""
+    logging.disable(logging.CRITICAL)
+    from app import redis_pool
+    from app.models import Base, engine, init_db
+
+    Base.metadata.drop_all(engine)
+    init_db()
+    redis_ok = redis_pool.ping()
+
+    result = globals()[f"bench_{args.worker}"](args, redis_ok)
+    print(json.dumps({"source": args.worker, "redis": redis_ok, "stages": result}))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(report, baseline=None):
+    print(f"{'fuente':>16} | {'etapa':>12} | {'items/s':>10} | {'p50 ms':>9} | {'p99 ms':>9} | {'RSS MB':>7} | {'vs base':>8}")
+    print("-" * 90)
+    for source, data in report["results"].items():
+        for stage, stats in data["stages"].items():
+            if stats is None:
+                continue
+            delta = ""
+            base = (baseline or {}).get("results", {}).get(source, {}).get("stages", {}).get(stage)
+            if base and base["p50_ms"]:
+                delta = f"{(stats['p50_ms'] / base['p50_ms'] - 1) * 100:+.1f}%"
+            print(f"{source:>16} | {stage:>12} | {stats['items_per_sec']:>10.0f} | {stats['p50_ms']:>9.3f} | "
+                  f"{stats['p99_ms']:>9.3f} | {stats['rss_peak_mb']:>7.1f} | {delta:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=list(SOURCES))
+    parser.add_argument("--products", type=int, default=48, help="Productos (o threads/deals) por página")
+    parser.add_argument("--pages", type=int, default=5, help="Páginas por escaneo")
+    parser.add_argument("--repeat", type=int, default=20, help="Repeticiones por etapa")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar p50")
+    parser.add_argument("--worker", choices=SOURCES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args)
+
+    db_url = os.getenv('BENCH_DATABASE_URL') or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_pipeline.db')}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=db_url,
+        REDIS_URL=os.getenv('BENCH_REDIS_URL', 'redis://localhost:6379/15'),
+        HTTP_ARCHIVE_MODE="off",
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    report = {
+        "commit": _git_commit(),
+        "date": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": db_url.split(":", 1)[0],
+        "params": {"products": args.products, "pages": args.pages, "repeat": args.repeat},
+        "results": {},
+    }
+    for source in args.sources:
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", source, "--products", str(args.products),
+               "--pages", str(args.pages), "--repeat", str(args.repeat)]
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"❌ {source} falló:\n{proc.stderr[-2000:]}", file=sys.stderr)
+            continue
+        data = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["results"][source] = {"redis": data["redis"], "stages": data["stages"]}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparando contra {args.compare} (commit {baseline.get('commit')})")
+    _print_table(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark del extractor de PromoDescuentos: ruta anterior
+(findall de todos los data-vue3 + json.loads de cada uno) contra la ruta rápida
+(solo atributos de threads + backend JSON rápido + generador hacia filter_deals).
+
+Uso:
+    python benchmarks/bench_promodescuentos.py                     # página sintética
+    python benchmarks/bench_promodescuentos.py nuevas1.html nuevas2.html
+    python benchmarks/bench_promodescuentos.py --threads 30 --components 300 --repeat 200
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import promodescuentos_service
+from app.promodescuentos_service import iter_thread_payloads, extract_threads, filter_deals
+from benchmarks.fixtures import load_pages, promodescuentos_page
+
+
+def legacy_extract(html):
+    deals = []
+    for vue3_data_str in re.findall(r"data-vue3='(.*?)'", html):
+        try:
+            vue3_json = json.loads(vue3_data_str)
+            if vue3_json.get('name') == 'ThreadMainListItemNormalizer':
+                thread_data = vue3_json.get('props', {}).get('thread')
+                if thread_data:
+                    deals.append(thread_data)
+        except json.JSONDecodeError:
+            continue
+    return deals
+
+
+def fast_extract(html):
+    return extract_threads(iter_thread_payloads(html))
+
+
+def timeit(fn, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            filter_deals(fn(page))
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="Páginas /nuevas guardadas (HTML)")
+    parser.add_argument("--threads", type=int, default=30)
+    parser.add_argument("--components", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    pages = load_pages(args.pages) if args.pages else [promodescuentos_page(args.threads, args.components)]
+
+    legacy_count = sum(len(legacy_extract(p)) for p in pages)
+    fast_count = sum(len(list(fast_extract(p))) for p in pages)
+    assert legacy_count == fast_count, f"Resultados distintos: {legacy_count} vs {fast_count}"
+
+    json_backend = "orjson" if promodescuentos_service._json_loads is not json.loads else "json"
+    legacy = timeit(legacy_extract, pages, args.repeat)
+    fast = timeit(fast_extract, pages, args.repeat)
+
+    size_kb = sum(len(p) for p in pages) / len(pages) / 1024
+    print(f"Páginas: {len(pages)} (~{size_kb:.0f} KB c/u), threads por página: {legacy_count // len(pages)}")
+    print(f"Backend JSON rápido: {json_backend}")
+    print(f"{'ruta':>8} | {'ms/página':>10}")
+    print("-" * 23)
+    print(f"{'legacy':>8} | {legacy * 1000:>10.3f}")
+    print(f"{'rápida':>8} | {fast * 1000:>10.3f}")
+    print(f"Aceleración: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Servidor HTTP que imita a las tiendas para pruebas de carga sin tocar los sitios reales.
+Enruta por la cabecera Host, así que basta apuntar http_client hacia él:
+
+    HTTP_HOST_OVERRIDES="*=http://127.0.0.1:8800"
+
+Hosts imitados:
+    www.promodescuentos.com        /nuevas (threads data-vue3)
+    www.officedepot.com.mx         páginas de categoría (dataLayer impressions)
+    www.walmart.com.mx             páginas de categoría (tiles)
+    listado.mercadolibre.com.mx    listados de búsqueda
+    articulo.mercadolibre.com.mx   páginas de artículo /MLM-<id>-... con precio por artículo
+    api.keepa.com                  POST /deal con presupuesto de tokens
+    api.telegram.org               /bot<token>/sendMessage
+GET /__stats (cualquier host) devuelve los contadores por host y status.
+
+Uso:
+    python benchmarks/fake_retailer.py --port 8800
+    python benchmarks/fake_retailer.py --latency lognormal:150:0.6 --error-rate 0.01 --rate-limit 0.02
+    python benchmarks/fake_retailer.py --latency exp:80 --price-change-rate 0.05 --retry-after 2
+
+Latencias (ms): fixed:50 | uniform:20:200 | exp:80 (media) | lognormal:150:0.6 (mediana, sigma)
+"""
+import os
+import re
+import sys
+import math
+import time
+import zlib
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+from starlette.middleware.gzip import GZipMiddleware
+from benchmarks.fixtures import (
+    promodescuentos_page, officedepot_page, walmart_page, ml_search_page, ml_item_page, keepa_deals,
+)
+
+FAKE_CONFIG = {
+    "latency": "fixed:0",
+    "error_rate": 0.0,          # Fracción de respuestas 503
+    "rate_limit": 0.0,          # Fracción de respuestas 429
+    "retry_after": 1,           # Retry-After (s) de los 429
+    "price_change_rate": 0.0,   # Probabilidad de que una página/artículo cambie de precios en cada petición
+    "drop_share": 0.5,          # De los cambios, fracción que son bajadas (el resto subidas)
+    "keepa_tokens": 300,        # Presupuesto inicial de tokens de Keepa
+    "keepa_refill_per_min": 20,
+    "keepa_deal_cost": 5,
+    "seed": 1,
+}
+
+ITEM_ID = re.compile(r"MLM-?(\d+)")
+
+app = FastAPI()
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+_rnd = random.Random(FAKE_CONFIG["seed"])
+_stats = Counter()
+_generations = {}   # ruta -> generación (cambia los precios de la página)
+_item_prices = {}   # id de artículo ML -> precio actual
+_keepa = {"tokens": FAKE_CONFIG["keepa_tokens"], "updated": time.monotonic()}
+_sampler = None
+
+
+def initial_price(item_id):
+    """Precio inicial determinista de un artículo (para sembrar la DB con los mismos valores)"""
+    return float(1000 + (int(item_id) * 7919) % 50000)
+
+
+def make_sampler(spec):
+    """Convierte 'lognormal:150:0.6' en una función que devuelve segundos"""
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: params[0] / 1000
+    if kind == "uniform":
+        return lambda: _rnd.uniform(params[0], params[1]) / 1000
+    if kind == "exp":
+        return lambda: _rnd.expovariate(1 / params[0]) / 1000 if params[0] else 0.0
+    if kind == "lognormal":
+        return lambda: _rnd.lognormvariate(math.log(params[0]), params[1]) / 1000
+    raise ValueError(f"Distribución de latencia desconocida: {spec}")
+
+
+def _changed():
+    return _rnd.random() < FAKE_CONFIG["price_change_rate"]
+
+
+def _new_price(price):
+    if _rnd.random() < FAKE_CONFIG["drop_share"]:
+        return round(price * _rnd.uniform(0.4, 0.9), 0)
+    return round(price * _rnd.uniform(1.01, 1.2), 0)
+
+
+def _page_seed(key):
+    """Semilla estable por ruta; con price_change_rate la página pasa a otra generación (otros precios)"""
+    if _changed():
+        _generations[key] = _generations.get(key, 0) + 1
+    return zlib.crc32(key.encode("utf-8")) + _generations.get(key, 0)
+
+
+def _keepa_tokens():
+    now = time.monotonic()
+    refill = (now - _keepa["updated"]) / 60 * FAKE_CONFIG["keepa_refill_per_min"]
+    _keepa["tokens"] = min(FAKE_CONFIG["keepa_tokens"], _keepa["tokens"] + refill)
+    _keepa["updated"] = now
+    return _keepa["tokens"]
+
+
+def _route(host, path, key):
+    if host == "www.promodescuentos.com":
+        return HTMLResponse(promodescuentos_page(seed=_page_seed(key)))
+    if host == "www.officedepot.com.mx":
+        return HTMLResponse(officedepot_page(seed=_page_seed(key)))
+    if host == "www.walmart.com.mx":
+        return HTMLResponse(walmart_page(seed=_page_seed(key)))
+    if host == "listado.mercadolibre.com.mx":
+        return HTMLResponse(ml_search_page(seed=_page_seed(key)))
+    if host == "articulo.mercadolibre.com.mx":
+        match = ITEM_ID.search(path)
+        if not match:
+            return HTMLResponse("<html><body>No encontrado</body></html>", status_code=404)
+        item_id = match.group(1)
+        price = _item_prices.get(item_id) or initial_price(item_id)
+        if _changed():
+            price = _new_price(price)
+        _item_prices[item_id] = price
+        return HTMLResponse(ml_item_page(price=int(price)))
+    if host == "api.keepa.com" and path == "/deal":
+        tokens = _keepa_tokens()
+        refill_in = int(60000 / FAKE_CONFIG["keepa_refill_per_min"])
+        if tokens < FAKE_CONFIG["keepa_deal_cost"]:
+            return JSONResponse({"error": {"type": "tokens", "message": "Not enough tokens"},
+                                 "tokensLeft": int(tokens), "refillIn": refill_in}, status_code=429)
+        _keepa["tokens"] -= FAKE_CONFIG["keepa_deal_cost"]
+        return JSONResponse({
+            "deals": {"dr": keepa_deals(seed=_page_seed(key))},
+            "tokensLeft": int(_keepa["tokens"]),
+            "tokensConsumed": FAKE_CONFIG["keepa_deal_cost"],
+            "refillIn": refill_in,
+            "refillRate": FAKE_CONFIG["keepa_refill_per_min"],
+        })
+    if host == "api.telegram.org" and path.endswith("/sendMessage"):
+        return JSONResponse({"ok": True, "result": {"message_id": _stats["telegram"]}})
+    return JSONResponse({"detail": "Host o ruta no imitados"}, status_code=404)
+
+
+@app.get("/__stats")
+def read_stats():
+    return {"requests": dict(_stats), "keepa_tokens": int(_keepa_tokens()), "tracked_items": len(_item_prices)}
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def fake(path: str, request: Request):
+    host = request.headers.get("host", "").split(":")[0]
+    await asyncio.sleep(_sampler())
+
+    roll = _rnd.random()
+    if roll < FAKE_CONFIG["rate_limit"]:
+        response = Response(status_code=429, headers={"Retry-After": str(FAKE_CONFIG["retry_after"])})
+    elif roll < FAKE_CONFIG["rate_limit"] + FAKE_CONFIG["error_rate"]:
+        response = Response(status_code=503)
+    else:
+        # La key de Keepa va en la query: no debe cambiar la clave de la página
+        query = "" if host == "api.keepa.com" else request.url.query
+        response = _route(host, f"/{path}", f"{host}/{path}?{query}")
+
+    _stats[f"{host} {response.status_code}"] += 1
+    if host == "api.telegram.org":
+        _stats["telegram"] += 1
+    return response
+
+
+def configure(**overrides):
+    global _sampler
+    FAKE_CONFIG.update({k: v for k, v in overrides.items() if v is not None})
+    _rnd.seed(FAKE_CONFIG["seed"])
+    _keepa["tokens"] = FAKE_CONFIG["keepa_tokens"]
+    _sampler = make_sampler(FAKE_CONFIG["latency"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", default=FAKE_CONFIG["latency"])
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--rate-limit", type=float, help="Fracción de respuestas 429")
+    parser.add_argument("--retry-after", type=int)
+    parser.add_argument("--price-change-rate", type=float)
+    parser.add_argument("--drop-share", type=float)
+    parser.add_argument("--keepa-tokens", type=int)
+    parser.add_argument("--keepa-refill-per-min", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+    configure(
+        latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit,
+        retry_after=args.retry_after, price_change_rate=args.price_change_rate, drop_share=args.drop_share,
+        keepa_tokens=args.keepa_tokens, keepa_refill_per_min=args.keepa_refill_per_min, seed=args.seed,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+configure()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Páginas sintéticas para benchmarks, con la misma estructura que las reales
+en los puntos que leen los scrapers. Si tienes páginas reales guardadas,
+los benchmarks aceptan rutas de archivo en su lugar.
+"""
+import json
+import random
+
+
+def load_pages(paths):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+# ==================== PROMODESCUENTOS ====================
+
+def _promodescuentos_thread(rnd, i):
+    price = rnd.randint(100, 30000)
+    return {
+        "threadId": 900000 + i,
+        "title": f"Oferta de prueba número {i} con un título razonablemente largo",
+        "titleSlug": f"oferta-de-prueba-{i}",
+        "type": "Deal",
+        "price": price,
+        "nextBestPrice": int(price * rnd.uniform(1.0, 3.5)),
+        "priceDiscount": None,
+        "temperature": rnd.randint(0, 900),
+        "temperatureLevel": rnd.choice(["Hot1", "Hot2", "Hot3", ""]),
+        "merchantId": rnd.randint(1, 500),
+        "mainImage": {"path": f"threads/raw/{i}", "name": f"img_{i}"},
+        "shareableLink": f"https://www.promodescuentos.com/share/{i}",
+        "commentCount": rnd.randint(0, 200),
+        "user": {"username": f"usuario{i}", "avatar": {"path": "users", "name": f"u{i}"}},
+        "description": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 6,
+    }
+
+
+def _promodescuentos_component(rnd, i):
+    # Componentes Vue que no son threads (menús, widgets, comentarios...)
+    return {
+        "name": rnd.choice(["HeaderNavigation", "VoteBox", "CommentsPreview", "Sidebar", "Popover"]),
+        "props": {
+            "items": [{"id": j, "label": f"Elemento {j}", "href": f"/ruta/{j}"} for j in range(rnd.randint(5, 40))],
+            "config": {"enabled": True, "variant": i % 3},
+        },
+    }
+
+
+def promodescuentos_page(n_threads=30, n_components=150, seed=1):
+    """HTML de /nuevas con `n_threads` threads y `n_components` componentes data-vue3 ajenos"""
+    rnd = random.Random(seed)
+    blobs = []
+    for i in range(n_threads):
+        payload = {"name": "ThreadMainListItemNormalizer", "props": {"thread": _promodescuentos_thread(rnd, i)}}
+        blobs.append(payload)
+    for i in range(n_components):
+        blobs.append(_promodescuentos_component(rnd, i))
+    rnd.shuffle(blobs)
+
+    parts = ["<!DOCTYPE html><html><head><title>Nuevas</title></head><body>"]
+    for blob in blobs:
+        data = json.dumps(blob, ensure_ascii=False).replace("'", "&#039;")
+        parts.append(f"<div class=\"js-vue3\" data-vue3='{data}'><span>placeholder</span></div>\n")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+# ==================== OFFICE DEPOT ====================
+
+def officedepot_page(n_products=48, n_filler_scripts=40, seed=2):
+    """Página de categoría con el dataLayer 'impressions' y relleno de layout/scripts"""
+    rnd = random.Random(seed)
+    impressions = []
+    for i in range(n_products):
+        price = rnd.randint(300, 60000)
+        sale = price if rnd.random() < 0.6 else int(price * rnd.uniform(0.4, 0.95))
+        impressions.append(
+            "{'id': '%d', 'name': 'Producto Office Depot %d modelo XZ-%d', 'price': '%d.00', "
+            "'sale_price': '%d.00', 'brand': 'Marca%d', 'category': 'Computo', 'list': 'Category', "
+            "'position': %d}" % (100000 + i, i, i, price, sale, i % 7, i + 1)
+        )
+
+    parts = ["<!DOCTYPE html><html><head><title>Office Depot</title>"]
+    for i in range(n_filler_scripts):
+        parts.append(f"<script>var config{i} = {{'a': {i}, 'items': [{', '.join(str(j) for j in range(50))}]}};</script>")
+    parts.append("</head><body>")
+    parts.append(
+        "<script>window.dataLayer = window.dataLayer || []; dataLayer.push({'event': 'productImpressions', "
+        "'ecommerce': {'currencyCode': 'MXN', 'impressions': [" + ", ".join(impressions) + "]}});</script>"
+    )
+    for i in range(n_products):
+        parts.append(
+            f"<div class=\"product-item\"><a href=\"/officedepot/en/p/{100000 + i}\">"
+            f"<img src=\"/img/{i}.jpg\"/><span class=\"name\">Producto {i}</span>"
+            f"<span class=\"price\">$ {i}.00</span></a>" + "<div class=\"spacer\"></div>" * 20 + "</div>"
+        )
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+# ==================== WALMART ====================
+
+def walmart_page(n_products=40, seed=3):
+    """Página de categoría con tiles div[role=group] como los observados en el dump"""
+    rnd = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>Walmart</title>"
+             "<script id=\"__NEXT_DATA__\" type=\"application/json\">{\"props\": {\"pageProps\": {}}}</script>"
+             "</head><body><main>"]
+    for i in range(n_products):
+        price = rnd.randint(500, 45000)
+        parts.append(
+            f"<div role=\"group\" data-item-id=\"{i}\"><div class=\"tile-wrapper\">"
+            f"<a href=\"/ip/producto-walmart-{i}/{7500000000 + i}\" class=\"absolute\"><span class=\"w_iUH7\">Ver</span></a>"
+            f"<div class=\"image\"><img data-testid=\"productTileImage\" src=\"https://i5.walmartimages.com/{i}.jpg\" alt=\"p\"/></div>"
+            f"<span data-automation-id=\"product-title\" class=\"normal dark-gray\">Producto Walmart {i} "
+            f"<b>Modelo</b> {i % 13}</span>"
+            f"<div data-automation-id=\"product-price\" class=\"flex\"><span class=\"w_iUH7\">precio actual</span>"
+            f"<div class=\"mr1\">${price:,}.00</div><span class=\"gray\">${int(price * 1.2):,}.00</span></div>"
+            + "<div class=\"badge\"><span>Envío gratis</span></div>" * 5 +
+            "</div></div>"
+        )
+    parts.append("</main></body></html>")
+    return "".join(parts)
+
+
+# ==================== MERCADO LIBRE ====================
+
+def ml_search_page(n_products=50, seed=4):
+    """Listado de búsqueda con items li.ui-search-layout__item"""
+    rnd = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>Mercado Libre</title></head><body><ol class=\"ui-search-layout\">"]
+    for i in range(n_products):
+        price = rnd.randint(200, 60000)
+        parts.append(
+            f"<li class=\"ui-search-layout__item shops__layout-item\"><div class=\"ui-search-result__wrapper\">"
+            f"<a class=\"ui-search-link\" href=\"https://articulo.mercadolibre.com.mx/MLM-{2000000000 + i}-producto-{i}-_JM\">"
+            f"<h2 class=\"ui-search-item__title\">Producto Mercado Libre {i} con descripción</h2></a>"
+            f"<div class=\"ui-search-price__second-line\"><span class=\"andes-money-amount\">"
+            f"<span class=\"andes-money-amount__currency-symbol\">$</span>"
+            f"<span class=\"andes-money-amount__fraction\" aria-hidden=\"true\">{price:,}</span></span></div>"
+            + "<div class=\"ui-search-item__group\"><span>Envío gratis</span><span>Vendido por tienda</span></div>" * 4 +
+            "</div></li>"
+        )
+    parts.append("</ol></body></html>")
+    return "".join(parts)
+
+
+def ml_item_page(price=12999, filler=300):
+    """Página de un artículo con meta product:price:amount y el bloque de precio UI"""
+    parts = ["<!DOCTYPE html><html><head><title>Artículo</title>",
+             f"<meta property=\"product:price:amount\" content=\"{price}\"/>", "</head><body>"]
+    parts.append("<div class=\"ui-pdp-container\">" + "<div class=\"ui-pdp-row\"><span>Característica</span></div>" * filler)
+    parts.append(
+        f"<div class=\"ui-pdp-price__second-line\"><span class=\"andes-money-amount__fraction\">{price:,}</span></div>"
+    )
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+# ==================== KEEPA ====================
+
+def keepa_deals(n_deals=150, seed=5):
+    """Respuesta de /deal (dr): precios en centavos, current[0]/[7] y avg[0] = promedio de 90 días"""
+    rnd = random.Random(seed)
+    deals = []
+    for i in range(n_deals):
+        avg = rnd.randint(20000, 900000)
+        price = int(avg * rnd.uniform(0.15, 0.95))
+        current = [price if rnd.random() < 0.5 else -1] + [-1] * 6 + [price]
+        deals.append({
+            "asin": f"B0{i:08d}",
+            "title": f"Producto Amazon {i} con un título de longitud típica",
+            "current": current,
+            "avg": [[avg] * 8, [avg] * 8, [avg] * 8],
+            "image": f"{i:x}.jpg",
+            "categories": [rnd.randint(1, 9000) for _ in range(3)],
+        })
+    return deals
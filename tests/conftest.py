@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Las pruebas nunca tocan la DB ni el Redis del entorno: SQLite en memoria y un Redis inexistente
+os.environ['DATABASE_URL'] = "sqlite://"
+os.environ['REDIS_URL'] = "redis://127.0.0.1:1/0"
+os.environ['HTTP_ARCHIVE_MODE'] = "off"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def session():
+    from app.models import Base
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
@@ -0,0 +1,58 @@
+import json
+import base64
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from app import api, catalog
+from app.models import Product
+
+
+def _cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+@pytest.fixture
+def client(session):
+    session.add_all([Product(name=f"P{i}", url=f"https://x/{i}", current_price=i, source="walmart",
+                             last_checked=datetime(2026, 1, 1, 0, i)) for i in range(1, 6)])
+    session.commit()
+    api.app.dependency_overrides[api.get_db] = lambda: session
+    yield TestClient(api.app)
+    api.app.dependency_overrides.clear()
+
+
+def test_cursor_round_trip(session, client):
+    first = client.get("/products", params={"order": "last_checked", "limit": 2}).json()
+    second = client.get("/products", params={"order": "last_checked", "limit": 2, "after": first["next_cursor"]}).json()
+    assert [p["name"] for p in first["items"] + second["items"]] == ["P1", "P2", "P3", "P4"]
+
+
+@pytest.mark.parametrize("values", [
+    [{"id": 1}],            # dict donde va el id
+    [[1]],                  # lista
+    ["3"],                  # texto donde va un número
+    [True],
+    [1.5],
+    [1, 2],                 # más valores que columnas
+])
+def test_bad_id_cursor_is_400(client, values):
+    response = client.get("/products", params={"after": _cursor(values)})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor inválido"
+
+
+@pytest.mark.parametrize("after", [
+    _cursor([12345, 1]),            # número donde va la fecha
+    _cursor(["no es fecha", 1]),
+    _cursor(["2026-01-01T00:00:00", "1"]),
+    "%%%no-es-base64",
+])
+def test_bad_keyset_cursor_is_400(client, after):
+    response = client.get("/products", params={"order": "last_checked", "after": after})
+    assert response.status_code == 400
+
+
+def test_decode_cursor_converts_types():
+    columns = [catalog.PRODUCT_COLUMNS["last_checked"], catalog.PRODUCT_COLUMNS["id"]]
+    assert catalog.decode_cursor(_cursor(["2026-01-01T00:05:00", 7]), columns) == [datetime(2026, 1, 1, 0, 5), 7]
+    assert catalog.decode_cursor(_cursor([3.0]), [catalog.PRODUCT_COLUMNS["current_price"]]) == [3.0]
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app import api
+from app.models import Product, PriceObservation
+
+
+@pytest.fixture
+def client(session):
+    now = datetime.utcnow().replace(microsecond=0)
+    session.add(Product(id=1, name="P1", url="https://x/1", current_price=100, source="walmart"))
+    session.add_all([PriceObservation(product_id=1, observed_at=now - timedelta(hours=i), price=100 + i % 7,
+                                      source="walmart") for i in range(200)])
+    session.commit()
+    api.app.dependency_overrides[api.get_db] = lambda: session
+    yield TestClient(api.app)
+    api.app.dependency_overrides.clear()
+
+
+def test_default_window(client):
+    body = client.get("/products/1/history").json()
+    assert body["raw_count"] == 200
+    assert body["mode"] == "minmax"
+    end, start = datetime.fromisoformat(body["end"]), datetime.fromisoformat(body["start"])
+    assert end - start == timedelta(days=api.HISTORY_CONFIG["default_days"])
+
+
+def test_aware_start_is_converted_to_utc(client):
+    start = (datetime.utcnow() - timedelta(hours=10)).strftime("%Y-%m-%dT%H:%M:%S")
+    response = client.get("/products/1/history", params={"start": f"{start}Z"})
+    assert response.status_code == 200
+    assert response.json()["start"] == start
+    assert 9 <= response.json()["raw_count"] <= 11
+
+    # La misma hora expresada en -06:00
+    local = (datetime.fromisoformat(start) - timedelta(hours=6)).strftime("%Y-%m-%dT%H:%M:%S")
+    assert client.get("/products/1/history", params={"start": f"{local}-06:00"}).json()["start"] == start
+
+
+def test_end_before_start_is_400(client):
+    response = client.get("/products/1/history",
+                          params={"start": "2026-02-01T00:00:00Z", "end": "2026-01-01T00:00:00"})
+    assert response.status_code == 400
+
+
+def test_lttb_mode(client):
+    body = client.get("/products/1/history", params={"mode": "lttb", "points": 20}).json()
+    assert body["mode"] == "lttb"
+    assert len(body["points"]) == 20
+    assert set(body["points"][0]) == {"t", "price"}
+
+
+def test_unknown_mode_and_product(client):
+    assert client.get("/products/1/history", params={"mode": "avg"}).status_code == 400
+    assert client.get("/products/99/history").status_code == 404
@@ -0,0 +1,55 @@
+import gzip
+import json
+import httpx
+import pytest
+from app import http_archive
+
+TOKEN_RESPONSE = {"access_token": "APP_USR-secreto", "refresh_token": "TG-secreto", "token_type": "Bearer",
+                  "expires_in": 21600, "user_id": 123}
+
+
+@pytest.fixture
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(http_archive.ARCHIVE_CONFIG, "dir", str(tmp_path))
+    http_archive.reset_replay()
+    return tmp_path
+
+
+def _oauth_server(request):
+    return httpx.Response(200, headers={"content-type": "application/json", "content-encoding": "gzip"},
+                          content=gzip.compress(json.dumps(TOKEN_RESPONSE).encode("utf-8")))
+
+
+def _stored_bodies(path):
+    return [gzip.decompress(f.read_bytes()) for f in (path / "bodies").rglob("*.gz")]
+
+
+def test_oauth_tokens_are_not_archived(archive_dir):
+    transport = http_archive.RecordTransport(httpx.MockTransport(_oauth_server))
+    with httpx.Client(transport=transport) as client:
+        response = client.post("https://api.mercadolibre.com/oauth/token", data={"grant_type": "refresh_token"})
+
+    # El llamador recibe el token real; en disco solo queda redactado
+    assert response.json()["access_token"] == "APP_USR-secreto"
+    bodies = _stored_bodies(archive_dir)
+    assert len(bodies) == 1
+    assert b"secreto" not in bodies[0]
+    assert json.loads(bodies[0]) == dict(TOKEN_RESPONSE, access_token="***", refresh_token="***")
+
+    with httpx.Client(transport=http_archive.ReplayTransport()) as client:
+        replayed = client.post("https://api.mercadolibre.com/oauth/token", data={"grant_type": "refresh_token"})
+    assert replayed.json()["access_token"] == "***"
+    assert replayed.json()["user_id"] == 123
+
+
+def test_bodies_without_secrets_are_stored_verbatim(archive_dir):
+    raw = gzip.compress(b'{"results": [{"id": "MLM1", "price": 999}]}')
+
+    def server(request):
+        return httpx.Response(200, headers={"content-type": "application/json", "content-encoding": "gzip"},
+                              content=raw)
+
+    with httpx.Client(transport=http_archive.RecordTransport(httpx.MockTransport(server))) as client:
+        client.get("https://api.mercadolibre.com/items/MLM1")
+
+    assert _stored_bodies(archive_dir) == [raw]
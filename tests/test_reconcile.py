@@ -0,0 +1,54 @@
+from sqlalchemy import select
+from app.models import Product, PriceObservation
+from app.reconcile import reconcile_products
+
+
+def _item(url, sku, price, name="Producto"):
+    return {"name": name, "url": url, "sku": sku, "price": price}
+
+
+def test_same_new_sku_with_two_permalinks_is_one_product(session):
+    items = [
+        _item("https://articulo.mercadolibre.com.mx/MLM-1-a-_JM", "MLM1", 1000.0),
+        _item("https://articulo.mercadolibre.com.mx/MLM-1-b-_JM", "MLM1", 990.0),
+    ]
+    _, new_count = reconcile_products(session, items, "mercadolibre", match_sku=True, store_sku=True)
+    session.commit()
+
+    assert new_count == 1
+    products = session.execute(select(Product)).scalars().all()
+    assert [(p.url, p.sku, p.current_price) for p in products] == [
+        ("https://articulo.mercadolibre.com.mx/MLM-1-a-_JM", "MLM1", 1000.0),
+    ]
+    assert session.query(PriceObservation).count() == 1
+
+
+def test_new_permalink_of_stored_sku_updates_stored_row(session):
+    reconcile_products(session, [_item("https://ml.mx/MLM-2-a", "MLM2", 2000.0)], "mercadolibre",
+                       match_sku=True, store_sku=True)
+    session.commit()
+
+    items = [
+        _item("https://ml.mx/MLM-2-b", "MLM2", 1500.0),
+        _item("https://ml.mx/MLM-2-c", "MLM2", 1400.0),
+    ]
+    alerts, new_count = reconcile_products(session, items, "mercadolibre", min_drop_pct=10, min_drop_amount=100,
+                                           match_sku=True, store_sku=True)
+    session.commit()
+
+    products = session.execute(select(Product)).scalars().all()
+    assert [(p.url, p.current_price) for p in products] == [("https://ml.mx/MLM-2-a", 1500.0)]
+    assert [a["old_price"] for a in alerts] == [2000.0]
+    assert new_count == 0
+
+
+def test_without_match_sku_duplicates_are_only_by_url(session):
+    items = [
+        _item("https://www.walmart.com.mx/ip/1", None, 10.0),
+        _item("https://www.walmart.com.mx/ip/1", None, 9.0),
+        _item("https://www.walmart.com.mx/ip/2", None, 20.0),
+    ]
+    reconcile_products(session, items, "walmart")
+    session.commit()
+
+    assert session.query(Product).count() == 2
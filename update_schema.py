@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 from sqlalchemy import create_engine, text
 
@@ -10,6 +11,39 @@ logger = logging.getLogger(__name__)
 # Intentamos obtenerla del entorno, sino usamos la default que usa el proyecto
 DATABASE_URL = os.getenv('DATABASE_URL', 'postgresql://user:password@db:5432/pricedb')
 
+# Backfill de products.source: lotes pequeños por rango de id, cada uno en su propia
+# transacción (autocommit), para no bloquear la tabla mientras los workers escriben.
+BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', 5000))
+BACKFILL_PAUSE = float(os.getenv('BACKFILL_PAUSE', 0.05))  # Segundos entre lotes
+
+SOURCE_CASE = """
+    CASE
+        WHEN sku LIKE 'MLM%' OR url LIKE '%mercadolibre.com.mx%' THEN 'mercadolibre'
+        WHEN url LIKE '%officedepot.com.mx%' THEN 'officedepot'
+        WHEN url LIKE '%walmart.com.mx%' THEN 'walmart'
+        WHEN url LIKE '%amazon.com.mx%' THEN 'keepa'
+    END
+"""
+
+def backfill_source(connection):
+    bounds = connection.execute(text("SELECT min(id), max(id) FROM products WHERE source IS NULL")).one()
+    if bounds[0] is None:
+        logger.info("✅ Columna 'source' ya completa.")
+        return
+
+    low, high = bounds
+    total = 0
+    while low <= high:
+        result = connection.execute(
+            text(f"UPDATE products SET source = {SOURCE_CASE} "
+                 "WHERE id >= :low AND id < :high_exclusive AND source IS NULL"),
+            {"low": low, "high_exclusive": low + BACKFILL_BATCH_SIZE},
+        )
+        total += result.rowcount
+        low += BACKFILL_BATCH_SIZE
+        time.sleep(BACKFILL_PAUSE)
+    logger.info(f"✅ Backfill de 'source': {total} filas actualizadas.")
+
 def run_migration():
     logger.info(f"Conectando a la base de datos...")
     
@@ -40,6 +74,33 @@ def run_migration():
             except Exception as e:
                 logger.warning(f"⚠️ Aviso al agregar 'original_price' (puede que ya exista): {e}")
 
+            # 3. Agregar columna 'source' (nullable y sin default: no reescribe la tabla)
+            logger.info("Probando agregar columna 'source'...")
+            try:
+                connection.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS source VARCHAR;"))
+                logger.info("✅ Columna 'source' verificada/agregada.")
+            except Exception as e:
+                logger.warning(f"⚠️ Aviso al agregar 'source' (puede que ya exista): {e}")
+
+            # 4. Backfill por lotes a partir de SKU/URL
+            logger.info("Completando 'source' en productos existentes...")
+            try:
+                backfill_source(connection)
+            except Exception as e:
+                logger.warning(f"⚠️ Aviso en backfill de 'source': {e}")
+
+            # 5. Índice (source, last_checked) sin bloquear escrituras
+            logger.info("Creando índice 'ix_products_source_last_checked'...")
+            try:
+                connection.execute(text(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_source_last_checked "
+                    "ON products (source, last_checked);"
+                ))
+                logger.info("✅ Índice 'ix_products_source_last_checked' verificado/creado.")
+            except Exception as e:
+                # Un CONCURRENTLY interrumpido deja el índice INVALID: hay que borrarlo y reintentar
+                logger.warning(f"⚠️ Aviso al crear índice (si quedó INVALID, bórralo y reintenta): {e}")
+
     except Exception as e:
         logger.error(f"❌ Error crítico conectando o migrando: {e}")
         logger.info("💡 Asegúrate de que la base de datos esté corriendo y la URL sea correcta.")